@@ -0,0 +1,138 @@
+"""
+Latency of the client-side and server-side filtering modes of interactive_vis.
+
+For a few selection states, measures what one interaction costs in each mode:
+the Python time to filter, aggregate and build the specs (server-side mode
+only), the rows and JSON bytes sent to the browser, and, when vl-convert is
+installed, the time the Vega runtime takes to evaluate and render the specs.
+
+    python benchmarks/crossfilter.py [--repeat 3]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+APP_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "interactive_vis"
+)
+
+STATES = {
+    "default": {},
+    "month": {"month": ["June"]},
+    "month+vehicle+weather+borough": {
+        "month": ["June"],
+        "vehicle": ["Taxi"],
+        "weather": ["Rainy"],
+        "borough": ["Manhattan"],
+    },
+}
+
+
+def _rows(spec: dict) -> int:
+    return sum(len(values) for values in spec.get("datasets", {}).values())
+
+
+def _inline_maps(spec: Any, static_dir: str, static_url: str) -> Any:
+    # vl-convert can't resolve the app's static URLs outside of Streamlit, so
+    # the published topologies are sent in the spec instead
+    if isinstance(spec, list):
+        return [_inline_maps(item, static_dir, static_url) for item in spec]
+    if not isinstance(spec, dict):
+        return spec
+    url = spec.get("url")
+    if isinstance(url, str) and url.startswith(f"{static_url}/"):
+        with open(
+            os.path.join(static_dir, os.path.basename(url)), encoding="utf-8"
+        ) as file:
+            values = json.load(file)
+        return dict(
+            {key: value for key, value in spec.items() if key != "url"}, values=values
+        )
+    return {
+        key: _inline_maps(value, static_dir, static_url) for key, value in spec.items()
+    }
+
+
+def _render(app, specs: List[dict], repeat: int) -> float:
+    try:
+        import vl_convert as vlc
+    except ImportError:
+        return float("nan")
+    specs = [
+        _inline_maps(spec, app.geometry.STATIC_DIR, app.geometry.STATIC_URL)
+        for spec in specs
+    ]
+    # First render warms up the Vega runtime
+    for spec in specs:
+        vlc.vegalite_to_svg(spec)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for spec in specs:
+            vlc.vegalite_to_svg(spec)
+    return (time.perf_counter() - start) / repeat
+
+
+def client_side(app, selections: Dict[str, list], repeat: int) -> dict:
+    spec = app.client_side_spec()
+    spec["datasets"] = {
+        name: app.alt.utils.data.to_values(df)["values"]
+        for name, df in spec["datasets"].items()
+    }
+    # Put the dashboard in the given state through the selection initial values
+    fields = {field: param for param, field in app.crossfilter.PARAMS.items()}
+    for param in spec["params"]:
+        field = param.get("select", {}).get("fields", [None])[0]
+        values = selections.get(fields.get(field))
+        if values:
+            param["value"] = [{field: value} for value in values]
+    return {
+        "python_s": float("nan"),
+        "rows": _rows(spec),
+        "bytes": len(json.dumps(spec)),
+        "render_s": _render(app, [spec], repeat),
+    }
+
+
+def server_side(app, selections: Dict[str, list], repeat: int) -> dict:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        specs = [chart.to_dict() for chart in app.server_charts(selections).values()]
+    python_s = (time.perf_counter() - start) / repeat
+    return {
+        "python_s": python_s,
+        "rows": sum(_rows(spec) for spec in specs),
+        "bytes": sum(len(json.dumps(spec)) for spec in specs),
+        "render_s": _render(app, specs, repeat),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    os.chdir(APP_DIR)
+    sys.path.insert(0, APP_DIR)
+    import app
+
+    print(
+        f"{'state':32} {'mode':7} {'python (ms)':>12} {'render (ms)':>12}"
+        f" {'rows':>7} {'bytes':>9}"
+    )
+    for name, state in STATES.items():
+        selections = dict(app.crossfilter.read_selections({}), **state)
+        for mode, run in (("client", client_side), ("server", server_side)):
+            result = run(app, selections, args.repeat)
+            print(
+                f"{name:32} {mode:7} {result['python_s'] * 1000:12.1f}"
+                f" {result['render_s'] * 1000:12.1f}"
+                f" {result['rows']:7d} {result['bytes']:9d}"
+            )
+
+
+if __name__ == "__main__":
+    main()
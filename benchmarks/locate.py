@@ -0,0 +1,91 @@
+"""
+Borough and community district assignment, spatial index against row by row.
+
+Scatters synthetic collisions over the bounding box of each map (about as
+many as the full NYC crash export by default, a few with missing
+coordinates) and times locate.assign on all of them. The row by row
+`map_data.contains(Point(...))` scan of the pre-processing notebooks is timed
+on a sample, checked against the spatial index and extrapolated.
+
+    python benchmarks/locate.py [--rows 2000000] [--sample 2000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import Point
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+MAPS = {
+    "borough": os.path.join(ROOT, "interactive_vis", "original-data", "map.geojson"),
+    "boro_cd": os.path.join(ROOT, "static_vis", "original-data", "map.geojson"),
+}
+
+
+def collisions(areas: gpd.GeoDataFrame, rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    min_x, min_y, max_x, max_y = areas.total_bounds
+    df = pd.DataFrame(
+        {
+            "LONGITUDE": rng.uniform(min_x, max_x, rows),
+            "LATITUDE": rng.uniform(min_y, max_y, rows),
+        }
+    )
+    # The export has a few percent of collisions without coordinates
+    df.loc[rng.random(rows) < 0.05, ["LONGITUDE", "LATITUDE"]] = np.nan
+    return df
+
+
+def row_by_row(df: pd.DataFrame, areas: gpd.GeoDataFrame) -> np.ndarray:
+    found = df.apply(
+        lambda x: [-1]
+        if pd.isnull(x["LATITUDE"]) or pd.isnull(x["LONGITUDE"])
+        else np.where(areas.contains(Point(x["LONGITUDE"], x["LATITUDE"])))[0],
+        axis=1,
+    )
+    return found.apply(lambda x: -1 if len(x) == 0 else x[0]).to_numpy()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--sample", type=int, default=2000)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(ROOT, "interactive_vis"))
+    import locate
+
+    print(
+        f"{'map':8} {'areas':>5} {'rows':>9} {'index (s)':>10}"
+        f" {'row by row (s)':>15} {'speedup':>8}"
+    )
+    for name, path in MAPS.items():
+        areas = gpd.read_file(path)
+        df = collisions(areas, args.rows)
+
+        start = time.perf_counter()
+        locate.assign(df, areas)
+        index_s = time.perf_counter() - start
+
+        sample = df.iloc[: args.sample]
+        start = time.perf_counter()
+        expected = row_by_row(sample, areas)
+        # Extrapolated to every row, the scan is linear in both
+        scan_s = (time.perf_counter() - start) * args.rows / len(sample)
+        positions = locate.locate(sample["LONGITUDE"], sample["LATITUDE"], areas)
+        assert (positions == expected).all(), "spatial index disagrees with scan"
+
+        print(
+            f"{name:8} {len(areas):5d} {args.rows:9d} {index_s:10.2f}"
+            f" {scan_s:15.0f} {scan_s / index_s:7.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Latency of Streamlit reruns of interactive_vis, in both filtering modes.
+
+Runs the app headless (streamlit.testing), once to fill the caches, then
+--repeat more times without changing anything, as a rerun triggered by any
+widget or chart selection does.
+
+    python benchmarks/rerun.py [--root DIR] [--repeat 5] [--app APP]
+
+--root is the directory the app is run from (its data directory is relative
+to it). --app runs another version of app.py against the same modules, to
+compare with it:
+
+    git show <commit>:interactive_vis/app.py > /tmp/app.py
+    python benchmarks/rerun.py --app /tmp/app.py
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+APP_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "interactive_vis"
+)
+
+
+def _timed(app_test) -> float:
+    start = time.perf_counter()
+    app_test.run()
+    if app_test.exception:
+        raise RuntimeError(app_test.exception[0].message)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--root", default=APP_DIR)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--app", default=os.path.join(APP_DIR, "app.py"))
+    args = parser.parse_args()
+
+    script = os.path.abspath(args.app)
+    os.chdir(args.root)
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+    from streamlit.testing.v1 import AppTest
+
+    app_test = AppTest.from_file(script, default_timeout=600)
+    print(f"{'mode':7} {'first run (ms)':>15} {'rerun (ms)':>11} {'best (ms)':>10}")
+    for mode in ("client", "server"):
+        if mode == "server":
+            app_test.toggle[0].set_value(True)
+        first = _timed(app_test)
+        reruns = [_timed(app_test) for _ in range(args.repeat)]
+        print(
+            f"{mode:7} {first * 1000:15.1f} {statistics.mean(reruns) * 1000:11.1f}"
+            f" {min(reruns) * 1000:10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Bytes sent for every section of the static_vis dashboard, by how it is shown.
+
+- page: the HTML page handed to components.html, with the spec and its data
+  (the Vega runtime it loads from the CDN is not counted)
+- svg, png: the image of the section rendered on the server, as served from
+  static/ (png at --scale pixels per chart pixel)
+
+    python benchmarks/static_bytes.py [--root DIR] [--scale 1]
+
+--root is the directory the app is run from (its DATA_DIR is relative to it).
+"""
+
+import argparse
+import os
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "static_vis")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--root", default=os.path.join(APP_DIR, ".."))
+    parser.add_argument("--scale", type=float, default=1)
+    args = parser.parse_args()
+
+    os.chdir(args.root)
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+    import app
+    import export
+
+    if not export.AVAILABLE:
+        parser.error("rendering charts needs vl-convert-python")
+    center = app.Center()
+    print(
+        f"{'section':10} {'page (KB)':>10} {'svg (KB)':>10} {'png (KB)':>10}  shown as"
+    )
+    for name in app.SECTIONS:
+        entry = center.section(name)
+        sizes = [
+            len(entry["html"].encode("utf-8")),
+            len(export.render(entry["dashboard"], "svg")),
+            len(export.render(entry["dashboard"], "png", args.scale)),
+        ]
+        shown = "page" if entry["svg"] is None else "svg"
+        print(
+            f"{name:10} {sizes[0] / 1024:10.1f} {sizes[1] / 1024:10.1f} "
+            f"{sizes[2] / 1024:10.1f}  {shown}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Per-rerun cost of handing the static_vis dashboard to components.html.
+
+Compares, on the same dashboard spec:
+
+- save: the former Center.show, saving the chart to a NamedTemporaryFile
+  (delete=False) on every rerun and reading it back
+- cached: the page rendered once with the charts and kept in memory
+
+and counts the temporary files each one leaves behind.
+
+    python benchmarks/static_show.py [--root DIR] [--repeat 5]
+
+--root is the directory the app is run from (its DATA_DIR is relative to it).
+"""
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import altair as alt
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "static_vis")
+
+
+def save(chart: alt.TopLevelMixin) -> str:
+    with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".html") as file:
+        chart.save(file.name)
+        file.flush()
+        return open(file.name, "r", encoding="utf-8").read()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--root", default=os.path.join(APP_DIR, ".."))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    os.chdir(args.root)
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+    import app
+
+    start = time.perf_counter()
+    center = app.Center(progressive=False)
+    print(f"charts ready in {time.perf_counter() - start:.2f}s (built or from disk)")
+    chart = alt.VConcatChart.from_dict(center.spec, validate=False)
+
+    pattern = os.path.join(tempfile.gettempdir(), "tmp*.html")
+    print(f"{'mode':7} {'per rerun (ms)':>15} {'temp files left':>16}")
+    for mode, render in (
+        ("save", lambda: save(chart)),
+        ("cached", lambda: center.html),
+    ):
+        before = set(glob.glob(pattern))
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            render()
+        elapsed = (time.perf_counter() - start) / args.repeat
+        left = set(glob.glob(pattern)) - before
+        print(f"{mode:7} {elapsed * 1000:15.2f} {len(left):16d}")
+        for path in left:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
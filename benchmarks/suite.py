@@ -0,0 +1,328 @@
+"""
+Timings, peak memory and spec sizes of the hot paths of both apps.
+
+interactive_vis: get_data (and its parts), the collision cube, every rollup
+of the chart builders of app.py, the composed client-side chart and spec, and
+the cached spec every rerun gets.
+static_vis: data loading, _process_data and make_plot of every chart class,
+the composed dashboard (also built one chart at a time), the time each
+chart took in it and the page of every section of the progressive dashboard.
+
+Each step is timed --repeat times (best and mean are reported), then run once
+more under tracemalloc for its peak memory. Steps producing a chart also
+report the size of its serialized spec. Results can be written as JSON with
+--output and compared against an earlier run with --compare.
+
+    python benchmarks/suite.py [--repeat 3] [--interactive-root DIR]
+        [--static-root DIR] [--output results.json] [--compare baseline.json]
+
+--interactive-root and --static-root are the directories each app is run from
+(their data directories are relative to it), so they can point to data made
+with synthesize.py. The static suite is skipped when its data is missing.
+"""
+
+import argparse
+import datetime
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+INTERACTIVE_DIR = os.path.join(ROOT, "interactive_vis")
+STATIC_DIR = os.path.join(ROOT, "static_vis")
+
+Result = Dict[str, Any]
+
+
+class Suite:
+    def __init__(self, name: str, repeat: int) -> None:
+        self.name = name
+        self.repeat = repeat
+        self.results: List[Result] = []
+
+    def measure(
+        self, step: str, function: Callable[[], Any], spec: bool = False
+    ) -> Any:
+        times = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            result = function()
+            times.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.results.append(
+            {
+                "suite": self.name,
+                "step": step,
+                "best_s": min(times),
+                "mean_s": statistics.mean(times),
+                "peak_bytes": peak,
+                "spec_bytes": _spec_bytes(result) if spec else None,
+            }
+        )
+        return result
+
+    def record(self, step: str, seconds: float) -> None:
+        """A step timed elsewhere, once, without its memory."""
+        self.results.append(
+            {
+                "suite": self.name,
+                "step": step,
+                "best_s": seconds,
+                "mean_s": seconds,
+                "peak_bytes": None,
+                "spec_bytes": None,
+            }
+        )
+
+
+def _spec_bytes(result: Any) -> int:
+    if not isinstance(result, dict):
+        return len(result.to_json())
+    # A spec built for st.vega_lite_chart, with DataFrames as datasets
+    import altair as alt
+    import pandas as pd
+
+    datasets = {
+        name: alt.utils.data.to_values(data)["values"]
+        if isinstance(data, pd.DataFrame)
+        else data
+        for name, data in result.get("datasets", {}).items()
+    }
+    return len(json.dumps({**result, "datasets": datasets}, indent=2))
+
+
+def _use_app(app_dir: str) -> None:
+    # Both apps have top-level modules with the same names (app, storage, ...)
+    for name, module in list(sys.modules.items()):
+        directory = os.path.dirname(getattr(module, "__file__", None) or "")
+        if directory in (INTERACTIVE_DIR, STATIC_DIR):
+            del sys.modules[name]
+    for path in (INTERACTIVE_DIR, STATIC_DIR):
+        if path in sys.path:
+            sys.path.remove(path)
+    sys.path.insert(0, app_dir)
+    os.chdir(app_dir)
+
+
+def interactive(repeat: int, root: str) -> List[Result]:
+    suite = Suite("interactive", repeat)
+    _use_app(INTERACTIVE_DIR)
+    os.chdir(root)
+    import app
+
+    # Every rollup of the client-side chart builders, named after the variable
+    # it is assigned to, is measured while the spec is built once
+    rollup = app.CollisionCube.rollup
+
+    def measured_rollup(self, *args, **kwargs):
+        caller = inspect.getframeinfo(sys._getframe(1))
+        line = (caller.code_context or [""])[0]
+        if caller.filename != app.__file__ or "=" not in line:
+            return rollup(self, *args, **kwargs)
+        step = f"rollup {line.split('=')[0].strip()}"
+        return suite.measure(step, lambda: rollup(self, *args, **kwargs))
+
+    app.CollisionCube.rollup = measured_rollup
+    try:
+        app.client_side_spec()
+    finally:
+        app.CollisionCube.rollup = rollup
+
+    # The year the dashboard opens on
+    suite.measure("get_data", lambda: app.get_data.__wrapped__(app.version, app.year))
+    suite.measure(
+        "get_data read_collisions",
+        lambda: app.storage.read_collisions(app.COLUMNS, months=app.months),
+    )
+    collisions = app.get_data(app.version, app.year)
+    map_data = app.get_map(app.version)
+    suite.measure("get_cube", lambda: app.CollisionCube(collisions))
+    level = app.geometry.pick_level(400, 350, map_data.total_bounds)
+    suite.measure(
+        "get_map_url", lambda: app.get_map_url.__wrapped__(level, app.version)
+    )
+
+    chart = suite.measure(
+        "client_side_chart", lambda: app.client_side_chart(app.SharedData())
+    )
+    suite.measure("client_side_chart to_dict", chart.to_dict)
+    suite.measure("client_side_spec", app.client_side_spec, spec=True)
+    # What every rerun does once the spec is cached
+    app.get_client_side_spec(app.version, app.year)
+    suite.measure(
+        "get_client_side_spec (cached)",
+        lambda: app.get_client_side_spec(app.version, app.year),
+    )
+    # Reorder so rollups measured first come after the loading
+    suite.results.sort(key=lambda result: result["step"].startswith("rollup"))
+    return suite.results
+
+
+def static(repeat: int, root: str) -> List[Result]:
+    suite = Suite("static", repeat)
+    _use_app(STATIC_DIR)
+    os.chdir(root)
+    import app
+
+    if not os.path.exists(app.DATA_DIR):
+        print(f"static: no {app.DATA_DIR} under {root}, skipped", file=sys.stderr)
+        return []
+
+    center = app.Center()
+    collisions, map_data, weather = suite.measure("_load_data", center._load_data)
+    topology = suite.measure(
+        "read_topology",
+        lambda: app.geometry.read_topology(
+            app.geometry.pick_level(600, 600, map_data.total_bounds),
+            map_data,
+            app.DATA_DIR,
+        ),
+    )
+
+    common = (
+        center.moments,
+        center.colors,
+        center.main_opactiy,
+        center.secondary_opactiy,
+    )
+    # Class, constructor arguments and _process_data arguments
+    charts: Dict[str, Tuple[type, Tuple, Tuple]] = {
+        "WeekChart": (app.WeekChart, (collisions, *common), (collisions,)),
+        "VehiclesChart": (app.VehiclesChart, (collisions, *common), (collisions,)),
+        "HourChart": (app.HourChart, (collisions, *common), (collisions,)),
+        "MapChart": (
+            app.MapChart,
+            (collisions, map_data, topology, *common),
+            (collisions, map_data),
+        ),
+        "WeatherChart": (
+            app.WeatherChart,
+            (collisions, weather, *common),
+            (collisions, weather),
+        ),
+        "FactorChart": (
+            app.FactorChart,
+            (collisions, center.main_opactiy, center.secondary_opactiy),
+            (collisions,),
+        ),
+    }
+    for name, (cls, arguments, data) in charts.items():
+        chart = cls(*arguments)
+        # From a cold cache, as on the first run of the app
+        suite.measure(
+            f"{name}._process_data",
+            lambda: (collisions.clear(), chart._process_data(*data)),
+        )
+        suite.measure(f"{name}.make_plot", chart.make_plot, spec=True)
+
+    workers = center.workers
+    center.workers = 1
+    suite.measure("Center._compose (1 thread)", center._compose)
+    center.workers = workers
+    timings = []
+
+    def compose() -> Any:
+        final_chart = center._compose()
+        timings.append(center.timings)
+        return final_chart
+
+    final_chart = suite.measure("Center._compose", compose, spec=True)
+    # From the first build, the last one runs under tracemalloc. The slowest
+    # chart is the critical path of the threaded build
+    for name, seconds in timings[0].items():
+        suite.record(f"Center chart {name}", seconds)
+    suite.measure("Center._compose to_dict", final_chart.to_dict)
+    suite.measure("Center._compose to_json", final_chart.to_json)
+    # Pages of the progressive dashboard, the first one is on screen first
+    for name in app.SECTIONS:
+        suite.measure(f"Center section {name}", lambda: center._build_section(name))
+    return suite.results
+
+
+def _meta() -> Dict[str, Any]:
+    import altair as alt
+    import pandas as pd
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "altair": alt.__version__,
+        "machine": platform.platform(),
+    }
+
+
+def _report(results: List[Result], baseline: Optional[List[Result]]) -> None:
+    before = {(r["suite"], r["step"]): r for r in baseline or []}
+    header = (
+        f"{'suite':11} {'step':32} {'best (ms)':>10} {'mean (ms)':>10}"
+        f" {'peak (MB)':>10} {'spec (KB)':>10}"
+    )
+    print(header + (f" {'vs base':>8}" if baseline else ""))
+    for result in results:
+        spec, peak = result["spec_bytes"], result["peak_bytes"]
+        line = (
+            f"{result['suite']:11} {result['step']:32}"
+            f" {result['best_s'] * 1000:10.1f} {result['mean_s'] * 1000:10.1f}"
+            f" {'' if peak is None else f'{peak / 2**20:.1f}':>10}"
+            f" {'' if spec is None else f'{spec / 1024:.1f}':>10}"
+        )
+        old = before.get((result["suite"], result["step"]))
+        if old:
+            line += f" {result['best_s'] / old['best_s']:7.2f}x"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--interactive-root", default=INTERACTIVE_DIR)
+    parser.add_argument("--static-root", default=STATIC_DIR)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    args = parser.parse_args()
+
+    # Paths are relative to where the suite is run, the apps change directory
+    interactive_root = os.path.abspath(args.interactive_root)
+    static_root = os.path.abspath(args.static_root)
+    output = args.output and os.path.abspath(args.output)
+    compare = args.compare and os.path.abspath(args.compare)
+    results = interactive(args.repeat, interactive_root) + static(
+        args.repeat, static_root
+    )
+
+    baseline = None
+    if compare:
+        with open(compare, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+    _report(results, baseline)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump({"meta": _meta(), "results": results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,67 @@
+import calendar
+import functools
+import json
+import operator
 import warnings
+from typing import List, NamedTuple
 
 import altair as alt
 import geopandas as gpd
 import pandas as pd
 import streamlit as st
 
+import crossfilter
+import geometry
+import shared_data
+import storage
+from cube import COLUMNS, CollisionCube
+from shared_data import SharedData
+
 alt.data_transformers.disable_max_rows()
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 
 ## INITIAL SETUP
 
-st.set_page_config(page_title="NYC Collisions 2018", page_icon="📊", layout="wide")
+st.set_page_config(page_title="NYC Collisions", page_icon="📊", layout="wide")
+
+# The dashboard shows one year at a time, and only reads the partitions of its
+# months
+partitions = storage.partitions()
+years = sorted({year for year, _ in partitions})
+year = st.sidebar.selectbox("Year", years, index=len(years) - 1)
+months = [partition for partition in partitions if partition[0] == year]
+# Years kept in memory, others are read again from their partitions
+YEARS_CACHED = 3
+
+# Version of the processed data: every cache below is keyed on it, so all of
+# it is built again once the data changes
+version = storage.version()
+
+
+@st.cache_data(max_entries=YEARS_CACHED)
+def get_data(version: str, year: int):
+    months = [partition for partition in storage.partitions() if partition[0] == year]
+    return storage.read_collisions(COLUMNS, months=months)
+
+
+@st.cache_data(max_entries=1)
+def get_map(version: str):
+    return gpd.read_file("./processed-data/map.geojson")
 
 
 @st.cache_data
-def get_data():
-    collisions = pd.read_csv("./processed-data/collisions_weather.csv")
-    map_data = gpd.read_file("./processed-data/map.geojson")
-    return collisions, map_data
+def get_map_url(level: str, version: str):
+    return geometry.publish(level, get_map(version))
+
+
+@st.cache_resource(max_entries=YEARS_CACHED)
+def get_cube(version: str, year: int):
+    return CollisionCube(get_data(version, year))
 
 
-collisions, map_data = get_data()
+map_data = get_map(version)[["BOROUGH", "AREA_KM2", "geometry"]]
+cube = get_cube(version, year)
 
 primary = "purple"
 boroughs_colors = "boroughs"
@@ -49,7 +89,7 @@ colors = {
 
 ###### BARPLOTS
 
-month_order = ["June", "July", "August", "September"]
+month_order = [calendar.month_name[month] for _, month in months]
 month_selection = alt.selection_point(fields=["MONTH"], empty=True)
 
 vehicle_order = ["Taxi", "Ambulance", "Fire truck"]
@@ -58,259 +98,318 @@ vehicle_selection = alt.selection_point(fields=["VEHICLE"], empty=True)
 weather_order = ["Rainy", "Clear", "Partly cloudy", "Cloudy"]
 weather_selection = alt.selection_point(fields=["WEATHER"], empty=True)
 
-bars_df = (
-    collisions.groupby(
-        ["MONTH", "VEHICLE", "VEHICLE EMOJI", "WEATHER", "WEATHER EMOJI"]
-    )
-    .agg({"VALID": "sum"})
-    .reset_index()
-)
-months = (
-    alt.Chart(bars_df)
-    .mark_bar(color=colors[primary])
-    .encode(
-        x=alt.X(
-            "MONTH:O",
-            sort=month_order,
-            axis=alt.Axis(title="Month", labelAngle=0),
-            scale=alt.Scale(domain=month_order),
-        ),
-        y=alt.Y("sum(VALID):Q", axis=alt.Axis(title="Collisions")),
-        opacity=alt.condition(month_selection, alt.value(1), alt.value(0.2)),
-        tooltip=[
-            alt.Tooltip("MONTH:O", title="Month"),
-            alt.Tooltip("sum(VALID):Q", title="Collisions"),
-        ],
+
+def bar_charts(datasets: SharedData):
+    bars_df = cube.rollup(
+        ["MONTH", "VEHICLE", "VEHICLE EMOJI", "WEATHER", "WEATHER EMOJI"], ["VALID"]
     )
-    .add_params(month_selection)
-    .transform_filter(vehicle_selection & weather_selection)
-    .properties(
-        title=alt.Title(
-            ["Collisions per Month", "(filtered by vehicle and weather)"], dy=-0
-        ),
-        width=250,
-        height=175,
+    bars_data = datasets.add("bars", bars_df)
+    months = (
+        alt.Chart(bars_data)
+        .mark_bar(color=colors[primary])
+        .encode(
+            x=alt.X(
+                "MONTH:O",
+                sort=month_order,
+                axis=alt.Axis(title="Month", labelAngle=0),
+                scale=alt.Scale(domain=month_order),
+            ),
+            y=alt.Y("sum(VALID):Q", axis=alt.Axis(title="Collisions")),
+            opacity=alt.condition(month_selection, alt.value(1), alt.value(0.2)),
+            tooltip=[
+                alt.Tooltip("MONTH:O", title="Month"),
+                alt.Tooltip("sum(VALID):Q", title="Collisions"),
+            ],
+        )
+        .add_params(month_selection)
+        .transform_filter(vehicle_selection & weather_selection)
+        .properties(
+            title=alt.Title(
+                ["Collisions per Month", "(filtered by vehicle and weather)"], dy=-0
+            ),
+            width=250,
+            height=175,
+        )
     )
-)
 
-vehicles = (
-    alt.Chart(bars_df)
-    .mark_bar(color=colors[primary])
-    .encode(
-        x=alt.X(
-            "VEHICLE:N",
-            sort=vehicle_order,
-            axis=alt.Axis(
-                title="Vehicle", labels=False, domain=False, ticks=False, grid=False
+    vehicles = (
+        alt.Chart(bars_data)
+        .mark_bar(color=colors[primary])
+        .encode(
+            x=alt.X(
+                "VEHICLE:N",
+                sort=vehicle_order,
+                axis=alt.Axis(
+                    title="Vehicle", labels=False, domain=False, ticks=False, grid=False
+                ),
+                scale=alt.Scale(domain=vehicle_order),
             ),
-            scale=alt.Scale(domain=vehicle_order),
-        ),
-        y=alt.Y("sum(VALID):Q", axis=alt.Axis(title="Collisions")),
-        opacity=alt.condition(vehicle_selection, alt.value(1), alt.value(0.2)),
-        tooltip=[
-            alt.Tooltip("VEHICLE:N", title="Vehicle"),
-            alt.Tooltip("sum(VALID):Q", title="Collisions"),
-        ],
-        # color=alt.Color(
-        #     "VEHICLE:N",
-        #     scale=alt.Scale(
-        #             range=list(colors[vehicles_colors].values()),
-        #             domain=list(colors[vehicles_colors].keys())
-        #     ),
-        #     legend=None
-        # ),
-    )
-    .add_params(vehicle_selection)
-    .transform_filter(month_selection & weather_selection)
-    .properties(
-        title=alt.Title(
-            ["Collisions per Vehicle", "(filtered by month and weather)"], dy=-0
-        ),
-        width=200,
-        height=175,
+            y=alt.Y("sum(VALID):Q", axis=alt.Axis(title="Collisions")),
+            opacity=alt.condition(vehicle_selection, alt.value(1), alt.value(0.2)),
+            tooltip=[
+                alt.Tooltip("VEHICLE:N", title="Vehicle"),
+                alt.Tooltip("sum(VALID):Q", title="Collisions"),
+            ],
+            # color=alt.Color(
+            #     "VEHICLE:N",
+            #     scale=alt.Scale(
+            #             range=list(colors[vehicles_colors].values()),
+            #             domain=list(colors[vehicles_colors].keys())
+            #     ),
+            #     legend=None
+            # ),
+        )
+        .add_params(vehicle_selection)
+        .transform_filter(month_selection & weather_selection)
+        .properties(
+            title=alt.Title(
+                ["Collisions per Vehicle", "(filtered by month and weather)"], dy=-0
+            ),
+            width=200,
+            height=175,
+        )
     )
-)
 
-vehicles += (
-    alt.Chart(bars_df)
-    .mark_text(size=18, align="center", dy=-8)
-    .encode(
-        x=alt.X("VEHICLE:N", sort=vehicle_order, scale=alt.Scale(domain=vehicle_order)),
-        y=alt.Y("sum(VALID):Q"),
-        text=alt.Text("VEHICLE EMOJI:N"),
-        opacity=alt.condition(vehicle_selection, alt.value(1), alt.value(0.2)),
-        tooltip=[
-            alt.Tooltip("VEHICLE:N", title="Vehicle"),
-            alt.Tooltip("sum(VALID):Q", title="Collisions"),
-        ],
-        color=alt.Color(legend=None),
+    vehicles += (
+        alt.Chart(bars_data)
+        .mark_text(size=18, align="center", dy=-8)
+        .encode(
+            x=alt.X(
+                "VEHICLE:N", sort=vehicle_order, scale=alt.Scale(domain=vehicle_order)
+            ),
+            y=alt.Y("sum(VALID):Q"),
+            text=alt.Text("VEHICLE EMOJI:N"),
+            opacity=alt.condition(vehicle_selection, alt.value(1), alt.value(0.2)),
+            tooltip=[
+                alt.Tooltip("VEHICLE:N", title="Vehicle"),
+                alt.Tooltip("sum(VALID):Q", title="Collisions"),
+            ],
+            color=alt.Color(legend=None),
+        )
+        .add_params(vehicle_selection)
+        .transform_filter(month_selection & weather_selection)
     )
-    .add_params(vehicle_selection)
-    .transform_filter(month_selection & weather_selection)
-)
 
-weather = (
-    alt.Chart(bars_df)
-    .mark_bar(color=colors[primary])
-    .encode(
-        x=alt.X(
-            "WEATHER:N",
-            sort=weather_order,
-            axis=alt.Axis(
-                title="Weather", labels=False, domain=False, ticks=False, grid=False
+    weather = (
+        alt.Chart(bars_data)
+        .mark_bar(color=colors[primary])
+        .encode(
+            x=alt.X(
+                "WEATHER:N",
+                sort=weather_order,
+                axis=alt.Axis(
+                    title="Weather", labels=False, domain=False, ticks=False, grid=False
+                ),
+                scale=alt.Scale(domain=weather_order),
             ),
-            scale=alt.Scale(domain=weather_order),
-        ),
-        y=alt.Y("sum(VALID):Q", axis=alt.Axis(title="Collisions")),
-        opacity=alt.condition(weather_selection, alt.value(1), alt.value(0.2)),
-        tooltip=[
-            alt.Tooltip("WEATHER:N", title="Weather"),
-            alt.Tooltip("sum(VALID):Q", title="Collisions"),
-        ],
-    )
-    .add_params(weather_selection)
-    .transform_filter(month_selection & vehicle_selection)
-    .properties(
-        title=alt.Title(
-            ["Collisions per Weather", "(filtered by month and vehicle)"], dy=-0
-        ),
-        width=200,
-        height=175,
+            y=alt.Y("sum(VALID):Q", axis=alt.Axis(title="Collisions")),
+            opacity=alt.condition(weather_selection, alt.value(1), alt.value(0.2)),
+            tooltip=[
+                alt.Tooltip("WEATHER:N", title="Weather"),
+                alt.Tooltip("sum(VALID):Q", title="Collisions"),
+            ],
+        )
+        .add_params(weather_selection)
+        .transform_filter(month_selection & vehicle_selection)
+        .properties(
+            title=alt.Title(
+                ["Collisions per Weather", "(filtered by month and vehicle)"], dy=-0
+            ),
+            width=200,
+            height=175,
+        )
     )
-)
 
-weather += (
-    alt.Chart(bars_df)
-    .mark_text(size=18, align="center", dy=-8)
-    .encode(
-        x=alt.X("WEATHER:N", sort=weather_order, scale=alt.Scale(domain=weather_order)),
-        y=alt.Y("sum(VALID):Q"),
-        text=alt.Text("WEATHER EMOJI:N"),
-        opacity=alt.condition(weather_selection, alt.value(1), alt.value(0.2)),
-        tooltip=[
-            alt.Tooltip("WEATHER:N", title="Weather"),
-            alt.Tooltip("sum(VALID):Q", title="Collisions"),
-        ],
+    weather += (
+        alt.Chart(bars_data)
+        .mark_text(size=18, align="center", dy=-8)
+        .encode(
+            x=alt.X(
+                "WEATHER:N", sort=weather_order, scale=alt.Scale(domain=weather_order)
+            ),
+            y=alt.Y("sum(VALID):Q"),
+            text=alt.Text("WEATHER EMOJI:N"),
+            opacity=alt.condition(weather_selection, alt.value(1), alt.value(0.2)),
+            tooltip=[
+                alt.Tooltip("WEATHER:N", title="Weather"),
+                alt.Tooltip("sum(VALID):Q", title="Collisions"),
+            ],
+        )
+        .add_params(weather_selection)
+        .transform_filter(month_selection & vehicle_selection)
     )
-    .add_params(weather_selection)
-    .transform_filter(month_selection & vehicle_selection)
-)
+    return months, vehicles, weather
 
 
 ###### MAP
 
 ny_map_selection = alt.selection_point(fields=["BOROUGH"], empty=True)
 
-collisions_borough = (
-    collisions.groupby(["MONTH", "VEHICLE", "WEATHER", "BOROUGH"])
-    .agg({"VALID": "sum"})
-    .reset_index()
+# Bundled with the app under a content-hashed name, see geometry.publish
+map_data_st = geometry.to_url_data(
+    get_map_url(geometry.pick_level(400, 350, map_data.total_bounds), version)
 )
-map_data = map_data[["BOROUGH", "AREA_KM2", "geometry"]]
-
-ny_map = (
-    alt.Chart(collisions_borough)
-    .mark_geoshape(stroke="gray")
-    .project(type="albersUsa")
-    .transform_lookup(
-        lookup="BOROUGH",
-        from_=alt.LookupData(
-            data=map_data, key="BOROUGH", fields=["geometry", "type", "AREA_KM2"]
-        ),
-    )
-    .transform_filter(month_selection & weather_selection & vehicle_selection)
-    .transform_aggregate(
-        sumCollisions="sum(VALID)", groupby=["BOROUGH", "AREA_KM2", "geometry", "type"]
-    )
-    .transform_calculate(COLLISIONS_KM2="datum.sumCollisions / datum.AREA_KM2")
-    .encode(
-        color=alt.condition(
-            ny_map_selection,
-            alt.Color(
-                "COLLISIONS_KM2:Q",
-                scale=alt.Scale(scheme=colors[schema], type="log"),
-                legend=alt.Legend(title=["Collisions per km2", "(log scale)"]),
+
+
+def borough_map(boroughs_data: alt.NamedData, shapes: alt.Data):
+    """
+    Collisions per km2 of every borough among the rows matching the bar
+    selections. Rows are summed into one total per borough first, and only
+    those few totals are joined to their shapes, so Vega never groups nor
+    copies the geometry when a selection changes.
+    """
+    return (
+        alt.Chart(boroughs_data)
+        .mark_geoshape(stroke="gray")
+        .project(type="albersUsa")
+        .transform_filter(month_selection & weather_selection & vehicle_selection)
+        .transform_aggregate(sumCollisions="sum(VALID)", groupby=["BOROUGH_ID"])
+        .transform_lookup(
+            lookup="BOROUGH_ID",
+            from_=alt.LookupData(
+                data=shapes, key="id", fields=["geometry", "type", "properties"]
             ),
-            alt.value("lightgray"),
-        ),
-        tooltip=[
-            alt.Tooltip("BOROUGH:N", title="Borough"),
-            alt.Tooltip("COLLISIONS_KM2:Q", title="Collisions per km2"),
-            alt.Tooltip("sumCollisions:Q", title="Collisions"),
-        ],
+        )
+        # Shapes not loaded yet, or boroughs without a shape
+        .transform_filter("isValid(datum.properties)")
+        .transform_calculate(
+            BOROUGH="datum.properties.BOROUGH",
+            COLLISIONS_KM2="datum.sumCollisions / datum.properties.AREA_KM2",
+        )
+        .encode(
+            color=alt.condition(
+                ny_map_selection,
+                alt.Color(
+                    "COLLISIONS_KM2:Q",
+                    scale=alt.Scale(scheme=colors[schema], type="log"),
+                    legend=alt.Legend(title=["Collisions per km2", "(log scale)"]),
+                ),
+                alt.value("lightgray"),
+            ),
+            tooltip=[
+                alt.Tooltip("BOROUGH:N", title="Borough"),
+                alt.Tooltip("COLLISIONS_KM2:Q", title="Collisions per km2"),
+                alt.Tooltip("sumCollisions:Q", title="Collisions"),
+            ],
+        )
+        .properties(
+            width=300, height=300, title=["NYC Boroughs", "(filtered by barplots)"]
+        )
+        .add_params(ny_map_selection)
     )
-    .properties(width=300, height=300, title=["NYC Boroughs", "(filtered by barplots)"])
-    .add_params(ny_map_selection)
-)
 
-collisions_borough_st = collisions_borough.merge(map_data, on="BOROUGH", how="left")
-collisions_borough_st = collisions_borough_st[
-    ["MONTH", "VEHICLE", "WEATHER", "BOROUGH", "AREA_KM2", "VALID"]
-]
 
-map_data_st = alt.Data(
-    url="https://data.cityofnewyork.us/resource/7t3b-ywvw.geojson",
-    format=alt.DataFormat(property="features"),
-)
-
-ny_map_st = (
-    alt.Chart(collisions_borough_st)
-    .mark_geoshape(stroke="gray")
-    .project(type="albersUsa")
-    .transform_lookup(
-        lookup="BOROUGH",
-        from_=alt.LookupData(
-            data=map_data_st, key="properties.boro_name", fields=["geometry", "type"]
-        ),
-    )
-    .transform_filter(month_selection & weather_selection & vehicle_selection)
-    .transform_aggregate(
-        sumCollisions="sum(VALID)", groupby=["BOROUGH", "AREA_KM2", "geometry", "type"]
+def map_charts(datasets: SharedData):
+    collisions_borough = cube.rollup(
+        ["MONTH", "VEHICLE", "WEATHER", "BOROUGH"], ["VALID"]
     )
-    .transform_calculate(COLLISIONS_KM2="datum.sumCollisions / datum.AREA_KM2")
-    .encode(
-        color=alt.condition(
-            ny_map_selection,
-            alt.Color(
-                "COLLISIONS_KM2:Q",
-                scale=alt.Scale(scheme=colors[schema], type="log"),
-                legend=alt.Legend(title=["Collisions per km2", "(log scale)"]),
+
+    # Boroughs by the id of their shape, their position in the map, so the
+    # filtered rows are summed per borough before the shapes are joined
+    borough_ids = dict(zip(map_data["BOROUGH"], map_data.index))
+    collisions_borough["BOROUGH_ID"] = collisions_borough["BOROUGH"].map(borough_ids)
+    collisions_borough_st = collisions_borough.dropna(subset=["BOROUGH_ID"]).astype(
+        {"BOROUGH_ID": int}
+    )[["MONTH", "VEHICLE", "WEATHER", "BOROUGH_ID", "VALID"]]
+    boroughs_data = datasets.add("boroughs", collisions_borough_st)
+
+    ny_map_st = borough_map(boroughs_data, map_data_st)
+
+    # Fixes boroughs not appearing when df not full
+    base_map = (
+        alt.Chart(map_data_st)
+        .mark_geoshape(stroke="gray")
+        .transform_calculate(
+            collisions="0",
+        )
+        .encode(
+            color=alt.condition(
+                ny_map_selection, alt.value("white"), alt.value("lightgray")
             ),
-            alt.value("lightgray"),
-        ),
-        tooltip=[
-            alt.Tooltip("BOROUGH:N", title="Borough"),
-            alt.Tooltip("COLLISIONS_KM2:Q", title="Collisions per km2"),
-            alt.Tooltip("sumCollisions:Q", title="Collisions"),
-        ],
+            tooltip=[
+                alt.Tooltip("properties.BOROUGH:N", title="Borough"),
+                alt.Tooltip("collisions:Q", title="Collisions per km2"),
+                alt.Tooltip("collisions:Q", title="Collisions"),
+            ],
+        )
+        .add_params(ny_map_selection)
     )
-    .properties(width=300, height=300, title=["NYC Boroughs", "(filtered by barplots)"])
-    .add_params(ny_map_selection)
-)
 
+    return base_map + ny_map_st
 
-# Fixes boroughs not appearing when df not full
-base_map = (
-    alt.Chart(map_data_st)
-    .mark_geoshape(stroke="gray")
-    .transform_calculate(
-        collisions="0",
-    )
-    .encode(
-        color=alt.condition(
-            ny_map_selection, alt.value("white"), alt.value("lightgray")
-        ),
-        tooltip=[
-            alt.Tooltip("properties.boro_name:N", title="Borough"),
-            alt.Tooltip("collisions:Q", title="Collisions per km2"),
-            alt.Tooltip("collisions:Q", title="Collisions"),
-        ],
+
+###### PRECOMPUTED SELECTIONS
+
+
+class SelectionTable(NamedTuple):
+    """
+    Rows for every selection on `fields` with at most one value per field,
+    keyed by the number of the selection as crossfilter.by_selection numbers
+    it.
+    """
+
+    data: alt.NamedData
+    fields: List[str]
+    columns: List[str]
+
+
+def add_selection_table(
+    datasets: SharedData,
+    name: str,
+    fields: List[str],
+    df: pd.DataFrame,
+) -> SelectionTable:
+    columns = [column for column in df.columns if column != "KEY"]
+    return SelectionTable(datasets.add(name, df), fields, columns)
+
+
+def several_values(selections: List[alt.Parameter]) -> str:
+    """Whether any of `selections` holds more than one value (shift-click)."""
+    return " || ".join(
+        f"length(data('{selection.name}_store')) > 1" for selection in selections
     )
-    .add_params(ny_map_selection)
-)
 
-ny_map = base_map + ny_map
-ny_map_st = base_map + ny_map_st
+
+def selection_number(table: SelectionTable, selections: List[alt.Parameter]) -> str:
+    """
+    Expression of the number of the current `selections`, which select on the
+    first fields of `table` (the others are unfiltered), from their stores.
+    """
+    number = "0"
+    radix = 1
+    for selection, field in zip(selections, table.fields):
+        store = f"data('{selection.name}_store')"
+        values = cube.values(field).tolist()
+        code = f"indexof({json.dumps(values)}, {store}[0].values[0]) + 1"
+        number += f" + {radix} * (length({store}) ? {code} : 0)"
+        radix *= len(values) + 1
+    return number
+
+
+def top_rows(
+    chart: alt.Chart,
+    table: SelectionTable,
+    selections: List[alt.Parameter],
+    groupby: List[str],
+) -> alt.Chart:
+    """
+    `chart` on the rows of `groupby` with the most collisions (sumValid) among
+    those matching the current `selections`. Their maximum is looked up in
+    `table` (crossfilter.maxima) by the number of the selections, so nothing
+    is ranked in the browser. There are no rows while a selection holds
+    several values, which are left to the full pipeline.
+    """
+    return (
+        chart.transform_filter(f"!({several_values(selections)})")
+        .transform_filter(functools.reduce(operator.and_, selections))
+        .transform_aggregate(groupby=groupby, sumValid="sum(VALID):Q")
+        .transform_calculate(KEY=selection_number(table, selections))
+        .transform_lookup(
+            lookup="KEY",
+            from_=alt.LookupData(data=table.data, key="KEY", fields=["MAX"]),
+        )
+        .transform_filter("datum.sumValid === datum.MAX")
+    )
 
 
 ###### HEATMAP
@@ -320,8 +419,9 @@ weekdayorder = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
 # Default Mon to make it "quicker" to answer Q3
 day_selection = alt.selection_point(fields=["CRASH WEEKDAY"], value="Mon")
 
-weekdays_df = (
-    collisions.groupby(
+
+def weekdays_chart(datasets: SharedData):
+    weekdays_df = cube.rollup(
         [
             "CRASH DAY",
             "CRASH WEEKDAY",
@@ -329,109 +429,131 @@ weekdays_df = (
             "MONTH",
             "VEHICLE",
             "WEATHER",
-            "DAY",
             "BOROUGH",
-        ]
+        ],
+        ["VALID"],
     )
-    .agg({"VALID": "sum"})
-    .reset_index()
-)
+    weekdays_data = datasets.add("weekdays", weekdays_df)
 
-# Base chart
-weekdays = (
-    alt.Chart(weekdays_df)
-    .mark_rect()
-    .transform_filter(
-        month_selection & weather_selection & vehicle_selection & ny_map_selection
+    # Base chart
+    weekdays = (
+        alt.Chart(weekdays_data)
+        .mark_rect()
+        .transform_filter(
+            month_selection & weather_selection & vehicle_selection & ny_map_selection
+        )
+        .encode(
+            x=alt.X(
+                "CRASH WEEKDAY:O",
+                title="Day of week",
+                sort=weekdayorder,
+                axis=alt.Axis(labelAngle=0),
+            ),
+            y=alt.Y("CRASH WEEK NUMBER:O", title="Week of year"),
+            color=alt.Color(
+                "sumValid:Q", scale=alt.Scale(scheme=colors[schema]), title="Collisions"
+            ),
+            opacity=alt.condition(day_selection, alt.value(1), alt.value(0.2)),
+            tooltip=[
+                alt.Tooltip("CRASH DAY:O", title="Crash day"),
+                alt.Tooltip("sumValid:Q", title="Collisions"),
+            ],
+        )
+        .transform_aggregate(
+            groupby=["CRASH DAY", "CRASH WEEKDAY", "CRASH WEEK NUMBER"],
+            sumValid="sum(VALID):Q",
+        )
+        .add_params(day_selection)
+        .properties(
+            title=["Collisions per Week and Weekday", "(filtered by barplots and map)"],
+            width=300,
+            height=300,
+        )
     )
-    .encode(
-        x=alt.X(
-            "CRASH WEEKDAY:O",
-            title="Day of week",
-            sort=weekdayorder,
-            axis=alt.Axis(labelAngle=0),
-        ),
-        y=alt.Y("CRASH WEEK NUMBER:O", title="Week of year"),
-        color=alt.Color(
-            "sumValid:Q", scale=alt.Scale(scheme=colors[schema]), title="Collisions"
-        ),
-        opacity=alt.condition(day_selection, alt.value(1), alt.value(0.2)),
-        tooltip=[
-            alt.Tooltip("CRASH DAY:O", title="Crash day"),
-            alt.Tooltip("sumValid:Q", title="Collisions"),
-        ],
+
+    # Adding the asterisk to max value
+    selections = [month_selection, weather_selection, vehicle_selection]
+    selections += [ny_map_selection]
+    fields = ["MONTH", "WEATHER", "VEHICLE", "BOROUGH"]
+    maxima = add_selection_table(
+        datasets,
+        "weekdays_maxima",
+        fields,
+        crossfilter.maxima(cube, fields, ["CRASH WEEKDAY", "CRASH WEEK NUMBER"]),
     )
-    .transform_aggregate(
-        groupby=["CRASH DAY", "CRASH WEEKDAY", "CRASH WEEK NUMBER"],
-        sumValid="sum(VALID):Q",
+    asterisk = (
+        alt.Chart(weekdays_data)
+        .mark_text(align="center", text="*", color="white", dy=3, size=15)
+        .encode(
+            x=alt.X("CRASH WEEKDAY:O", sort=weekdayorder),
+            y=alt.Y("CRASH WEEK NUMBER:O"),
+            tooltip=[alt.Tooltip("LABEL:N", title=" ")],
+        )
     )
-    .add_params(day_selection)
-    .properties(
-        title=["Collisions per Week and Weekday", "(filtered by barplots and map)"],
-        width=300,
-        height=300,
+    weekdays += top_rows(
+        asterisk,
+        maxima,
+        selections,
+        ["CRASH DAY", "CRASH WEEKDAY", "CRASH WEEK NUMBER"],
+    ).transform_calculate(LABEL="'Max value'")
+    weekdays += (
+        asterisk.transform_filter(several_values(selections))
+        .transform_filter(
+            month_selection & weather_selection & vehicle_selection & ny_map_selection
+        )
+        .transform_aggregate(
+            groupby=["CRASH DAY", "CRASH WEEKDAY", "CRASH WEEK NUMBER"],
+            sumValid="sum(VALID):Q",
+        )
+        # ignore if no collisions, prevents labelling every
+        # data point when filtering
+        .transform_filter(alt.datum.sumValid != 0)
+        .transform_window(
+            sort=[alt.SortField(field="sumValid", order="descending")],
+            rank="rank()",
+        )
+        # only label the top ranked data point per year
+        .transform_filter(alt.datum.rank == 1)
+        .transform_calculate(LABEL="'Max value'")
     )
-)
 
-# Adding the asterisk to max value
-weekdays += (
-    alt.Chart(weekdays_df)
-    .mark_text(align="center", text="*", color="white", dy=3, size=15)
-    .encode(
-        x=alt.X("CRASH WEEKDAY:O", sort=weekdayorder),
-        y=alt.Y("CRASH WEEK NUMBER:O"),
-        tooltip=[alt.Tooltip("LABEL:N", title=" ")],
-    )
-    .transform_filter(
-        month_selection & weather_selection & vehicle_selection & ny_map_selection
-    )
-    .transform_aggregate(
-        groupby=["CRASH DAY", "CRASH WEEKDAY", "CRASH WEEK NUMBER"],
-        sumValid="sum(VALID):Q",
-    )
-    # ignore if no collisions, prevents labelling every
-    # data point when filtering
-    .transform_filter(alt.datum.sumValid != 0)
-    .transform_window(
-        sort=[alt.SortField(field="sumValid", order="descending")],
-        rank="rank()",
-    )
-    # only label the top ranked data point per year
-    .transform_filter(alt.datum.rank == 1)
-    .transform_calculate(LABEL="'Max value'")
-)
-
-weekdays_empty = (
-    alt.Chart(weekdays_df)
-    .transform_filter(month_selection)
-    .mark_rect(color="white", stroke="grey", strokeWidth=0.5)
-    .transform_calculate(
-        collisions="0",
-    )
-    .encode(
-        x=alt.X(
-            "CRASH WEEKDAY:O",
-            title="Day of week",
-            sort=weekdayorder,
-            axis=alt.Axis(labelAngle=0),
-        ),
-        y=alt.Y("CRASH WEEK NUMBER:O", title="Week of year"),
-        tooltip=[
-            alt.Tooltip("CRASH DAY:O", title="Day"),
-            alt.Tooltip("collisions:Q", title="Collisions"),
-        ],
-        # Grid opacity
-        opacity=alt.condition(day_selection, alt.value(0.05), alt.value(0)),
+    weekdays_empty = (
+        alt.Chart(weekdays_data)
+        .transform_filter(month_selection)
+        .mark_rect(color="white", stroke="grey", strokeWidth=0.5)
+        .transform_calculate(
+            collisions="0",
+        )
+        .encode(
+            x=alt.X(
+                "CRASH WEEKDAY:O",
+                title="Day of week",
+                sort=weekdayorder,
+                axis=alt.Axis(labelAngle=0),
+            ),
+            y=alt.Y("CRASH WEEK NUMBER:O", title="Week of year"),
+            tooltip=[
+                alt.Tooltip("CRASH DAY:O", title="Day"),
+                alt.Tooltip("collisions:Q", title="Collisions"),
+            ],
+            # Grid opacity
+            opacity=alt.condition(day_selection, alt.value(0.05), alt.value(0)),
+        )
     )
-)
 
-weekdays = weekdays_empty + weekdays
+    weekdays = weekdays_empty + weekdays
+    return weekdays
+
 
 ###### LINE CHART
 
+hour_selection = alt.selection_point(
+    encodings=["x"], nearest=True, value=12, empty=True
+)
+
 
-hours_df = (
-    collisions.groupby(
+def hours_chart(datasets: SharedData):
+    hours_df = cube.rollup(
         [
             "CRASH DAY",
             "CRASH WEEKDAY",
@@ -439,338 +561,739 @@ hours_df = (
             "VEHICLE",
             "WEATHER",
             "BOROUGH",
-            "DAY",
             "HOUR",
             "CRASH HOUR",
             "LOCATION AT HOUR",
-        ]
+        ],
+        ["VALID"],
     )
-    .agg({"VALID": "sum"})
-    .reset_index()
-)
-
-hour_selection = alt.selection_point(
-    encodings=["x"], nearest=True, value=12, empty=True
-)
+    hours_data = datasets.add("hours", hours_df)
 
-# Base chart
-hours = (
-    alt.Chart(hours_df)
-    .mark_line()
-    .transform_filter(
-        month_selection & weather_selection & vehicle_selection & day_selection
-    )
-    .transform_aggregate(
-        groupby=["HOUR", "CRASH HOUR", "LOCATION AT HOUR", "BOROUGH"],
-        sumValid="sum(VALID):Q",
-    )
-    # Fill in missing values
-    .transform_impute(
-        impute="sumValid",
-        key="HOUR",
-        keyvals=list(range(24)),
-        value=0,
-        frame=[-1, 1],
-        groupby=["BOROUGH"],
-    )
-    .encode(
-        x=alt.X(
-            "HOUR:Q",
-            axis=alt.Axis(title="Hour", labelAngle=0),
-            scale=alt.Scale(domain=[0, 23]),
-        ),
-        y=alt.Y(
-            "sumValid:Q",
-            axis=alt.Axis(title="Collisions"),
-        ),
-        opacity=alt.condition(ny_map_selection, alt.value(1), alt.value(0.2)),
-        color=alt.Color(
-            "BOROUGH:N",
-            legend=None,  # alt.Legend(title="Borough"),
-            scale=alt.Scale(
-                range=list(colors[boroughs_colors].values()),
-                domain=list(colors[boroughs_colors].keys()),
+    # Base chart
+    hours = (
+        alt.Chart(hours_data)
+        .mark_line()
+        .transform_filter(
+            month_selection & weather_selection & vehicle_selection & day_selection
+        )
+        .transform_aggregate(
+            groupby=["HOUR", "CRASH HOUR", "LOCATION AT HOUR", "BOROUGH"],
+            sumValid="sum(VALID):Q",
+        )
+        # Fill in missing values
+        .transform_impute(
+            impute="sumValid",
+            key="HOUR",
+            keyvals=list(range(24)),
+            value=0,
+            frame=[-1, 1],
+            groupby=["BOROUGH"],
+        )
+        .encode(
+            x=alt.X(
+                "HOUR:Q",
+                axis=alt.Axis(title="Hour", labelAngle=0),
+                scale=alt.Scale(domain=[0, 23]),
             ),
-        ),
-        # Fixes weird bug in streamlit
-        tooltip=alt.value(None),
+            y=alt.Y(
+                "sumValid:Q",
+                axis=alt.Axis(title="Collisions"),
+            ),
+            opacity=alt.condition(ny_map_selection, alt.value(1), alt.value(0.2)),
+            color=alt.Color(
+                "BOROUGH:N",
+                legend=None,  # alt.Legend(title="Borough"),
+                scale=alt.Scale(
+                    range=list(colors[boroughs_colors].values()),
+                    domain=list(colors[boroughs_colors].keys()),
+                ),
+            ),
+            # Fixes weird bug in streamlit
+            tooltip=alt.value(None),
+        )
+        .properties(
+            title=[
+                "Collisions per Hour and Location (filtered by barplots and heatmap)"
+            ],
+            width=700,
+            height=300,
+        )
+        # Too laggy
+        # .interactive()
     )
-    .properties(
-        title=["Collisions per Hour and Location (filtered by barplots and heatmap)"],
-        width=700,
-        height=300,
+
+    selections = [month_selection, weather_selection, vehicle_selection]
+    selections += [day_selection]
+    # With no hour selected, the maxima over every hour
+    fields = ["MONTH", "WEATHER", "VEHICLE", "CRASH WEEKDAY", "HOUR"]
+    maxima = add_selection_table(
+        datasets,
+        "hours_maxima",
+        fields,
+        crossfilter.maxima(cube, fields, ["BOROUGH", "HOUR"]),
     )
-    # Too laggy
-    # .interactive()
-)
 
-max_values = (
-    alt.Chart(hours_df)
-    .mark_circle(opacity=0, size=50)
-    .transform_filter(
-        month_selection & weather_selection & vehicle_selection & day_selection
-    )
-    .encode(
-        x=alt.X("HOUR:Q", axis=alt.Axis(labelAngle=0), scale=alt.Scale(domain=[0, 23])),
-        y=alt.Y("sumValid:Q"),
-        color=alt.Color(
-            "BOROUGH:N",
-            scale=alt.Scale(
-                range=list(colors[boroughs_colors].values()),
-                domain=list(colors[boroughs_colors].keys()),
+    max_circle = (
+        alt.Chart(hours_data)
+        .mark_circle(opacity=0, size=50)
+        .encode(
+            x=alt.X(
+                "HOUR:Q", axis=alt.Axis(labelAngle=0), scale=alt.Scale(domain=[0, 23])
             ),
-        ),
-        opacity=alt.condition(ny_map_selection, alt.value(1), alt.value(0.2)),
-        # Fixes weird bug in streamlit
-        tooltip=alt.value(None),
-    )
-    .transform_aggregate(
-        groupby=["BOROUGH", "HOUR", "LOCATION AT HOUR"],
-        sumValid="sum(VALID):Q",
-    )
-    # ignore if no collisions, prevents labelling every
-    # data point when filtering
-    .transform_filter(alt.datum.sumValid != 0)
-    .transform_window(
-        sort=[alt.SortField(field="sumValid", order="descending")],
-        rank="rank()",
-    )
-    # only label the top ranked data point per year
-    .transform_filter(alt.datum.rank == 1)
-)
-
-# Label for max value
-max_values += (
-    alt.Chart(hours_df)
-    .mark_text(fontSize=20, clip=False, angle=(180 - 45), text="→", dy=5, dx=-15)
-    .transform_filter(
-        month_selection & weather_selection & vehicle_selection & day_selection
-    )
-    .encode(
-        x=alt.X("HOUR:Q", sort=weekdayorder, scale=alt.Scale(domain=[0, 23])),
-        y=alt.Y("sumValid:Q"),
-        color=alt.Color(
-            "BOROUGH:N",
-            legend=None,
-            scale=alt.Scale(
-                range=list(colors[boroughs_colors].values()),
-                domain=list(colors[boroughs_colors].keys()),
+            y=alt.Y("sumValid:Q"),
+            color=alt.Color(
+                "BOROUGH:N",
+                scale=alt.Scale(
+                    range=list(colors[boroughs_colors].values()),
+                    domain=list(colors[boroughs_colors].keys()),
+                ),
             ),
-        ),
-        opacity=alt.condition(ny_map_selection, alt.value(1), alt.value(0.2)),
-        # Fixes weird bug in streamlit
-        tooltip=[alt.Tooltip("LABEL:N", title=" ")],
-    )
-    .transform_aggregate(
-        groupby=["BOROUGH", "HOUR", "LOCATION AT HOUR"],
-        sumValid="sum(VALID):Q",
-    )
-    # ignore if no collisions, prevents labelling every
-    # data point when filtering
-    .transform_filter(alt.datum.sumValid != 0)
-    .transform_window(
-        sort=[alt.SortField(field="sumValid", order="descending")],
-        rank="rank()",
-    )
-    .transform_filter(alt.datum.rank == 1)
-    .transform_calculate(LABEL="'Max value'")
-)
+            opacity=alt.condition(ny_map_selection, alt.value(1), alt.value(0.2)),
+            # Fixes weird bug in streamlit
+            tooltip=alt.value(None),
+        )
+    )
+    max_values = top_rows(
+        max_circle, maxima, selections, ["BOROUGH", "HOUR", "LOCATION AT HOUR"]
+    )
+    max_values += (
+        max_circle.transform_filter(several_values(selections))
+        .transform_filter(
+            month_selection & weather_selection & vehicle_selection & day_selection
+        )
+        .transform_aggregate(
+            groupby=["BOROUGH", "HOUR", "LOCATION AT HOUR"],
+            sumValid="sum(VALID):Q",
+        )
+        # ignore if no collisions, prevents labelling every
+        # data point when filtering
+        .transform_filter(alt.datum.sumValid != 0)
+        .transform_window(
+            sort=[alt.SortField(field="sumValid", order="descending")],
+            rank="rank()",
+        )
+        # only label the top ranked data point per year
+        .transform_filter(alt.datum.rank == 1)
+    )
 
-# Rule to easily mark all values in the same hour
-hour_rule = (
-    alt.Chart(hours_df)
-    .mark_rule(color="gray", strokeDash=[10, 10])
-    .transform_filter(
-        month_selection
-        & weather_selection
-        & vehicle_selection
-        & day_selection
-        & hour_selection
+    # Label for max value
+    arrow = (
+        alt.Chart(hours_data)
+        .mark_text(fontSize=20, clip=False, angle=(180 - 45), text="→", dy=5, dx=-15)
+        .encode(
+            x=alt.X("HOUR:Q", sort=weekdayorder, scale=alt.Scale(domain=[0, 23])),
+            y=alt.Y("sumValid:Q"),
+            color=alt.Color(
+                "BOROUGH:N",
+                legend=None,
+                scale=alt.Scale(
+                    range=list(colors[boroughs_colors].values()),
+                    domain=list(colors[boroughs_colors].keys()),
+                ),
+            ),
+            opacity=alt.condition(ny_map_selection, alt.value(1), alt.value(0.2)),
+            # Fixes weird bug in streamlit
+            tooltip=[alt.Tooltip("LABEL:N", title=" ")],
+        )
     )
-    .encode(
-        x=alt.X("HOUR:Q", scale=alt.Scale(domain=[0, 23])),
+    max_values += top_rows(
+        arrow, maxima, selections, ["BOROUGH", "HOUR", "LOCATION AT HOUR"]
+    ).transform_calculate(LABEL="'Max value'")
+    max_values += (
+        arrow.transform_filter(several_values(selections))
+        .transform_filter(
+            month_selection & weather_selection & vehicle_selection & day_selection
+        )
+        .transform_aggregate(
+            groupby=["BOROUGH", "HOUR", "LOCATION AT HOUR"],
+            sumValid="sum(VALID):Q",
+        )
+        # ignore if no collisions, prevents labelling every
+        # data point when filtering
+        .transform_filter(alt.datum.sumValid != 0)
+        .transform_window(
+            sort=[alt.SortField(field="sumValid", order="descending")],
+            rank="rank()",
+        )
+        .transform_filter(alt.datum.rank == 1)
+        .transform_calculate(LABEL="'Max value'")
+    )
+
+    # Rule to easily mark all values in the same hour
+    hour_rule = (
+        alt.Chart(hours_data)
+        .mark_rule(color="gray", strokeDash=[10, 10])
+        .transform_filter(
+            month_selection
+            & weather_selection
+            & vehicle_selection
+            & day_selection
+            & hour_selection
+        )
+        .encode(
+            x=alt.X("HOUR:Q", scale=alt.Scale(domain=[0, 23])),
+        )
     )
-)
 
-# Void chart, without it, the interaction doesn't work well
-hour_rule += (
-    alt.Chart(hours_df)
-    .mark_text(opacity=0)
-    .transform_filter(
-        month_selection & weather_selection & vehicle_selection & day_selection
-    )
-    .encode(
-        x=alt.X("HOUR:Q", axis=alt.Axis(labelAngle=0), scale=alt.Scale(domain=[0, 23])),
-        y=alt.Y("sum(VALID):Q"),
-        color=alt.Color(
-            "BOROUGH:N",
-            scale=alt.Scale(
-                range=list(colors[boroughs_colors].values()),
-                domain=list(colors[boroughs_colors].keys()),
+    # Void chart, without it, the interaction doesn't work well
+    hour_rule += (
+        alt.Chart(hours_data)
+        .mark_text(opacity=0)
+        .transform_filter(
+            month_selection & weather_selection & vehicle_selection & day_selection
+        )
+        .encode(
+            x=alt.X(
+                "HOUR:Q", axis=alt.Axis(labelAngle=0), scale=alt.Scale(domain=[0, 23])
             ),
-        ),
-        # Fixes weird bug in streamlit
-        tooltip=alt.value(None),
+            y=alt.Y("sum(VALID):Q"),
+            color=alt.Color(
+                "BOROUGH:N",
+                scale=alt.Scale(
+                    range=list(colors[boroughs_colors].values()),
+                    domain=list(colors[boroughs_colors].keys()),
+                ),
+            ),
+            # Fixes weird bug in streamlit
+            tooltip=alt.value(None),
+        )
+        .add_params(hour_selection)
     )
-    .add_params(hour_selection)
-)
 
-# Circle mark on max value in selected hour
-hour_rule += (
-    alt.Chart(hours_df)
-    .mark_circle(size=50)
-    .transform_filter(
-        month_selection
-        & weather_selection
-        & vehicle_selection
-        & day_selection
-        & hour_selection
-    )
-    .encode(
-        x=alt.X("HOUR:Q", scale=alt.Scale(domain=[0, 23])),
-        y=alt.Y("sumValid:Q"),
-        color=alt.Color(
-            "BOROUGH:N",
-            scale=alt.Scale(
-                range=list(colors[boroughs_colors].values()),
-                domain=list(colors[boroughs_colors].keys()),
+    # Circle mark on max value in selected hour
+    hour_circle = (
+        alt.Chart(hours_data)
+        .mark_circle(size=50)
+        .encode(
+            x=alt.X("HOUR:Q", scale=alt.Scale(domain=[0, 23])),
+            y=alt.Y("sumValid:Q"),
+            color=alt.Color(
+                "BOROUGH:N",
+                scale=alt.Scale(
+                    range=list(colors[boroughs_colors].values()),
+                    domain=list(colors[boroughs_colors].keys()),
+                ),
             ),
-        ),
-        opacity=alt.condition(ny_map_selection, alt.value(1), alt.value(0.2)),
-        # Fixes weird bug in streamlit
-        tooltip=alt.value(None),
+            opacity=alt.condition(ny_map_selection, alt.value(1), alt.value(0.2)),
+            # Fixes weird bug in streamlit
+            tooltip=alt.value(None),
+        )
     )
-    .transform_aggregate(
-        groupby=["BOROUGH", "HOUR"],
-        sumValid="sum(VALID):Q",
+    hour_rule += top_rows(
+        hour_circle, maxima, [*selections, hour_selection], ["BOROUGH", "HOUR"]
     )
-    .transform_filter(alt.datum.sumValid != 0)
-    .transform_window(
-        sort=[alt.SortField(field="sumValid", order="descending")],
-        rank="rank()",
+    hour_rule += (
+        hour_circle.transform_filter(several_values([*selections, hour_selection]))
+        .transform_filter(
+            month_selection
+            & weather_selection
+            & vehicle_selection
+            & day_selection
+            & hour_selection
+        )
+        .transform_aggregate(
+            groupby=["BOROUGH", "HOUR"],
+            sumValid="sum(VALID):Q",
+        )
+        .transform_filter(alt.datum.sumValid != 0)
+        .transform_window(
+            sort=[alt.SortField(field="sumValid", order="descending")],
+            rank="rank()",
+        )
+        # only label the top ranked data point
+        .transform_filter(alt.datum.rank == 1)
     )
-    # only label the top ranked data point
-    .transform_filter(alt.datum.rank == 1)
-)
 
-# Adds tooltip to each point in data, note that if more than
-# one borough has the same value, it will show them all
-tooltip = (
-    alt.Chart(hours_df)
-    .mark_circle(opacity=0, size=50)
-    .transform_filter(
-        month_selection & weather_selection & vehicle_selection & day_selection
-    )
-    .encode(
-        x=alt.X("HOUR:Q", axis=alt.Axis(labelAngle=0), scale=alt.Scale(domain=[0, 23])),
-        y=alt.Y("sumValid:Q"),
-        opacity=alt.value(0),
-        tooltip=[
-            alt.Tooltip("first_bo:N", title="Boroughs"),
-            alt.Tooltip("sec_bo:N", title=" "),
-            alt.Tooltip("thi_bo:N", title=" "),
-            alt.Tooltip("fo_bo:N", title=" "),
-            alt.Tooltip("fi_bo:N", title=" "),
-            alt.Tooltip("CRASH HOUR:N", title="Hour"),
-            alt.Tooltip("COL:Q", title="Collisions"),
-        ],
+    # Adds tooltip to each point in data, listing every borough with the
+    # same value at that hour
+    ties = add_selection_table(
+        datasets,
+        "hour_ties",
+        fields[:-1],
+        crossfilter.selection_hour_ties(cube, fields[:-1]),
     )
-    .transform_aggregate(
-        groupby=["HOUR", "CRASH HOUR", "BOROUGH"],
-        sumValid="sum(VALID):Q",
+    points = (
+        alt.Chart(hours_data)
+        .mark_circle(opacity=0, size=50)
+        .encode(
+            x=alt.X(
+                "HOUR:Q", axis=alt.Axis(labelAngle=0), scale=alt.Scale(domain=[0, 23])
+            ),
+            y=alt.Y("sumValid:Q"),
+            opacity=alt.value(0),
+            tooltip=[
+                alt.Tooltip("BOROUGHS:N", title="Boroughs"),
+                alt.Tooltip("CRASH HOUR:N", title="Hour"),
+                alt.Tooltip("sumValid:Q", title="Collisions"),
+            ],
+        )
     )
-    .transform_aggregate(
-        groupby=["HOUR", "CRASH HOUR", "sumValid"],
-        VALUES="values(BOROUGH):N",
-        COUNT="count():Q",
-        COL="max(sumValid)",
+    # Only the ties are shipped, looked up by the number of the selections,
+    # the hour and the number of collisions of every point
+    number = selection_number(ties, selections)
+    radix = crossfilter.radix(cube, ties.fields)
+    tooltip = (
+        points.transform_filter(f"!({several_values(selections)})")
+        .transform_filter(
+            month_selection & weather_selection & vehicle_selection & day_selection
+        )
+        .transform_aggregate(
+            groupby=["HOUR", "CRASH HOUR", "BOROUGH"],
+            sumValid="sum(VALID):Q",
+        )
+        .transform_filter(alt.datum.sumValid > 0)
+        .transform_calculate(
+            KEY=f"{number} + {radix} * (datum.HOUR + 24 * datum.sumValid)"
+        )
+        .transform_lookup(
+            lookup="KEY",
+            from_=alt.LookupData(data=ties.data, key="KEY", fields=ties.columns),
+        )
+        .transform_calculate(
+            BOROUGHS="isValid(datum.BOROUGHS) ? datum.BOROUGHS : datum.BOROUGH"
+        )
     )
-    .transform_calculate(
-        first_bo="datum.VALUES[0].BOROUGH",
-        sec_bo="datum.COUNT > 1 ? datum.VALUES[1].BOROUGH : ''",
-        thi_bo="datum.COUNT > 2 ? datum.VALUES[2].BOROUGH : ''",
-        fo_bo="datum.COUNT > 3 ? datum.VALUES[3].BOROUGH : ''",
-        fi_bo="datum.COUNT > 4 ? datum.VALUES[4].BOROUGH : ''",
+    tooltip += (
+        points.transform_filter(several_values(selections))
+        .transform_filter(
+            month_selection & weather_selection & vehicle_selection & day_selection
+        )
+        .transform_aggregate(
+            groupby=["HOUR", "CRASH HOUR", "BOROUGH"],
+            sumValid="sum(VALID):Q",
+        )
+        .transform_filter(alt.datum.sumValid > 0)
+        .transform_aggregate(
+            groupby=["HOUR", "CRASH HOUR", "sumValid"],
+            VALUES="values(BOROUGH):N",
+        )
+        .transform_calculate(BOROUGHS="join(pluck(datum.VALUES, 'BOROUGH'), ', ')")
     )
-)
 
-hours = hours + max_values + hour_rule + tooltip
+    hours = hours + max_values + hour_rule + tooltip
+    return hours
 
 
 ###### SCATTER
 
-factor_df = (
-    collisions.groupby(
-        [
-            "CRASH DAY",
-            "CRASH WEEKDAY",
-            "MONTH",
-            "VEHICLE",
-            "WEATHER",
-            "BOROUGH",
-            "ORIGINAL FACTOR",
-            "FACTOR",
-        ]
-    )
-    .agg(
-        {
-            "VALID": "sum",
-            "NUMBER OF PERSONS INJURED": "sum",
-            "NUMBER OF PERSONS KILLED": "sum",
-        }
-    )
-    .reset_index()
-)
-
 factor_selection = alt.selection_point(fields=["ORIGINAL FACTOR"], empty=True)
 
-factors = (
-    alt.Chart(factor_df)
-    .mark_circle(color=colors[primary], size=125, opacity=1)
-    .transform_filter(month_selection & weather_selection & vehicle_selection)
-    .transform_aggregate(
-        sumValid="sum(VALID):Q",
-        sumInjured="sum(NUMBER OF PERSONS INJURED):Q",
-        groupby=["ORIGINAL FACTOR", "BOROUGH"],
+
+def factors_chart(datasets: SharedData):
+    factor_df = cube.rollup(
+        ["MONTH", "VEHICLE", "WEATHER", "BOROUGH", "ORIGINAL FACTOR", "FACTOR"],
+        ["VALID", "NUMBER OF PERSONS INJURED", "NUMBER OF PERSONS KILLED"],
     )
-    .transform_calculate(
-        INJURED_PER_COLLISION="datum['sumInjured'] / datum['sumValid']"
+    factor_data = datasets.add("factors", factor_df)
+
+    factors = (
+        alt.Chart(factor_data)
+        .mark_circle(color=colors[primary], size=125, opacity=1)
+        .transform_filter(month_selection & weather_selection & vehicle_selection)
+        .transform_aggregate(
+            sumValid="sum(VALID):Q",
+            sumInjured="sum(NUMBER OF PERSONS INJURED):Q",
+            groupby=["ORIGINAL FACTOR", "BOROUGH"],
+        )
+        .transform_calculate(
+            INJURED_PER_COLLISION="datum['sumInjured'] / datum['sumValid']"
+        )
+        .encode(
+            x=alt.X(
+                "INJURED_PER_COLLISION:Q",
+                axis=alt.Axis(title="Average injuries per collision", tickCount=10),
+            ),
+            y=alt.Y("sumValid:Q", axis=alt.Axis(title="Collisions")),
+            color=alt.condition(
+                ny_map_selection & factor_selection,
+                alt.Color(
+                    "BOROUGH:N",
+                    legend=alt.Legend(title="Borough"),
+                    scale=alt.Scale(
+                        range=list(colors[boroughs_colors].values()),
+                        domain=list(colors[boroughs_colors].keys()),
+                    ),
+                ),
+                alt.value("lightgray"),
+            ),
+            tooltip=[
+                alt.Tooltip("ORIGINAL FACTOR:N", title="Factor"),
+                alt.Tooltip("sumValid:Q", title="Collisions"),
+                alt.Tooltip(
+                    "INJURED_PER_COLLISION:Q", title="Average injuries per collision"
+                ),
+            ],
+        )
+        .properties(
+            title=["Driving infractions and their danger", "(filtered by barplots)"],
+            width=700,
+            height=300,
+        )
+        .add_params(factor_selection)
+        # Too laggy
+        # .interactive()
+    )
+    return factors
+
+
+###### SERVER-SIDE FILTERING
+
+# Alternative to the charts above: selections are sent back to Python as
+# Streamlit events, data is filtered and aggregated from the cube, and each
+# chart only receives the rows it draws.
+
+
+def server_selection(param: str, selections: crossfilter.Selections):
+    field = crossfilter.PARAMS[param]
+    return alt.selection_point(
+        name=param,
+        fields=[field],
+        value=[{field: value} for value in selections[param]] or alt.Undefined,
+        empty=True,
     )
-    .encode(
+
+
+def server_bars(
+    chart: str,
+    field: str,
+    order: list,
+    title: list,
+    param: str,
+    selections: crossfilter.Selections,
+    emoji: str = None,
+):
+    selection = server_selection(param, selections)
+    df = crossfilter.bars(cube, chart, selections)
+    base = alt.Chart(df).encode(
         x=alt.X(
-            "INJURED_PER_COLLISION:Q",
-            axis=alt.Axis(title="Average injuries per collision", tickCount=10),
-        ),
-        y=alt.Y("sumValid:Q", axis=alt.Axis(title="Collisions")),
-        color=alt.condition(
-            ny_map_selection & factor_selection,
-            alt.Color(
-                "BOROUGH:N",
-                legend=alt.Legend(title="Borough"),
-                scale=alt.Scale(
-                    range=list(colors[boroughs_colors].values()),
-                    domain=list(colors[boroughs_colors].keys()),
-                ),
+            f"{field}:N",
+            sort=order,
+            axis=alt.Axis(
+                title=field.capitalize(),
+                labelAngle=0,
+                labels=emoji is None,
+                domain=emoji is None,
+                ticks=emoji is None,
+                grid=False,
             ),
-            alt.value("lightgray"),
+            scale=alt.Scale(domain=order),
         ),
+        y=alt.Y("VALID:Q", axis=alt.Axis(title="Collisions")),
+        opacity=alt.condition(selection, alt.value(1), alt.value(0.2)),
         tooltip=[
-            alt.Tooltip("ORIGINAL FACTOR:N", title="Factor"),
-            alt.Tooltip("sumValid:Q", title="Collisions"),
-            alt.Tooltip(
-                "INJURED_PER_COLLISION:Q", title="Average injuries per collision"
-            ),
+            alt.Tooltip(f"{field}:N", title=field.capitalize()),
+            alt.Tooltip("VALID:Q", title="Collisions"),
         ],
     )
-    .properties(
-        title=["Driving infractions and their danger", "(filtered by barplots)"],
+    bars = base.mark_bar(color=colors[primary])
+    if emoji is not None:
+        bars += base.mark_text(size=18, align="center", dy=-8).encode(
+            text=alt.Text(f"{emoji}:N")
+        )
+    return bars.add_params(selection).properties(
+        title=alt.Title(title, dy=-0), height=175
+    )
+
+
+def server_map(selections: crossfilter.Selections):
+    selection = server_selection("borough", selections)
+    df = crossfilter.boroughs(cube, map_data, selections)
+    boroughs = (
+        alt.Chart(df)
+        .mark_geoshape(stroke="gray")
+        .project(type="albersUsa")
+        .transform_lookup(
+            lookup="BOROUGH",
+            from_=alt.LookupData(
+                data=map_data_st,
+                key="properties.BOROUGH",
+                fields=["geometry", "type"],
+            ),
+        )
+        .encode(
+            color=alt.condition(
+                selection,
+                alt.Color(
+                    "COLLISIONS_KM2:Q",
+                    scale=alt.Scale(scheme=colors[schema], type="log"),
+                    legend=alt.Legend(title=["Collisions per km2", "(log scale)"]),
+                ),
+                alt.value("lightgray"),
+            ),
+            tooltip=[
+                alt.Tooltip("BOROUGH:N", title="Borough"),
+                alt.Tooltip("COLLISIONS_KM2:Q", title="Collisions per km2"),
+                alt.Tooltip("sumCollisions:Q", title="Collisions"),
+            ],
+        )
+        .add_params(selection)
+    )
+    background = (
+        alt.Chart(map_data_st)
+        .mark_geoshape(stroke="gray")
+        .encode(
+            color=alt.condition(selection, alt.value("white"), alt.value("lightgray")),
+            tooltip=[alt.Tooltip("properties.BOROUGH:N", title="Borough")],
+        )
+    )
+    return (background + boroughs).properties(
+        title=["NYC Boroughs", "(filtered by barplots)"], width=400, height=350
+    )
+
+
+def server_weekdays(selections: crossfilter.Selections):
+    selection = server_selection("day", selections)
+    df = crossfilter.weekdays(cube, selections)
+    x = alt.X(
+        "CRASH WEEKDAY:O",
+        title="Day of week",
+        sort=weekdayorder,
+        axis=alt.Axis(labelAngle=0),
+    )
+    y = alt.Y("CRASH WEEK NUMBER:O", title="Week of year")
+    grid = (
+        alt.Chart(crossfilter.weekdays_grid(cube, selections))
+        .mark_rect(color="white", stroke="grey", strokeWidth=0.5)
+        .encode(
+            x=x,
+            y=y,
+            tooltip=[alt.Tooltip("CRASH DAY:O", title="Day")],
+            opacity=alt.condition(selection, alt.value(0.05), alt.value(0)),
+        )
+    )
+    cells = (
+        alt.Chart(df)
+        .mark_rect()
+        .encode(
+            x=x,
+            y=y,
+            color=alt.Color(
+                "sumValid:Q", scale=alt.Scale(scheme=colors[schema]), title="Collisions"
+            ),
+            opacity=alt.condition(selection, alt.value(1), alt.value(0.2)),
+            tooltip=[
+                alt.Tooltip("CRASH DAY:O", title="Crash day"),
+                alt.Tooltip("sumValid:Q", title="Collisions"),
+            ],
+        )
+        .add_params(selection)
+    )
+    maximum = (
+        alt.Chart(df[df["MAX"]].assign(LABEL="Max value"))
+        .mark_text(align="center", text="*", color="white", dy=3, size=15)
+        .encode(
+            x=alt.X("CRASH WEEKDAY:O", sort=weekdayorder),
+            y=alt.Y("CRASH WEEK NUMBER:O"),
+            tooltip=[alt.Tooltip("LABEL:N", title=" ")],
+        )
+    )
+    return (grid + cells + maximum).properties(
+        title=["Collisions per Week and Weekday", "(filtered by barplots and map)"],
+        width=300,
+        height=300,
+    )
+
+
+def server_hours(selections: crossfilter.Selections):
+    df = crossfilter.hours(cube, selections)
+    x = alt.X(
+        "HOUR:Q",
+        axis=alt.Axis(title="Hour", labelAngle=0),
+        scale=alt.Scale(domain=[0, 23]),
+    )
+    color = alt.Color(
+        "BOROUGH:N",
+        legend=None,
+        scale=alt.Scale(
+            range=list(colors[boroughs_colors].values()),
+            domain=list(colors[boroughs_colors].keys()),
+        ),
+    )
+    # Borough highlighting is resolved server-side into the ACTIVE flag
+    opacity = alt.condition(alt.datum.ACTIVE, alt.value(1), alt.value(0.2))
+    lines = (
+        alt.Chart(df)
+        .mark_line()
+        .encode(
+            x=x,
+            y=alt.Y("sumValid:Q", axis=alt.Axis(title="Collisions")),
+            color=color,
+            opacity=opacity,
+            tooltip=alt.value(None),
+        )
+    )
+    maximum = alt.Chart(df[df["MAX"]].assign(LABEL="Max value")).encode(
+        x=x, y="sumValid:Q", color=color, opacity=opacity
+    )
+    maximum = maximum.mark_circle(size=50, opacity=0) + maximum.mark_text(
+        fontSize=20, clip=False, angle=(180 - 45), text="→", dy=5, dx=-15
+    ).encode(tooltip=[alt.Tooltip("LABEL:N", title=" ")])
+    rule = (
+        alt.Chart(df)
+        .mark_rule(color="gray", strokeDash=[10, 10])
+        .encode(x=x, opacity=alt.condition(hour_selection, alt.value(1), alt.value(0)))
+        .add_params(hour_selection)
+    )
+    tooltip = (
+        alt.Chart(crossfilter.hour_ties(df))
+        .mark_circle(opacity=0, size=50)
+        .encode(
+            x=x,
+            y="sumValid:Q",
+            tooltip=[
+                alt.Tooltip("BOROUGHS:N", title="Boroughs"),
+                alt.Tooltip("CRASH HOUR:N", title="Hour"),
+                alt.Tooltip("sumValid:Q", title="Collisions"),
+            ],
+        )
+    )
+    return (lines + maximum + rule + tooltip).properties(
+        title=["Collisions per Hour and Location (filtered by barplots and heatmap)"],
         width=700,
         height=300,
     )
-    .add_params(factor_selection)
-    # Too laggy
-    # .interactive()
-)
+
+
+def server_factors(selections: crossfilter.Selections):
+    selection = server_selection("factor", selections)
+    return (
+        alt.Chart(crossfilter.factors(cube, selections))
+        .mark_circle(color=colors[primary], size=125, opacity=1)
+        .encode(
+            x=alt.X(
+                "INJURED_PER_COLLISION:Q",
+                axis=alt.Axis(title="Average injuries per collision", tickCount=10),
+            ),
+            y=alt.Y("sumValid:Q", axis=alt.Axis(title="Collisions")),
+            color=alt.condition(
+                selection & alt.datum.ACTIVE,
+                alt.Color(
+                    "BOROUGH:N",
+                    legend=alt.Legend(title="Borough"),
+                    scale=alt.Scale(
+                        range=list(colors[boroughs_colors].values()),
+                        domain=list(colors[boroughs_colors].keys()),
+                    ),
+                ),
+                alt.value("lightgray"),
+            ),
+            tooltip=[
+                alt.Tooltip("ORIGINAL FACTOR:N", title="Factor"),
+                alt.Tooltip("sumValid:Q", title="Collisions"),
+                alt.Tooltip(
+                    "INJURED_PER_COLLISION:Q", title="Average injuries per collision"
+                ),
+            ],
+        )
+        .add_params(selection)
+        .properties(
+            title=["Driving infractions and their danger", "(filtered by barplots)"],
+            width=550,
+            height=300,
+        )
+    )
+
+
+def server_charts(selections: crossfilter.Selections) -> dict:
+    return {
+        "month": server_bars(
+            "months",
+            "MONTH",
+            month_order,
+            ["Collisions per Month", "(filtered by vehicle and weather)"],
+            "month",
+            selections,
+        ).properties(width=355),
+        "weather": server_bars(
+            "weather",
+            "WEATHER",
+            weather_order,
+            ["Collisions per Weather", "(filtered by month and vehicle)"],
+            "weather",
+            selections,
+            emoji="WEATHER EMOJI",
+        ).properties(width=315),
+        "vehicle": server_bars(
+            "vehicles",
+            "VEHICLE",
+            vehicle_order,
+            ["Collisions per Vehicle", "(filtered by month and weather)"],
+            "vehicle",
+            selections,
+            emoji="VEHICLE EMOJI",
+        ).properties(width=315),
+        "borough": server_map(selections),
+        "factor": server_factors(selections),
+        "day": server_weekdays(selections),
+        "hours": server_hours(selections),
+    }
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def get_server_side_specs(
+    version: str, year: int, selections: crossfilter.Selections
+) -> dict:
+    # Selections already seen, including going back to an earlier one, cost
+    # no filtering nor chart building
+    return {
+        key: shared_data.to_arrow(chart.to_dict())
+        for key, chart in server_charts(selections).items()
+    }
+
+
+def server_side_dashboard() -> None:
+    specs = get_server_side_specs(
+        version, year, crossfilter.read_selections(st.session_state)
+    )
+    layout = [["month", "weather", "vehicle"], ["borough", "factor"], ["day", "hours"]]
+    for row in layout:
+        for key, column in zip(row, st.columns(len(row))):
+            with column:
+                if key in crossfilter.PARAMS:
+                    st.vega_lite_chart(
+                        specs[key],
+                        use_container_width=False,
+                        theme=None,
+                        key=key,
+                        on_select="rerun",
+                        selection_mode=key,
+                    )
+                else:
+                    st.vega_lite_chart(
+                        specs[key], use_container_width=False, theme=None
+                    )
+
+
+def client_side_chart(datasets: SharedData):
+    months, vehicles, weather = bar_charts(datasets)
+    ny_map_st = map_charts(datasets)
+    weekdays = weekdays_chart(datasets)
+    hours = hours_chart(datasets)
+    factors = factors_chart(datasets)
+    return (
+        months.properties(width=355)
+        | weather.properties(width=315)
+        | vehicles.properties(width=315)
+    ) & (
+        (
+            ny_map_st.properties(width=400, height=350)
+            | factors.properties(width=550, height=300)
+        )
+        & (weekdays | hours.properties(width=700))
+    )
+
+
+def client_side_spec():
+    # Every DataFrame is shipped once, however many layers draw it
+    datasets = SharedData()
+    return datasets.attach(client_side_chart(datasets).to_dict())
+
+
+@st.cache_resource(show_spinner="Building charts...")
+def get_client_side_spec(version: str, year: int):
+    # Built once per data version and year, and shared by every rerun and
+    # session, with its data already in the format Streamlit sends it in
+    return shared_data.to_arrow(client_side_spec())
 
 
 if __name__ == "__main__":
@@ -784,24 +1307,20 @@ if __name__ == "__main__":
         st.markdown(
             "Interactions take longer than desired, especially those that filter."
         )
+        server_side = st.toggle(
+            "Server-side filtering",
+            help="Filter and aggregate in Python, sending each chart only the rows it draws.",
+        )
         st.markdown("---")
         st.markdown("☕")
 
-    st.header("📊 New York City Collisions (Summer 2018)")
+    summer = all(6 <= month <= 9 for _, month in months)
+    period = f"Summer {year}" if summer else str(year)
+    st.header(f"📊 New York City Collisions ({period})")
 
-    st.altair_chart(
-        (
-            months.properties(width=355)
-            | weather.properties(width=315)
-            | vehicles.properties(width=315)
-        )
-        & (
-            (
-                ny_map_st.properties(width=400, height=350)
-                | factors.properties(width=550, height=300)
-            )
-            & (weekdays | hours.properties(width=700))
-        ),
-        use_container_width=False,
-        theme=None,
-    )
+    if server_side:
+        server_side_dashboard()
+    else:
+        st.vega_lite_chart(
+            get_client_side_spec(version, year), use_container_width=False, theme=None
+        )
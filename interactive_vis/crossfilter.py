@@ -0,0 +1,226 @@
+import itertools
+from typing import Dict, List, Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+
+from cube import CollisionCube
+
+# Selection parameter name -> field it selects on. Every server-side chart is
+# keyed in Streamlit by the name of the parameter it owns.
+PARAMS = {
+    "month": "MONTH",
+    "vehicle": "VEHICLE",
+    "weather": "WEATHER",
+    "borough": "BOROUGH",
+    "day": "CRASH WEEKDAY",
+    "factor": "ORIGINAL FACTOR",
+}
+
+# Same default as day_selection in the client-side dashboard
+DEFAULTS = {"day": ["Mon"]}
+
+# Selections filtering each chart, mirroring the transform_filter chains of
+# the client-side dashboard
+FILTERS = {
+    "months": ["vehicle", "weather"],
+    "vehicles": ["month", "weather"],
+    "weather": ["month", "vehicle"],
+    "map": ["month", "weather", "vehicle"],
+    "weekdays": ["month", "weather", "vehicle", "borough"],
+    "weekdays_empty": ["month"],
+    "hours": ["month", "weather", "vehicle", "day"],
+    "factors": ["month", "weather", "vehicle"],
+}
+
+Selections = Dict[str, List]
+
+
+def read_selections(state: Mapping) -> Selections:
+    """Selected values per parameter, from the Streamlit chart events."""
+    selections = {}
+    for param, field in PARAMS.items():
+        event = state.get(param)
+        if event is None:
+            selections[param] = DEFAULTS.get(param, [])
+            continue
+        points = event["selection"].get(param, [])
+        selections[param] = [point[field] for point in points if field in point]
+    return selections
+
+
+def _where(chart: str, selections: Selections) -> Dict[str, List]:
+    return {
+        PARAMS[param]: selections[param]
+        for param in FILTERS[chart]
+        if selections.get(param)
+    }
+
+
+def bars(cube: CollisionCube, chart: str, selections: Selections) -> pd.DataFrame:
+    by = {
+        "months": ["MONTH"],
+        "vehicles": ["VEHICLE", "VEHICLE EMOJI"],
+        "weather": ["WEATHER", "WEATHER EMOJI"],
+    }[chart]
+    return cube.rollup(by, ["VALID"], where=_where(chart, selections))
+
+
+def boroughs(
+    cube: CollisionCube, areas: pd.DataFrame, selections: Selections
+) -> pd.DataFrame:
+    df = cube.rollup(["BOROUGH"], ["VALID"], where=_where("map", selections))
+    df = df.rename(columns={"VALID": "sumCollisions"})
+    df = df.merge(areas[["BOROUGH", "AREA_KM2"]], on="BOROUGH", how="left")
+    df["COLLISIONS_KM2"] = df["sumCollisions"] / df["AREA_KM2"]
+    return df
+
+
+def weekdays(cube: CollisionCube, selections: Selections) -> pd.DataFrame:
+    df = cube.rollup(
+        ["CRASH DAY", "CRASH WEEKDAY", "CRASH WEEK NUMBER"],
+        ["VALID"],
+        where=_where("weekdays", selections),
+    ).rename(columns={"VALID": "sumValid"})
+    df["MAX"] = _is_max(df["sumValid"])
+    return df
+
+
+def weekdays_grid(cube: CollisionCube, selections: Selections) -> pd.DataFrame:
+    df = cube.rollup(
+        ["CRASH DAY", "CRASH WEEKDAY", "CRASH WEEK NUMBER"],
+        ["VALID"],
+        where=_where("weekdays_empty", selections),
+    )
+    return df.drop(columns="VALID")
+
+
+def hours(cube: CollisionCube, selections: Selections) -> pd.DataFrame:
+    df = cube.rollup(
+        ["BOROUGH", "HOUR"], ["VALID"], where=_where("hours", selections)
+    ).rename(columns={"VALID": "sumValid"})
+
+    # Same as the transform_impute of the client-side line chart
+    grid = pd.MultiIndex.from_product(
+        [df["BOROUGH"].unique(), range(24)], names=["BOROUGH", "HOUR"]
+    )
+    df = (
+        df.set_index(["BOROUGH", "HOUR"])
+        .reindex(grid, fill_value=0)
+        .reset_index()
+        .astype({"HOUR": int})
+    )
+    df["CRASH HOUR"] = df["HOUR"].map("{:02d}:00H".format)
+    df["MAX"] = _is_max(df["sumValid"])
+    df["ACTIVE"] = _is_selected(df["BOROUGH"], selections["borough"])
+    return df
+
+
+def hour_ties(hours_df: pd.DataFrame, keys: Sequence[str] = ()) -> pd.DataFrame:
+    """Boroughs sharing the same number of collisions at each hour (and keys)."""
+    # Joined as plain strings, much faster than as categories
+    return (
+        hours_df[hours_df["sumValid"] > 0]
+        .astype({"BOROUGH": object})
+        .groupby([*keys, "HOUR", "CRASH HOUR", "sumValid"], observed=True)["BOROUGH"]
+        .agg(", ".join)
+        .reset_index(name="BOROUGHS")
+    )
+
+
+def factors(cube: CollisionCube, selections: Selections) -> pd.DataFrame:
+    df = cube.rollup(
+        ["ORIGINAL FACTOR", "BOROUGH"],
+        ["VALID", "NUMBER OF PERSONS INJURED"],
+        where=_where("factors", selections),
+    ).rename(columns={"VALID": "sumValid", "NUMBER OF PERSONS INJURED": "sumInjured"})
+    df["INJURED_PER_COLLISION"] = df["sumInjured"] / df["sumValid"]
+    df["ACTIVE"] = _is_selected(df["BOROUGH"], selections["borough"])
+    return df
+
+
+def maxima(cube: CollisionCube, fields: List[str], by: List[str]) -> pd.DataFrame:
+    """
+    Most collisions (MAX) of any row of `by`, when not zero, for every
+    selection on `fields`, one row per selection keyed by its number as
+    `by_selection` numbers it. The client-side markers compare their own sums
+    against it instead of ranking them.
+    """
+    df = by_selection(cube, fields, by)
+    df = df[df["sumValid"] != 0].groupby("KEY", as_index=False)["sumValid"].max()
+    return _compact(df.rename(columns={"sumValid": "MAX"}))
+
+
+def selection_hour_ties(cube: CollisionCube, fields: List[str]) -> pd.DataFrame:
+    """
+    Boroughs sharing the same number of collisions at an hour, only where
+    several do, for every selection on `fields`: one row per tie, keyed by
+    number + radix(cube, fields) * (HOUR + 24 * sumValid), with number the
+    number of the selection as `by_selection` numbers it.
+    """
+    df = by_selection(cube, fields, ["BOROUGH", "HOUR"])
+    # Joined as plain strings, much faster than as categories
+    df = df[df["sumValid"] > 0].astype({"BOROUGH": object})
+    boroughs = df.groupby(["KEY", "HOUR", "sumValid"])["BOROUGH"]
+    ties = boroughs.agg(", ".join)[boroughs.size() > 1].reset_index(name="BOROUGHS")
+    ties["KEY"] += radix(cube, fields) * (ties["HOUR"] + 24 * ties["sumValid"])
+    return _compact(ties[["KEY", "BOROUGHS"]])
+
+
+def radix(cube: CollisionCube, fields: List[str]) -> int:
+    """Number of selections on `fields` with at most one value per field."""
+    return int(np.prod([len(cube.values(field)) + 1 for field in fields]))
+
+
+def by_selection(cube: CollisionCube, fields: List[str], by: List[str]) -> pd.DataFrame:
+    """
+    Collisions (sumValid) per row of `by` for every selection on `fields` with
+    at most one value per field, keyed by the number of the selection: the
+    sum of code * radix over `fields`, where code is 0 for an empty selection
+    and 1 + the position of its value in cube.values(field), and radix is the
+    product of len(cube.values(field)) + 1 of the fields before.
+    """
+    df = cube.rollup(list(dict.fromkeys([*fields, *by])), ["VALID"])
+    radix = 1
+    codes = []
+    for field in fields:
+        values = cube.values(field)
+        codes.append((values.get_indexer(df[field]) + 1) * radix)
+        radix *= len(values) + 1
+
+    # Sums over every combination of filtered and unfiltered fields
+    frames = []
+    for filtered in itertools.product((False, True), repeat=len(fields)):
+        key = sum(code for code, used in zip(codes, filtered) if used)
+        frames.append(
+            df[by + ["VALID"]]
+            .assign(KEY=key)
+            .groupby(["KEY", *by], observed=True, dropna=False)["VALID"]
+            .sum()
+            .reset_index()
+        )
+    return pd.concat(frames, ignore_index=True).rename(columns={"VALID": "sumValid"})
+
+
+def _compact(df: pd.DataFrame) -> pd.DataFrame:
+    # Smallest integers holding them and repeated strings as categoricals, the
+    # table is sent to every session
+    for column in df.select_dtypes("integer").columns:
+        df[column] = pd.to_numeric(df[column], downcast="integer")
+    for column in df.select_dtypes(["object", "string"]).columns:
+        df[column] = df[column].astype("category")
+    return df
+
+
+def _is_max(values: pd.Series) -> np.ndarray:
+    # Same as rank() == 1 over non-zero values, ties included
+    if values.empty:
+        return np.zeros(0, dtype=bool)
+    return ((values == values.max()) & (values != 0)).to_numpy()
+
+
+def _is_selected(values: pd.Series, selected: List) -> np.ndarray:
+    # Empty selections select everything, like empty=True on the client
+    if not selected:
+        return np.ones(len(values), dtype=bool)
+    return values.isin(selected).to_numpy()
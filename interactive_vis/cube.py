@@ -0,0 +1,166 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+AXES = [
+    "MONTH",
+    "VEHICLE",
+    "WEATHER",
+    "BOROUGH",
+    "CRASH DAY",
+    "HOUR",
+    "ORIGINAL FACTOR",
+]
+
+MEASURES = ["VALID", "NUMBER OF PERSONS INJURED", "NUMBER OF PERSONS KILLED"]
+
+# Columns that are fully determined by one or more axes, so they never need
+# their own axis: they are looked up after rolling up their parents.
+ATTRIBUTES = {
+    "VEHICLE EMOJI": ("VEHICLE",),
+    "WEATHER EMOJI": ("WEATHER",),
+    "CRASH WEEKDAY": ("CRASH DAY",),
+    "CRASH WEEK NUMBER": ("CRASH DAY",),
+    "DAY": ("CRASH DAY",),
+    "CRASH HOUR": ("HOUR",),
+    "LOCATION AT HOUR": ("BOROUGH", "HOUR"),
+    "FACTOR": ("ORIGINAL FACTOR",),
+}
+
+# Every column the cube reads from the processed collisions
+COLUMNS = AXES + MEASURES + list(ATTRIBUTES)
+
+
+class CollisionCube:
+    """
+    Count/sum cube over AXES, built once from the processed collisions.
+
+    Only non-empty cells are stored (one row per distinct combination of axis
+    values), so the cube is bounded by both the raw row count and the product
+    of the axis sizes. `rollup` sums out every axis not asked for and returns
+    the same frame a `groupby(...).agg("sum")` over the raw rows would.
+    """
+
+    def __init__(self, collisions: pd.DataFrame) -> None:
+        self.levels: Dict[str, pd.Index] = {}
+        codes = []
+        for axis in AXES:
+            axis_codes, levels = pd.factorize(
+                collisions[axis], sort=True, use_na_sentinel=False
+            )
+            self.levels[axis] = pd.Index(levels)
+            codes.append(axis_codes)
+        self.shape = tuple(len(self.levels[axis]) for axis in AXES)
+
+        flat = np.ravel_multi_index(codes, self.shape)
+        cells, inverse = np.unique(flat, return_inverse=True)
+        self.coords = np.stack(np.unravel_index(cells, self.shape), axis=1)
+
+        self.rows = np.bincount(inverse, minlength=len(cells))
+        self.measures = {
+            name: np.bincount(
+                inverse, weights=collisions[name].to_numpy(), minlength=len(cells)
+            ).astype(_sum_dtype(collisions[name].dtype))
+            for name in MEASURES
+        }
+
+        self.attributes = {
+            name: self._build_attribute(collisions[name], parents, codes)
+            for name, parents in ATTRIBUTES.items()
+        }
+
+    def _build_attribute(
+        self, column: pd.Series, parents: Tuple[str, ...], codes: List[np.ndarray]
+    ) -> np.ndarray:
+        positions = [AXES.index(parent) for parent in parents]
+        shape = tuple(self.shape[position] for position in positions)
+        flat = np.ravel_multi_index([codes[position] for position in positions], shape)
+        flat, first = np.unique(flat, return_index=True)
+        values = column.to_numpy()
+        lookup = np.empty(int(np.prod(shape)), dtype=object)
+        lookup[flat] = values[first]
+        return lookup
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def values(self, key: str) -> pd.Index:
+        """Distinct values of an axis or attribute, sorted, without missing ones."""
+        if key in ATTRIBUTES:
+            return pd.Index(self.attributes[key]).dropna().unique().sort_values()
+        return self.levels[key].dropna()
+
+    def _mask(self, where: Optional[Dict[str, Iterable]]) -> np.ndarray:
+        mask = np.ones(len(self), dtype=bool)
+        for key, values in (where or {}).items():
+            if key in ATTRIBUTES:
+                # Filter on the parent cells whose attribute value matches
+                parents = [AXES.index(parent) for parent in ATTRIBUTES[key]]
+                shape = tuple(self.shape[position] for position in parents)
+                allowed = np.isin(self.attributes[key], list(values))
+                flat = np.ravel_multi_index(self.coords[:, parents].T, shape)
+                mask &= allowed[flat]
+            else:
+                wanted = self.levels[key].get_indexer(list(values))
+                mask &= np.isin(self.coords[:, AXES.index(key)], wanted[wanted >= 0])
+        return mask
+
+    def rollup(
+        self,
+        by: List[str],
+        measures: Optional[List[str]] = None,
+        where: Optional[Dict[str, Iterable]] = None,
+    ) -> pd.DataFrame:
+        measures = MEASURES if measures is None else measures
+
+        axes = []
+        for key in by:
+            for axis in ATTRIBUTES.get(key, (key,)):
+                if axis not in axes:
+                    axes.append(axis)
+        positions = [AXES.index(axis) for axis in axes]
+        shape = tuple(self.shape[position] for position in positions)
+
+        mask = self._mask(where)
+        coords = self.coords[mask][:, positions]
+        flat = np.ravel_multi_index(coords.T, shape)
+        cells, inverse = np.unique(flat, return_inverse=True)
+        cell_coords = np.unravel_index(cells, shape)
+
+        # groupby drops missing keys, so cells with a NaN level do as well
+        keep = np.ones(len(cells), dtype=bool)
+        for axis, axis_coords in zip(axes, cell_coords):
+            keep &= self.levels[axis][axis_coords].notna()
+
+        df = pd.DataFrame(
+            {
+                axis: self.levels[axis][axis_coords[keep]]
+                for axis, axis_coords in zip(axes, cell_coords)
+            }
+        )
+        for key in by:
+            if key in ATTRIBUTES:
+                parents = ATTRIBUTES[key]
+                parent_coords = [cell_coords[axes.index(parent)] for parent in parents]
+                parent_shape = tuple(
+                    self.shape[AXES.index(parent)] for parent in parents
+                )
+                lookup = self.attributes[key][
+                    np.ravel_multi_index(parent_coords, parent_shape)
+                ]
+                df[key] = pd.Series(lookup[keep]).infer_objects()
+        for name in measures:
+            sums = np.bincount(
+                inverse, weights=self.measures[name][mask], minlength=len(cells)
+            )
+            df[name] = sums[keep].astype(self.measures[name].dtype)
+
+        if set(axes) != set(by):
+            return df.groupby(by, observed=True)[measures].sum().reset_index()
+        return df[by + measures].reset_index(drop=True)
+
+
+def _sum_dtype(dtype: np.dtype) -> np.dtype:
+    # Same result dtype as a pandas sum, so narrow stored integers don't overflow
+    return np.dtype(np.int64) if np.issubdtype(dtype, np.integer) else np.dtype(float)
@@ -0,0 +1,174 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+from typing import Dict, List, Sequence
+
+import altair as alt
+import geopandas as gpd
+import numpy as np
+import topojson as tp
+
+DATA_DIR = "./processed-data"
+NAME = "map"
+
+# Served by Streamlit under app/static/ (server.enableStaticServing)
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL = "app/static"
+
+# Simplification tolerance of each level, in degrees. Arcs shared by two
+# districts are simplified once, so neighbours never drift apart.
+LEVELS = {"high": 0.0002, "medium": 0.0005, "low": 0.001}
+
+# Coordinates are snapped to a 1e5 x 1e5 grid over the map bounds (~5 m)
+QUANTIZATION = 1e5
+
+
+def topology(map_data: gpd.GeoDataFrame, tolerance: float) -> Dict:
+    return _rewind(
+        tp.Topology(
+            map_data,
+            object_name=NAME,
+            prequantize=QUANTIZATION,
+            toposimplify=tolerance,
+            presimplify=False,
+        ).to_dict()
+    )
+
+
+def _rewind(topology: Dict) -> Dict:
+    # Simplifying and snapping can collapse tiny rings into the opposite
+    # winding. Vega reads a counter-clockwise exterior ring as the whole globe
+    # minus the polygon, which paints over the entire map, so flip them back.
+    arcs = [np.cumsum(np.array(arc), axis=0) for arc in topology["arcs"]]
+    for shape in topology["objects"][NAME]["geometries"]:
+        if shape["type"] == "Polygon":
+            polygons = [shape["arcs"]]
+        elif shape["type"] == "MultiPolygon":
+            polygons = shape["arcs"]
+        else:
+            continue
+        for polygon in polygons:
+            for position, ring in enumerate(polygon):
+                clockwise = _signed_area(arcs, ring) < 0
+                if clockwise != (position == 0):
+                    polygon[position] = [~arc for arc in reversed(ring)]
+    return topology
+
+
+def _signed_area(arcs: List[np.ndarray], ring: List[int]) -> float:
+    points = np.concatenate(
+        [arcs[arc] if arc >= 0 else arcs[~arc][::-1] for arc in ring]
+    )
+    x, y = points[:, 0], points[:, 1]
+    return float(np.sum(x[:-1] * y[1:] - x[1:] * y[:-1]))
+
+
+def pick_level(width: int, height: int, bounds: Sequence[float]) -> str:
+    """Coarsest level whose tolerance stays under half a rendered pixel."""
+    min_x, min_y, max_x, max_y = bounds
+    pixel = max((max_x - min_x) / width, (max_y - min_y) / height)
+    fitting = [level for level, tolerance in LEVELS.items() if tolerance <= pixel / 2]
+    if not fitting:
+        return min(LEVELS, key=LEVELS.get)
+    return max(fitting, key=LEVELS.get)
+
+
+def path(level: str, data_dir: str = DATA_DIR) -> str:
+    return os.path.join(data_dir, f"{NAME}-{level}.topojson")
+
+
+def read_topology(
+    level: str, map_data: gpd.GeoDataFrame, data_dir: str = DATA_DIR
+) -> Dict:
+    if os.path.exists(path(level, data_dir)):
+        with open(path(level, data_dir), encoding="utf-8") as file:
+            return json.load(file)
+    # Not built yet, simplify in memory
+    return topology(map_data, LEVELS[level])
+
+
+def publish(
+    level: str,
+    map_data: gpd.GeoDataFrame,
+    data_dir: str = DATA_DIR,
+    static_dir: str = STATIC_DIR,
+) -> str:
+    """
+    Copy a level to the app's static folder under a content-hashed name and
+    return its URL. The file behind a URL never changes, so browsers can keep
+    it for as long as they like, and nothing is fetched from other origins.
+    """
+    if os.path.exists(path(level, data_dir)):
+        with open(path(level, data_dir), "rb") as file:
+            content = file.read()
+    else:
+        content = json.dumps(
+            read_topology(level, map_data, data_dir), separators=(",", ":")
+        ).encode("utf-8")
+    name = f"{NAME}-{level}.{hashlib.sha256(content).hexdigest()[:12]}.json"
+    target = os.path.join(static_dir, name)
+    if not os.path.exists(target):
+        for stale in glob.glob(os.path.join(static_dir, f"{NAME}-{level}.*.json")):
+            os.remove(stale)
+        os.makedirs(static_dir, exist_ok=True)
+        # Write then rename, so concurrent sessions never serve half a file
+        with open(f"{target}.tmp", "wb") as file:
+            file.write(content)
+        os.replace(f"{target}.tmp", target)
+    return f"{STATIC_URL}/{name}"
+
+
+def update_properties(
+    map_data: gpd.GeoDataFrame, data_dir: str = DATA_DIR
+) -> List[str]:
+    """
+    Set the properties of every built level to the columns of `map_data`,
+    shape by shape, and publish the levels again, without simplifying the
+    shapes again.
+    """
+    # As in the built levels, from the GeoJSON features
+    properties = [
+        feature["properties"] for feature in map_data.__geo_interface__["features"]
+    ]
+    updated = []
+    for level in LEVELS:
+        if not os.path.exists(path(level, data_dir)):
+            continue
+        with open(path(level, data_dir), encoding="utf-8") as file:
+            topology = json.load(file)
+        for shape, values in zip(topology["objects"][NAME]["geometries"], properties):
+            shape["properties"] = values
+        with open(f"{path(level, data_dir)}.tmp", "w", encoding="utf-8") as file:
+            json.dump(topology, file, separators=(",", ":"))
+        os.replace(f"{path(level, data_dir)}.tmp", path(level, data_dir))
+        updated.append(path(level, data_dir))
+        updated.append(publish(level, map_data, data_dir))
+    return updated
+
+
+def to_url_data(url: str) -> alt.Data:
+    return alt.Data(url=url, format=alt.DataFormat(type="topojson", feature=NAME))
+
+
+def build(source: str, data_dir: str = DATA_DIR) -> List[str]:
+    map_data = gpd.read_file(source)
+    built = []
+    for level, tolerance in LEVELS.items():
+        with open(path(level, data_dir), "w", encoding="utf-8") as file:
+            json.dump(topology(map_data, tolerance), file, separators=(",", ":"))
+        built.append(path(level, data_dir))
+        built.append(publish(level, map_data, data_dir))
+    return built
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the simplified TopoJSON levels of the borough map."
+    )
+    parser.add_argument("--source", default=os.path.join(DATA_DIR, f"{NAME}.geojson"))
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    args = parser.parse_args()
+    for built in build(args.source, args.data_dir):
+        print(built)
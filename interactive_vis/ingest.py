@@ -0,0 +1,162 @@
+import argparse
+import os
+from typing import Dict, Set
+
+import geopandas as gpd
+import pandas as pd
+import pyarrow.parquet as pq
+
+import geometry
+import pipeline
+import storage
+
+# Column of the delta marking records that are only retracted, with no new
+# version (1 or true)
+DELETED = "DELETED"
+
+
+def prepare(
+    delta: pd.DataFrame, weather: pd.DataFrame, map_geojson: str
+) -> pd.DataFrame:
+    """
+    Processed rows of the delta records, through the same stages as the full
+    pipeline, so they are exactly the rows a rebuild would give them.
+    """
+    collisions = pipeline.classify(pipeline.clean(delta))
+    collisions = pipeline.join(collisions, weather)
+    return pipeline.derive(pipeline.boroughs(map_geojson, collisions))
+
+
+def ingest(
+    delta_csv: str,
+    data_dir: str = pipeline.DATA_DIR,
+    raw_dir: str = pipeline.RAW_DIR,
+    cache_dir: str = pipeline.CACHE_DIR,
+) -> Dict[str, int]:
+    """
+    Apply a delta of new or corrected records, in the format of the raw
+    collisions with their COLLISION_ID, to the processed data. The stored
+    version of every record in the delta is retracted, its new version (if
+    any) appended, and the collisions per borough of the map are updated by
+    the difference, so only the delta goes through the pipeline stages and
+    only the months it touches are written again. Returns the rows retracted
+    and inserted, the records with no stored version (new, or retractions
+    that matched nothing) and the months written.
+    """
+    delta = pipeline.load(delta_csv)
+    if pipeline.ID not in delta:
+        raise ValueError(f"the delta has no {pipeline.ID} column")
+    delta = delta.drop_duplicates(pipeline.ID, keep="last")
+    deleted = delta.pop(DELETED) if DELETED in delta else pd.Series(False, delta.index)
+    deleted = deleted.fillna(False).astype(bool)
+
+    # Weather of the full pipeline, from its cache when it is up to date
+    weather = pipeline.Pipeline(raw_dir, data_dir, cache_dir).output("weather")
+    inserted = prepare(
+        delta[~deleted], weather, os.path.join(raw_dir, f"{geometry.NAME}.geojson")
+    )
+
+    if not os.path.isdir(os.path.join(data_dir, storage.COLLISIONS)):
+        storage.convert(data_dir)
+    months = {partition for partition, _ in storage.split(inserted)}
+    # Records processed before ids were kept can't be found again, so they
+    # can't be retracted, and new versions in their months could be
+    # corrections of them
+    unkeyed = _unkeyed(data_dir)
+    if unkeyed and (deleted.any() or months & unkeyed):
+        names = ", ".join(f"{year}-{month:02}" for year, month in sorted(unkeyed))
+        raise ValueError(
+            f"the collisions of {names} have no {pipeline.ID}, run the pipeline "
+            "again before retracting or correcting records"
+        )
+    # Only the months with new rows or stored versions of the delta's records
+    # are read and written again
+    stored = sorted(
+        _stored(delta[pipeline.ID], data_dir, unkeyed)
+        | (months & set(storage.partitions(data_dir)))
+    )
+    collisions = (
+        storage.read_collisions(data_dir=data_dir, months=stored)
+        if stored
+        else inserted.head(0)
+    )
+    stale = collisions[pipeline.ID].isin(delta[pipeline.ID]).to_numpy()
+    retracted = collisions[stale]
+    # Records of the delta with no stored version: new ones, and retractions
+    # of records that were never stored
+    missing = ~delta[pipeline.ID].isin(retracted[pipeline.ID])
+    collisions = storage.with_dtypes(
+        pd.concat([collisions[~stale], inserted], ignore_index=True)
+    )
+    written = storage.write_partitions(collisions, data_dir)
+    # Months left without collisions
+    for partition in stored:
+        if storage.partition_path(partition, data_dir) not in written:
+            os.remove(storage.partition_path(partition, data_dir))
+
+    map_path = os.path.join(data_dir, f"{geometry.NAME}.geojson")
+    map_data = gpd.read_file(map_path)
+    counts = (
+        map_data.set_index("BOROUGH")["COLLISIONS"]
+        .fillna(0)
+        .add(_boroughs(inserted), fill_value=0)
+        .sub(_boroughs(retracted), fill_value=0)
+    )
+    # Boroughs without collisions have none, as in a full run
+    map_data = pipeline.count(map_data, counts.where(counts > 0))
+    map_data.to_file(map_path, driver="GeoJSON")
+    geometry.update_properties(map_data, data_dir)
+    return {
+        "retracted": len(retracted),
+        "inserted": len(inserted),
+        "new": int((missing & ~deleted).sum()),
+        "unmatched": int((missing & deleted).sum()),
+        "months": len(written),
+    }
+
+
+def _boroughs(collisions: pd.DataFrame) -> pd.Series:
+    return collisions["BOROUGH"].astype(object).value_counts()
+
+
+def _unkeyed(data_dir: str) -> Set[storage.Partition]:
+    # Months processed before ids were kept, from their schema alone
+    unkeyed = set()
+    for partition in storage.partitions(data_dir):
+        path = storage.partition_path(partition, data_dir)
+        if pipeline.ID not in pq.read_schema(path).names:
+            unkeyed.add(partition)
+    return unkeyed
+
+
+def _stored(
+    ids: pd.Series, data_dir: str, unkeyed: Set[storage.Partition]
+) -> Set[storage.Partition]:
+    # Months holding a version of any of `ids`, from their id column alone
+    found = set()
+    for partition in set(storage.partitions(data_dir)) - unkeyed:
+        path = storage.partition_path(partition, data_dir)
+        if pd.read_parquet(path, columns=[pipeline.ID])[pipeline.ID].isin(ids).any():
+            found.add(partition)
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Apply new or corrected collision records to the processed data."
+    )
+    parser.add_argument(
+        "delta",
+        help=f"CSV of raw collisions with their {pipeline.ID}, and {DELETED} "
+        "to only retract a record",
+    )
+    parser.add_argument("--raw-dir", default=pipeline.RAW_DIR)
+    parser.add_argument("--data-dir", default=pipeline.DATA_DIR)
+    parser.add_argument("--cache-dir", default=pipeline.CACHE_DIR)
+    args = parser.parse_args()
+    try:
+        counts = ingest(args.delta, args.data_dir, args.raw_dir, args.cache_dir)
+    except ValueError as error:
+        parser.error(str(error))
+    for name, value in counts.items():
+        print(f"{name:10} {value:8}")
@@ -0,0 +1,82 @@
+import argparse
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+MAP = "./original-data/map.geojson"
+
+# First digit of a community district (boro_cd)
+BOROUGHS = {1: "Manhattan", 2: "Bronx", 3: "Brooklyn", 4: "Queens", 5: "Staten Island"}
+
+
+def locate(
+    longitude: pd.Series, latitude: pd.Series, areas: gpd.GeoDataFrame
+) -> np.ndarray:
+    """
+    Position in `areas` of the first area containing each point, -1 for points
+    outside every area or with a missing coordinate. Same result as
+    `np.where(areas.contains(Point(x, y)))[0][0]` per point, in bulk: an
+    STRtree pairs every point with the areas whose bounding box holds it, and
+    only those pairs are tested against the prepared areas.
+    """
+    x = np.asarray(longitude, dtype=float)
+    y = np.asarray(latitude, dtype=float)
+    valid = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+
+    geometries = np.array(areas.geometry.values)
+    shapely.prepare(geometries)
+    points, found = shapely.STRtree(geometries).query(
+        shapely.points(x[valid], y[valid])
+    )
+    inside = shapely.contains_xy(geometries[found], x[valid[points]], y[valid[points]])
+    points, found = points[inside], found[inside]
+
+    # A point in overlapping areas is kept in the first one, like np.where
+    order = np.lexsort((found, points))
+    points, found = points[order], found[order]
+    first = np.ones(len(points), dtype=bool)
+    first[1:] = points[1:] != points[:-1]
+
+    positions = np.full(len(x), -1, dtype=np.int64)
+    positions[valid[points[first]]] = found[first]
+    return positions
+
+
+def assign(collisions: pd.DataFrame, areas: gpd.GeoDataFrame) -> pd.DataFrame:
+    """
+    BOROUGH of every collision and, when `areas` are community districts,
+    their BORO_CD. Collisions outside the map get missing values.
+    """
+    positions = locate(collisions["LONGITUDE"], collisions["LATITUDE"], areas)
+    inside = positions >= 0
+    located = pd.DataFrame(index=collisions.index)
+    if "boro_cd" in areas:
+        codes = areas["boro_cd"].astype(int).to_numpy()[positions]
+        located["BORO_CD"] = pd.Series(codes, collisions.index, "Int64").where(inside)
+        located["BOROUGH"] = (located["BORO_CD"] // 100).map(BOROUGHS)
+    else:
+        names = areas["boro_name"].to_numpy()[positions]
+        # Typed as the names even without collisions
+        names = pd.Series(names, collisions.index, areas["boro_name"].dtype)
+        located["BOROUGH"] = names.where(inside)
+    return located
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Assign the borough of every collision from its coordinates."
+    )
+    parser.add_argument("collisions", help="CSV with LATITUDE and LONGITUDE columns")
+    parser.add_argument("--map", default=MAP)
+    parser.add_argument("--output", help="defaults to <collisions>-located.csv")
+    args = parser.parse_args()
+
+    collisions = pd.read_csv(args.collisions, low_memory=False)
+    located = assign(collisions, gpd.read_file(args.map))
+    collisions[located.columns] = located
+    output = args.output or f"{os.path.splitext(args.collisions)[0]}-located.csv"
+    collisions.to_csv(output, index=False)
+    print(output)
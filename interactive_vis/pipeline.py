@@ -0,0 +1,363 @@
+import argparse
+import hashlib
+import inspect
+import os
+import pickle
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+import geopandas as gpd
+import pandas as pd
+
+import geometry
+import locate
+import storage
+
+RAW_DIR = "./original-data"
+DATA_DIR = storage.DATA_DIR
+CACHE_DIR = "./.pipeline-cache"
+
+
+class Stage(NamedTuple):
+    function: Callable
+    # Stages whose outputs are passed to the function, in this order
+    inputs: Tuple[str, ...]
+    # Raw files, passed as paths before the inputs
+    files: Tuple[str, ...]
+    # Constants, helpers and modules the function depends on besides its own code
+    uses: Tuple[Any, ...]
+    # Whether the function writes to the data directory, passed before inputs
+    writes: bool
+
+
+STAGES: Dict[str, Stage] = {}
+
+
+def stage(
+    *inputs: str,
+    files: Sequence[str] = (),
+    uses: Sequence[Any] = (),
+    writes: bool = False,
+) -> Callable:
+    def register(function: Callable) -> Callable:
+        STAGES[function.__name__] = Stage(
+            function, tuple(inputs), tuple(files), tuple(uses), writes
+        )
+        return function
+
+    return register
+
+
+VEHICLES = {
+    "Taxi": ["Taxi"],
+    "Ambulance": ["Ambulance", "AMBUL", "Ambul", "ambul", "AMB", "AMBU", "AMBULANCE"],
+    "Fire truck": [
+        "Fire",
+        "FIRET",
+        "FIRE",
+        "FDNY",
+        "fdny",
+        "FD tr",
+        "fd tr",
+        "firet",
+        "fire",
+    ],
+}
+VEHICLE_EMOJIS = {"Taxi": "🚕", "Ambulance": "🚑", "Fire truck": "🚒"}
+
+WEATHER = {
+    "rain": "Rainy",
+    "clear-day": "Clear",
+    "cloudy": "Cloudy",
+    "partly-cloudy-day": "Partly cloudy",
+}
+WEATHER_EMOJIS = {
+    "rain": "🌧",
+    "clear-day": "☀️",
+    "cloudy": "☁️",
+    "partly-cloudy-day": "⛅️",
+}
+
+WEEKDAYS = {
+    "Monday": "Mon",
+    "Tuesday": "Tue",
+    "Wednesday": "Wed",
+    "Thursday": "Thu",
+    "Friday": "Fri",
+    "Saturday": "Sat",
+    "Sunday": "Sun",
+}
+
+# NYC land area in km2 (wikipedia), split between boroughs by map area
+NYC_KM2 = 783.84
+
+# Record ids, kept when the collisions have them, so ingest.py can correct or
+# retract the records they identify
+ID = "COLLISION_ID"
+
+COLLISIONS_COLUMNS = [
+    "CRASH DATETIME",
+    "CRASH DAY",
+    "CRASH WEEK NUMBER",
+    "CRASH WEEKDAY",
+    "BOROUGH",
+    "VEHICLE",
+    "VEHICLE EMOJI",
+    "WEATHER",
+    "WEATHER EMOJI",
+    "NUMBER OF PERSONS INJURED",
+    "NUMBER OF PERSONS KILLED",
+    "ORIGINAL FACTOR",
+    "FACTOR",
+    "HOUR",
+    "VALID",
+    "MONTH",
+    "DAY",
+    "CRASH HOUR",
+    "LOCATION AT HOUR",
+]
+
+
+@stage(files=["collisions.csv"])
+def load(collisions_csv: str) -> pd.DataFrame:
+    collisions = pd.read_csv(collisions_csv, low_memory=False)
+    collisions["CRASH DATETIME"] = pd.to_datetime(collisions["CRASH DATETIME"])
+    return collisions
+
+
+@stage("load", uses=[ID])
+def clean(collisions: pd.DataFrame) -> pd.DataFrame:
+    # Every year is kept, those without weather are dropped by the join
+    return collisions[
+        [
+            "CRASH DATETIME",
+            "LATITUDE",
+            "LONGITUDE",
+            "ORIGINAL VEHICLE",
+            "NUMBER OF PERSONS INJURED",
+            "NUMBER OF PERSONS KILLED",
+            "ORIGINAL FACTOR",
+            "FACTOR",
+        ]
+        + ([ID] if ID in collisions else [])
+    ]
+
+
+@stage("clean", uses=[VEHICLES, VEHICLE_EMOJIS])
+def classify(collisions: pd.DataFrame) -> pd.DataFrame:
+    # Only the vehicles of the project statement are kept
+    vehicles = {value: key for key, values in VEHICLES.items() for value in values}
+    collisions = collisions.assign(
+        VEHICLE=collisions["ORIGINAL VEHICLE"].map(vehicles)
+    ).dropna(subset=["VEHICLE"])
+    collisions = collisions.drop(columns="ORIGINAL VEHICLE")
+    collisions["VEHICLE EMOJI"] = collisions["VEHICLE"].map(VEHICLE_EMOJIS)
+    collisions["CRASH DAY"] = collisions["CRASH DATETIME"].dt.strftime("%Y-%m-%d")
+    collisions["CRASH WEEKDAY"] = collisions["CRASH DATETIME"].dt.day_name()
+    collisions["CRASH WEEK NUMBER"] = collisions["CRASH DATETIME"].dt.isocalendar().week
+    return collisions
+
+
+@stage(files=["weather2018.csv"], uses=[WEATHER_EMOJIS])
+def weather(weather_csv: str) -> pd.DataFrame:
+    weather = pd.read_csv(weather_csv)[["datetime", "icon"]]
+    weather["WEATHER"] = weather["icon"]
+    weather["WEATHER EMOJI"] = weather["WEATHER"].map(WEATHER_EMOJIS)
+    return weather
+
+
+@stage("classify", "weather")
+def join(collisions: pd.DataFrame, weather: pd.DataFrame) -> pd.DataFrame:
+    return pd.merge(collisions, weather, left_on="CRASH DAY", right_on="datetime")
+
+
+@stage("join", files=["map.geojson"], uses=[locate])
+def boroughs(map_geojson: str, collisions: pd.DataFrame) -> pd.DataFrame:
+    located = locate.assign(collisions, gpd.read_file(map_geojson))
+    return collisions.assign(BOROUGH=located["BOROUGH"])
+
+
+def count(map_data: gpd.GeoDataFrame, counts: pd.Series) -> gpd.GeoDataFrame:
+    """`map_data` with the collisions of every borough set to `counts`."""
+    counts = counts.reindex(map_data["BOROUGH"]).to_numpy()
+    return map_data.assign(
+        **{
+            "COLLISIONS": counts,
+            "COLLISIONS / KM2": counts / map_data["AREA_KM2"],
+        }
+    )
+
+
+def derive(collisions: pd.DataFrame) -> pd.DataFrame:
+    """The processed columns of located collisions, as whole columns."""
+    datetimes = collisions["CRASH DATETIME"].dt
+    collisions = collisions.assign(
+        HOUR=datetimes.hour,
+        VALID=1,
+        MONTH=datetimes.strftime("%B"),
+        DAY=datetimes.strftime("%d"),
+        **{
+            "CRASH WEEKDAY": collisions["CRASH WEEKDAY"].map(WEEKDAYS),
+            "CRASH HOUR": datetimes.strftime("%H") + ":00H",
+            "WEATHER": collisions["WEATHER"].map(WEATHER),
+        },
+    )
+    collisions["LOCATION AT HOUR"] = (
+        collisions["BOROUGH"] + ", " + collisions["CRASH HOUR"]
+    )
+    return collisions[COLLISIONS_COLUMNS + ([ID] if ID in collisions else [])]
+
+
+@stage(
+    "boroughs",
+    files=["map.geojson"],
+    uses=[WEEKDAYS, WEATHER, NYC_KM2, ID, count, derive],
+)
+def aggregate(
+    map_geojson: str, collisions: pd.DataFrame
+) -> Tuple[pd.DataFrame, gpd.GeoDataFrame]:
+    map_data = gpd.read_file(map_geojson)
+    map_data["BOROUGH"] = map_data["boro_name"]
+    # Areas in degrees, only their proportions are used
+    area = map_data["geometry"].area
+    map_data["AREA_KM2"] = NYC_KM2 * area / area.sum()
+    map_data = count(map_data, collisions.groupby("BOROUGH").size())
+    map_data = map_data[
+        ["BOROUGH", "AREA_KM2", "COLLISIONS", "COLLISIONS / KM2", "geometry"]
+    ]
+    return derive(collisions), map_data
+
+
+@stage("aggregate", writes=True, uses=[storage, geometry])
+def export(data_dir: str, tables: Tuple[pd.DataFrame, gpd.GeoDataFrame]) -> List[str]:
+    collisions, map_data = tables
+    os.makedirs(data_dir, exist_ok=True)
+    # A full run replaces the stored collisions, ingested deltas included
+    partitions = storage.replace_partitions(
+        storage.with_dtypes(collisions.copy()), data_dir
+    )
+    map_path = os.path.join(data_dir, f"{geometry.NAME}.geojson")
+    map_data.to_file(map_path, driver="GeoJSON")
+    geometry.build(map_path, data_dir)
+    levels = [geometry.path(level, data_dir) for level in geometry.LEVELS]
+    return partitions + [map_path] + levels
+
+
+class Pipeline:
+    """
+    Runs STAGES on demand. Every stage output is cached on disk under a key
+    hashing its code, the constants it uses, the content of its raw files and
+    the keys of its inputs, so a stage only runs again when one of those
+    changed, and upstream outputs are only loaded when a stage has to run.
+    """
+
+    def __init__(
+        self,
+        raw_dir: str = RAW_DIR,
+        data_dir: str = DATA_DIR,
+        cache_dir: str = CACHE_DIR,
+        force: bool = False,
+    ) -> None:
+        self.raw_dir = raw_dir
+        self.data_dir = data_dir
+        self.cache_dir = cache_dir
+        self.force = force
+        self.keys: Dict[str, str] = {}
+        self.outputs: Dict[str, Any] = {}
+        # Stage -> ("cached" or "ran", seconds), in the order they finished
+        self.log: Dict[str, Tuple[str, float]] = {}
+
+    def key(self, name: str) -> str:
+        if name not in self.keys:
+            stage = STAGES[name]
+            digest = hashlib.sha256(name.encode())
+            for code in (stage.function, *stage.uses):
+                digest.update(_source(code).encode())
+            for file in stage.files:
+                digest.update(_file_hash(os.path.join(self.raw_dir, file)).encode())
+            if stage.writes:
+                digest.update(os.path.abspath(self.data_dir).encode())
+            for upstream in stage.inputs:
+                digest.update(self.key(upstream).encode())
+            self.keys[name] = digest.hexdigest()[:16]
+        return self.keys[name]
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, f"{name}-{self.key(name)}.pkl")
+
+    def output(self, name: str) -> Any:
+        if name in self.outputs:
+            return self.outputs[name]
+        start = time.perf_counter()
+        if not self.force and self._is_cached(name):
+            with open(self.path(name), "rb") as file:
+                self.outputs[name] = pickle.load(file)
+            status = "cached"
+        else:
+            stage = STAGES[name]
+            args = [os.path.join(self.raw_dir, file) for file in stage.files]
+            if stage.writes:
+                args.append(self.data_dir)
+            args += [self.output(upstream) for upstream in stage.inputs]
+            start = time.perf_counter()
+            self.outputs[name] = stage.function(*args)
+            self._store(name)
+            status = "ran"
+        self.log[name] = (status, time.perf_counter() - start)
+        return self.outputs[name]
+
+    def _is_cached(self, name: str) -> bool:
+        if not os.path.exists(self.path(name)):
+            return False
+        if not STAGES[name].writes:
+            return True
+        # Written files may have been deleted since
+        with open(self.path(name), "rb") as file:
+            return all(os.path.exists(path) for path in pickle.load(file))
+
+    def _store(self, name: str) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for file in os.listdir(self.cache_dir):
+            if file.startswith(f"{name}-") and file.endswith(".pkl"):
+                os.remove(os.path.join(self.cache_dir, file))
+        # Write then rename, so an interrupted run never leaves a broken cache
+        with open(f"{self.path(name)}.tmp", "wb") as file:
+            pickle.dump(self.outputs[name], file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{self.path(name)}.tmp", self.path(name))
+
+
+def _source(code: Any) -> str:
+    if inspect.ismodule(code) or callable(code):
+        return inspect.getsource(code)
+    return repr(code)
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Regenerate the processed data, only running outdated stages."
+    )
+    parser.add_argument(
+        "stages", nargs="*", help=f"any of {', '.join(STAGES)} (default: export)"
+    )
+    parser.add_argument("--raw-dir", default=RAW_DIR)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--force", action="store_true", help="ignore cached outputs")
+    args = parser.parse_args()
+    for name in args.stages:
+        if name not in STAGES:
+            parser.error(f"unknown stage {name!r}")
+
+    pipeline = Pipeline(args.raw_dir, args.data_dir, args.cache_dir, args.force)
+    for name in args.stages or ["export"]:
+        pipeline.output(name)
+    for name, (status, seconds) in pipeline.log.items():
+        print(f"{name:10} {status:7} {seconds:8.2f}s")
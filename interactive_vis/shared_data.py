@@ -0,0 +1,98 @@
+import argparse
+import json
+from typing import Any, Dict
+
+import altair as alt
+import pandas as pd
+import pyarrow as pa
+
+
+class SharedData:
+    """
+    DataFrames shared by the layers of a dashboard. Layers refer to them by
+    name, and each one is shipped once as a top-level dataset, so the spec does
+    not grow with the number of layers drawing the same data.
+    """
+
+    def __init__(self) -> None:
+        self.frames: Dict[str, pd.DataFrame] = {}
+
+    def add(self, name: str, df: pd.DataFrame) -> alt.NamedData:
+        if name in self.frames:
+            raise ValueError(f"dataset {name!r} already added")
+        self.frames[name] = df
+        return alt.NamedData(name=name)
+
+    def attach(self, spec: Dict) -> Dict:
+        """
+        `spec` with the DataFrames as its top-level datasets, for
+        st.vega_lite_chart, which sends each one as Arrow next to the spec.
+        They are added to the finished spec, so they are neither converted to
+        JSON nor validated against the Vega-Lite schema on every rerun.
+        """
+        return {**spec, "datasets": {**spec.get("datasets", {}), **self.frames}}
+
+
+def report(spec: Dict) -> pd.DataFrame:
+    """
+    Rows, JSON bytes and Arrow bytes (as Streamlit sends them) of every
+    top-level dataset of `spec`, and JSON bytes of the rest of the spec.
+    """
+    sizes = {}
+    for name, data in spec.get("datasets", {}).items():
+        df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+        sizes[name] = {
+            "rows": len(df),
+            "json_bytes": _json_size(alt.utils.data.to_values(df)["values"]),
+            "arrow_bytes": _arrow_size(df),
+        }
+    rest = {key: value for key, value in spec.items() if key != "datasets"}
+    sizes["(rest of the spec)"] = {
+        "rows": 0,
+        "json_bytes": _json_size(rest),
+        "arrow_bytes": 0,
+    }
+    df = pd.DataFrame.from_dict(sizes, orient="index")
+    df.loc["(total)"] = df.sum()
+    return df
+
+
+def to_arrow(spec: Dict) -> Dict:
+    """
+    `spec` with every top-level dataset as Arrow IPC bytes, as Streamlit sends
+    them, which it passes on unchanged: a cached spec is then sent on every
+    rerun without converting its data again.
+    """
+    datasets = {
+        name: _arrow_bytes(
+            data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+        )
+        for name, data in spec.get("datasets", {}).items()
+    }
+    return {**spec, "datasets": datasets} if datasets else spec
+
+
+def _json_size(value: Any) -> int:
+    return len(json.dumps(value, separators=(",", ":")))
+
+
+def _arrow_size(df: pd.DataFrame) -> int:
+    return len(_arrow_bytes(df))
+
+
+def _arrow_bytes(df: pd.DataFrame) -> bytes:
+    table = pa.Table.from_pandas(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Size of every dataset of the client-side dashboard spec."
+    )
+    parser.parse_args()
+    import app
+
+    print(report(app.client_side_spec()).to_string())
@@ -0,0 +1,185 @@
+import argparse
+import hashlib
+import os
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+DATA_DIR = "./processed-data"
+COLLISIONS = "collisions_weather"
+
+# Collisions are stored by month, in <COLLISIONS>/<year>/<month>.parquet, so
+# loaders only read the months they need
+Partition = Tuple[int, int]
+
+# Repeated strings are stored dictionary-encoded
+CATEGORIES = [
+    "CRASH DAY",
+    "CRASH WEEKDAY",
+    "BOROUGH",
+    "VEHICLE",
+    "VEHICLE EMOJI",
+    "WEATHER",
+    "WEATHER EMOJI",
+    "ORIGINAL FACTOR",
+    "FACTOR",
+    "MONTH",
+    "CRASH HOUR",
+    "LOCATION AT HOUR",
+]
+DATETIMES = ["CRASH DATETIME"]
+INTEGERS = {
+    "CRASH WEEK NUMBER": "int8",
+    "HOUR": "int8",
+    "DAY": "int8",
+    "VALID": "int8",
+    # Missing for records processed before ids were kept
+    "COLLISION_ID": "Int64",
+}
+
+
+def with_dtypes(collisions: pd.DataFrame) -> pd.DataFrame:
+    for column in collisions.columns:
+        if column in CATEGORIES:
+            collisions[column] = collisions[column].astype("category")
+        elif column in DATETIMES:
+            collisions[column] = pd.to_datetime(collisions[column])
+        elif column in INTEGERS:
+            collisions[column] = collisions[column].astype(INTEGERS[column])
+    return collisions
+
+
+def partition_path(partition: Partition, data_dir: str = DATA_DIR) -> str:
+    year, month = partition
+    return os.path.join(data_dir, COLLISIONS, str(year), f"{month:02}.parquet")
+
+
+def partitions(data_dir: str = DATA_DIR) -> List[Partition]:
+    """
+    Year and month of every partition of the collisions, in order, from the
+    file names only.
+    """
+    root = os.path.join(data_dir, COLLISIONS)
+    if not os.path.isdir(root):
+        # Not converted yet, the months of the CSV
+        path = os.path.join(data_dir, f"{COLLISIONS}.csv")
+        datetimes = pd.to_datetime(pd.read_csv(path, usecols=DATETIMES)[DATETIMES[0]])
+        return sorted(set(zip(datetimes.dt.year, datetimes.dt.month)))
+    found = []
+    for year in filter(str.isdigit, os.listdir(root)):
+        for name in os.listdir(os.path.join(root, year)):
+            month, extension = os.path.splitext(name)
+            if extension == ".parquet" and month.isdigit():
+                found.append((int(year), int(month)))
+    return sorted(found)
+
+
+def split(collisions: pd.DataFrame) -> Iterator[Tuple[Partition, pd.DataFrame]]:
+    """The collisions of every month of `collisions`, with its partition."""
+    datetimes = pd.to_datetime(collisions[DATETIMES[0]]).dt
+    for (year, month), df in collisions.groupby([datetimes.year, datetimes.month]):
+        yield (int(year), int(month)), df
+
+
+def write_partitions(collisions: pd.DataFrame, data_dir: str = DATA_DIR) -> List[str]:
+    """Replace the partition of every month of `collisions` with its rows."""
+    written = []
+    for partition, df in split(collisions):
+        path = partition_path(partition, data_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so the app never reads half a file
+        df.to_parquet(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
+        written.append(path)
+    return written
+
+
+def replace_partitions(collisions: pd.DataFrame, data_dir: str = DATA_DIR) -> List[str]:
+    """Store `collisions` as all the collisions, removing the other months."""
+    written = write_partitions(collisions, data_dir)
+    if os.path.isdir(os.path.join(data_dir, COLLISIONS)):
+        for partition in partitions(data_dir):
+            if partition_path(partition, data_dir) not in written:
+                os.remove(partition_path(partition, data_dir))
+    return written
+
+
+def read_collisions(
+    columns: Optional[List[str]] = None,
+    data_dir: str = DATA_DIR,
+    months: Optional[Sequence[Partition]] = None,
+) -> pd.DataFrame:
+    """
+    Collisions of the `months` partitions, all of them by default. Only the
+    files of those months are read.
+    """
+    if months is None:
+        months = partitions(data_dir)
+    if os.path.isdir(os.path.join(data_dir, COLLISIONS)):
+        paths = [partition_path(partition, data_dir) for partition in months]
+        return pd.read_parquet(
+            [path for path in paths if os.path.exists(path)], columns=columns
+        )
+    # Not converted yet, parse the CSV but keep the same dtypes
+    path = os.path.join(data_dir, f"{COLLISIONS}.csv")
+    usecols = None if columns is None else list(dict.fromkeys(columns + DATETIMES))
+    collisions = with_dtypes(pd.read_csv(path, usecols=usecols))
+    datetimes = collisions[DATETIMES[0]].dt
+    keep = (datetimes.year * 100 + datetimes.month).isin(
+        [year * 100 + month for year, month in months]
+    )
+    collisions = collisions[keep].reset_index(drop=True)
+    return collisions if columns is None else collisions[columns]
+
+
+def version(data_dir: str = DATA_DIR) -> str:
+    """
+    Changes whenever a file in `data_dir` or a partition is written, from
+    their names, sizes and modification times only, so it is cheap enough for
+    every rerun.
+    """
+    paths = [entry.path for entry in os.scandir(data_dir) if entry.is_file()]
+    if os.path.isdir(os.path.join(data_dir, COLLISIONS)):
+        paths += [
+            partition_path(partition, data_dir) for partition in partitions(data_dir)
+        ]
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        stat = os.stat(path)
+        name = os.path.relpath(path, data_dir)
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+def convert(data_dir: str = DATA_DIR, force: bool = False) -> List[str]:
+    """
+    Split a processed collisions CSV, from before the collisions were stored
+    by month, into its partitions. Once written, the partitions are the stored
+    collisions, which ingest.py changes, so they are only replaced with
+    `force`.
+    """
+    if not force and os.path.isdir(os.path.join(data_dir, COLLISIONS)):
+        raise FileExistsError(
+            f"{os.path.join(data_dir, COLLISIONS)} exists, it would be replaced"
+        )
+    collisions = pd.read_csv(os.path.join(data_dir, f"{COLLISIONS}.csv"))
+    return replace_partitions(with_dtypes(collisions), data_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert the processed collisions CSV to monthly Parquet partitions."
+    )
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="replace the existing partitions, and the deltas ingested in them",
+    )
+    args = parser.parse_args()
+    try:
+        written = convert(args.data_dir, args.force)
+    except FileExistsError as error:
+        parser.error(f"{error}, pass --force to replace it")
+    for path in written:
+        print(path)
@@ -0,0 +1,152 @@
+import argparse
+import os
+import shutil
+from typing import List, NamedTuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import geometry
+import storage
+
+SEED = 0
+# Rows generated and written at a time, which bounds the memory used
+CHUNK_ROWS = 100_000
+
+# Columns given by the day of a collision
+DAY_COLUMNS = ["CRASH DATETIME", "CRASH DAY", "CRASH WEEK NUMBER", "DAY"]
+# Collisions only move between days sharing these, so the month, weekday and
+# weather patterns are kept along with everything else
+DAY_GROUP = ["MONTH", "CRASH WEEKDAY", "WEATHER", "WEATHER EMOJI"]
+
+
+class Model(NamedTuple):
+    # Every distinct collision but for its day, and how often it happened
+    combinations: pd.DataFrame
+    weights: np.ndarray
+    # Day group of every combination
+    groups: np.ndarray
+    # Days sorted by group, with the first day and number of days of each group
+    days: pd.DataFrame
+    first: np.ndarray
+    sizes: np.ndarray
+    columns: List[str]
+    dtypes: pd.Series
+
+
+def fit(collisions: pd.DataFrame) -> Model:
+    """
+    Joint distribution of every column of the processed collisions (borough,
+    vehicle, weather, factor, weekday, hour, injuries...), as the frequency of
+    each distinct combination, and the days each one can be moved to.
+    """
+    days = collisions.drop_duplicates("CRASH DAY")[DAY_COLUMNS + DAY_GROUP]
+    days = days.assign(
+        **{"CRASH DATETIME": days["CRASH DATETIME"].dt.normalize()},
+        GROUP=days.groupby(DAY_GROUP, observed=True, dropna=False).ngroup(),
+    )
+    days = days.sort_values("GROUP", kind="stable").reset_index(drop=True)
+    sizes = np.bincount(days["GROUP"])
+
+    rest = [column for column in collisions.columns if column not in DAY_COLUMNS]
+    codes = collisions.groupby(rest, observed=True, dropna=False, sort=False).ngroup()
+    combinations = collisions.loc[~codes.duplicated().to_numpy(), rest]
+    groups = combinations[DAY_GROUP].merge(
+        days[DAY_GROUP + ["GROUP"]].drop_duplicates(DAY_GROUP), how="left"
+    )["GROUP"]
+    return Model(
+        combinations.reset_index(drop=True),
+        np.bincount(codes),
+        groups.to_numpy(),
+        days,
+        np.cumsum(sizes) - sizes,
+        sizes,
+        list(collisions.columns),
+        collisions.dtypes,
+    )
+
+
+def sample(model: Model, rows: int, rng: np.random.Generator) -> pd.DataFrame:
+    picked = rng.choice(len(model.weights), rows, p=model.weights / model.weights.sum())
+    collisions = model.combinations.iloc[picked].reset_index(drop=True)
+    groups = model.groups[picked]
+    day = model.first[groups] + (rng.random(rows) * model.sizes[groups]).astype(int)
+    days = model.days.iloc[day].reset_index(drop=True)
+    collisions[DAY_COLUMNS] = days[DAY_COLUMNS]
+    collisions["CRASH DATETIME"] += pd.to_timedelta(collisions["HOUR"], unit="h")
+    return collisions[model.columns].astype(model.dtypes.to_dict())
+
+
+def generate(
+    rows: int,
+    data_dir: str,
+    source_dir: str = storage.DATA_DIR,
+    seed: int = SEED,
+    csv: bool = False,
+) -> List[str]:
+    """
+    Write `rows` synthetic collisions drawn from the processed data in
+    `source_dir` to `data_dir`, with the same files and schema, a chunk at a
+    time. The same seed always gives the same data. Maps are copied as they
+    are, the per borough counts in them are the source's (the app counts
+    collisions itself).
+    """
+    model = fit(storage.read_collisions(data_dir=source_dir))
+    rng = np.random.default_rng(seed)
+    os.makedirs(data_dir, exist_ok=True)
+    csv_path = os.path.join(data_dir, f"{storage.COLLISIONS}.csv")
+    # Partitions of earlier runs, for months this one may not have
+    shutil.rmtree(os.path.join(data_dir, storage.COLLISIONS), ignore_errors=True)
+
+    writers = {}
+    try:
+        for start in range(0, rows, CHUNK_ROWS):
+            collisions = sample(model, min(CHUNK_ROWS, rows - start), rng)
+            for partition, df in storage.split(collisions):
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if partition not in writers:
+                    path = storage.partition_path(partition, data_dir)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    writers[partition] = pq.ParquetWriter(path, table.schema)
+                writers[partition].write_table(table)
+            if csv:
+                collisions.to_csv(
+                    csv_path, mode="a" if start else "w", header=not start, index=False
+                )
+    finally:
+        for writer in writers.values():
+            writer.close()
+    written = [storage.partition_path(partition, data_dir) for partition in writers]
+    written += [csv_path] if csv else []
+
+    names = [f"{geometry.NAME}.geojson"]
+    names += [os.path.basename(geometry.path(level)) for level in geometry.LEVELS]
+    for name in names:
+        if os.path.exists(os.path.join(source_dir, name)):
+            shutil.copy(os.path.join(source_dir, name), data_dir)
+            written.append(os.path.join(data_dir, name))
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic processed collisions for load testing."
+    )
+    parser.add_argument("rows", type=int)
+    parser.add_argument("data_dir", help="run the app next to it as ./processed-data")
+    parser.add_argument("--source-dir", default=storage.DATA_DIR)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument(
+        "--csv",
+        action="store_true",
+        help="also write the collisions as CSV, the app only reads Parquet",
+    )
+    args = parser.parse_args()
+    if args.rows < 1:
+        parser.error("rows must be positive")
+    for path in generate(
+        args.rows, args.data_dir, args.source_dir, args.seed, args.csv
+    ):
+        print(path)
@@ -0,0 +1,232 @@
+import functools
+import os
+import shutil
+
+import geopandas as gpd
+import pandas as pd
+import pytest
+
+import geometry
+import ingest
+import pipeline
+import storage
+
+RAW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), pipeline.RAW_DIR)
+RAW_FILES = ["map.geojson", "weather2018.csv"]
+
+# A point inside every borough
+POINTS = (
+    gpd.read_file(os.path.join(RAW_DIR, "map.geojson"))
+    .set_index("boro_name")
+    .representative_point()
+)
+
+
+def collisions(
+    ids: range, month: int, borough: str = "Queens", vehicle: str = "Taxi"
+) -> pd.DataFrame:
+    """Raw collisions with `ids`, an hour apart from the 1st of `month` of 2018."""
+    return pd.DataFrame(
+        {
+            pipeline.ID: list(ids),
+            "CRASH DATETIME": pd.date_range(
+                f"2018-{month:02}-01", periods=len(ids), freq="h"
+            ),
+            "LATITUDE": POINTS[borough].y,
+            "LONGITUDE": POINTS[borough].x,
+            "ORIGINAL VEHICLE": vehicle,
+            "NUMBER OF PERSONS INJURED": 1,
+            "NUMBER OF PERSONS KILLED": 0,
+            "ORIGINAL FACTOR": "Unsafe Speed",
+            "FACTOR": "Speeding",
+        }
+    )
+
+
+# June in Queens and July in Brooklyn
+BASE = pd.concat(
+    [collisions(range(0, 10), 6), collisions(range(10, 20), 7, "Brooklyn")],
+    ignore_index=True,
+)
+
+
+def run_pipeline(raw: pd.DataFrame, root: str) -> str:
+    """Data directory of a full pipeline run over `raw` in `root`."""
+    raw_dir = os.path.join(root, "raw")
+    os.makedirs(raw_dir)
+    for name in RAW_FILES:
+        shutil.copy(os.path.join(RAW_DIR, name), raw_dir)
+    raw.to_csv(os.path.join(raw_dir, "collisions.csv"), index=False)
+    data_dir = os.path.join(root, "data")
+    pipeline.Pipeline(raw_dir, data_dir, os.path.join(root, "cache")).output("export")
+    return data_dir
+
+
+@pytest.fixture(scope="module", autouse=True)
+def static_dir(tmp_path_factory):
+    # Maps are published to a temporary folder instead of the app's
+    with pytest.MonkeyPatch.context() as patch:
+        static = str(tmp_path_factory.mktemp("static"))
+        publish = functools.partial(geometry.publish, static_dir=static)
+        patch.setattr(geometry, "publish", publish)
+        yield static
+
+
+@pytest.fixture(scope="module")
+def base(tmp_path_factory) -> str:
+    root = str(tmp_path_factory.mktemp("base"))
+    run_pipeline(BASE, root)
+    return root
+
+
+@pytest.fixture
+def data(base, tmp_path) -> dict:
+    """Copy of the base run, its data changed by each test alone."""
+    data_dir = str(tmp_path / "data")
+    shutil.copytree(os.path.join(base, "data"), data_dir)
+    return {
+        "data_dir": data_dir,
+        "raw_dir": os.path.join(base, "raw"),
+        "cache_dir": os.path.join(base, "cache"),
+    }
+
+
+def apply(delta: pd.DataFrame, data: dict, tmp_path) -> dict:
+    path = str(tmp_path / "delta.csv")
+    delta.to_csv(path, index=False)
+    return ingest.ingest(path, **data)
+
+
+def stored(data_dir: str) -> pd.DataFrame:
+    return (
+        storage.read_collisions(data_dir=data_dir)
+        .sort_values(pipeline.ID)
+        .reset_index(drop=True)
+    )
+
+
+def rows(data_dir: str) -> dict:
+    return {
+        partition: len(pd.read_parquet(storage.partition_path(partition, data_dir)))
+        for partition in storage.partitions(data_dir)
+    }
+
+
+def test_ingest_matches_a_full_run(data, tmp_path):
+    delta = pd.concat(
+        [
+            # New, in a month without collisions yet
+            collisions(range(20, 25), 8, "Bronx"),
+            # Corrected, moved to another month, borough and vehicle
+            collisions(range(0, 3), 7, "Manhattan", "AMBUL"),
+            # Retracted
+            collisions(range(10, 12), 7).assign(**{ingest.DELETED: True}),
+        ],
+        ignore_index=True,
+    )
+    counts = apply(delta, data, tmp_path)
+    assert counts == {
+        "retracted": 5,
+        "inserted": 8,
+        "new": 5,
+        "unmatched": 0,
+        "months": 3,
+    }
+
+    patched = pd.concat(
+        [BASE[~BASE[pipeline.ID].isin(delta[pipeline.ID])], delta[:8]],
+        ignore_index=True,
+    )
+    expected_dir = run_pipeline(patched, str(tmp_path / "full"))
+    assert storage.partitions(data["data_dir"]) == storage.partitions(expected_dir)
+    pd.testing.assert_frame_equal(
+        stored(data["data_dir"]), stored(expected_dir), check_categorical=False
+    )
+    maps = [
+        gpd.read_file(os.path.join(directory, "map.geojson")).drop(columns="geometry")
+        for directory in (data["data_dir"], expected_dir)
+    ]
+    pd.testing.assert_frame_equal(*maps)
+
+
+def test_ingest_corrects_a_record_twice_in_a_delta(data, tmp_path):
+    delta = pd.concat(
+        [collisions(range(0, 1), 6, vehicle="AMBUL"), collisions(range(0, 1), 9)],
+        ignore_index=True,
+    )
+    apply(delta, data, tmp_path)
+
+    collisions_stored = stored(data["data_dir"])
+    record = collisions_stored[collisions_stored[pipeline.ID] == 0]
+    assert len(collisions_stored) == len(BASE)
+    assert record[["MONTH", "VEHICLE"]].values.tolist() == [["September", "Taxi"]]
+
+
+def test_ingest_removes_the_months_left_empty(data, tmp_path):
+    june = BASE[BASE["CRASH DATETIME"].dt.month == 6]
+    counts = apply(june.assign(**{ingest.DELETED: 1}), data, tmp_path)
+
+    assert counts == {
+        "retracted": len(june),
+        "inserted": 0,
+        "new": 0,
+        "unmatched": 0,
+        "months": 0,
+    }
+    assert storage.partitions(data["data_dir"]) == [(2018, 7)]
+    assert not os.path.exists(storage.partition_path((2018, 6), data["data_dir"]))
+    map_data = gpd.read_file(os.path.join(data["data_dir"], "map.geojson"))
+    counts = map_data.set_index("BOROUGH")["COLLISIONS"]
+    # No collisions left, as in a full run
+    assert pd.isna(counts["Queens"])
+    assert counts["Brooklyn"] == 10
+
+
+def test_ingest_needs_record_ids(data, tmp_path):
+    with pytest.raises(ValueError):
+        apply(collisions(range(20, 22), 8).drop(columns=pipeline.ID), data, tmp_path)
+    assert storage.partitions(data["data_dir"]) == [(2018, 6), (2018, 7)]
+
+
+def test_ingest_reports_retractions_that_matched_nothing(data, tmp_path):
+    delta = collisions(range(30, 32), 6).assign(**{ingest.DELETED: True})
+    counts = apply(delta, data, tmp_path)
+
+    assert counts["retracted"] == 0
+    assert counts["unmatched"] == 2
+    assert len(stored(data["data_dir"])) == len(BASE)
+
+
+@pytest.mark.parametrize(
+    "delta",
+    [
+        # Retracted, could be in any month
+        collisions(range(0, 1), 8).assign(**{ingest.DELETED: True}),
+        # New or corrected, in a month stored without ids
+        collisions(range(30, 31), 6),
+    ],
+)
+def test_ingest_needs_ids_in_the_months_it_changes(delta, data, tmp_path):
+    path = storage.partition_path((2018, 6), data["data_dir"])
+    pd.read_parquet(path).drop(columns=pipeline.ID).to_parquet(path, index=False)
+
+    with pytest.raises(ValueError, match="2018-06"):
+        apply(delta, data, tmp_path)
+    assert rows(data["data_dir"]) == {(2018, 6): 10, (2018, 7): 10}
+
+
+def test_ingest_adds_records_next_to_months_without_ids(data, tmp_path):
+    path = storage.partition_path((2018, 6), data["data_dir"])
+    pd.read_parquet(path).drop(columns=pipeline.ID).to_parquet(path, index=False)
+
+    counts = apply(collisions(range(30, 32), 8), data, tmp_path)
+    assert counts["inserted"] == counts["new"] == 2
+    assert rows(data["data_dir"]) == {(2018, 6): 10, (2018, 7): 10, (2018, 8): 2}
+
+
+def test_convert_keeps_the_ingested_partitions(data, tmp_path):
+    apply(collisions(range(20, 22), 8), data, tmp_path)
+
+    with pytest.raises(FileExistsError):
+        storage.convert(data["data_dir"])
+    assert storage.partitions(data["data_dir"]) == [(2018, 6), (2018, 7), (2018, 8)]
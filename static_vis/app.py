@@ -1,5 +1,8 @@
-import tempfile
-from typing import Dict, List, Tuple
+import calendar
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
 
 import altair as alt
 import geopandas as gpd
@@ -7,12 +10,71 @@ import numpy as np
 import pandas as pd
 import streamlit as st
 import streamlit.components.v1 as components
+from altair.utils.html import spec_to_html
+
+import charts
+import dataset
+import export
+import exposure
+import geometry
+import storage
+from dataset import Collisions
+
+DATA_DIR = "./new-york-collisions/processed-data"
+
+# Only the collision columns the charts use are read
+COLLISIONS_COLUMNS = [
+    "CRASH DATETIME",
+    "CRASH WEEKDAY",
+    "AFTER COVID",
+    "LATITUDE",
+    "LONGITUDE",
+    "NUMBER OF PERSONS INJURED",
+    "NUMBER OF PERSONS KILLED",
+    "ORIGINAL VEHICLE",
+    "VEHICLE",
+    "ORIGINAL FACTOR",
+    "FACTOR",
+    "sknt",
+    "p01i",
+    "vsby",
+]
+
+# Code building or shaping the cached charts, a change to any of them builds
+# the charts again
+CHARTS_CODE = [
+    __file__,
+    charts.__file__,
+    dataset.__file__,
+    export.__file__,
+    exposure.__file__,
+    geometry.__file__,
+    storage.__file__,
+]
+
+# Threads building the charts at the same time, 1 builds them one by one
+WORKERS = min(6, os.cpu_count() or 1)
+
+# Sections shown one by one by the progressive dashboard, in the order they
+# are built and shown: the top of the page first, what is below the fold
+# once it is on screen. Name -> (charts stacked in it, column, frame height)
+SECTIONS = {
+    "map": (["map"], "left", 680),
+    "weather": (["weather"], "right", 400),
+    "vehicles": (["vehicles"], "left", 410),
+    "time": (["week", "hours"], "right", 760),
+    "factors": (["factors"], "bottom", 450),
+}
+# Sections drawn by Vega in the browser even when the others are images: an
+# image of every district is several times the size of the page with its
+# data (python benchmarks/static_bytes.py)
+INTERACTIVE_SECTIONS = {"map"}
 
 
 class WeekChart:
     def __init__(
         self,
-        collisions: pd.DataFrame,
+        collisions: Collisions,
         moments: List[str],
         colors: Dict[str, str],
         main_opactiy: int,
@@ -38,14 +100,9 @@ class WeekChart:
         self.weekdays_df, self.weekends_df = self._process_data(collisions)
 
     def _process_data(
-        self, collisions: pd.DataFrame
+        self, collisions: Collisions
     ) -> Tuple[pd.DataFrame, pd.DataFrame]:
-        days_df = (
-            collisions.groupby(["CRASH WEEKDAY", "AFTER COVID"])
-            .size()
-            .reset_index(name="counts")
-        )
-
+        days_df = collisions.counts(["CRASH WEEKDAY", "AFTER COVID"])
         days_df["MOMENT"] = np.where(days_df["AFTER COVID"], self.after, self.before)
 
         weekdays_df = days_df[days_df["CRASH WEEKDAY"].isin(self.weekdays)]
@@ -129,7 +186,7 @@ class WeekChart:
 class VehiclesChart:
     def __init__(
         self,
-        collisions: pd.DataFrame,
+        collisions: Collisions,
         moments: List[str],
         colors: Dict[str, str],
         main_opactiy: int,
@@ -146,26 +203,11 @@ class VehiclesChart:
         self.minimum = min(self.vehicles["COLLISIONS"])
         self.mean = self.vehicles["COLLISIONS"].mean()
 
-    def _process_data(self, collisions: pd.DataFrame) -> pd.DataFrame:
-        vehicles = collisions.groupby(["VEHICLE"]).size().reset_index(name="counts")
-
-        vehicles = collisions[
-            ["VEHICLE", "NUMBER OF PERSONS INJURED", "NUMBER OF PERSONS KILLED"]
-        ]
-        vehicles = vehicles[vehicles["VEHICLE"] != "Unknown"]
-
-        vehicles = (
-            vehicles.groupby("VEHICLE")
-            .agg(
-                {
-                    "VEHICLE": "count",
-                    "NUMBER OF PERSONS INJURED": "sum",
-                    "NUMBER OF PERSONS KILLED": "sum",
-                }
-            )
-            .rename(columns={"VEHICLE": "COLLISIONS"})
-            .reset_index()
-        )
+    def _process_data(self, collisions: Collisions) -> pd.DataFrame:
+        vehicles = collisions.counts(
+            ["VEHICLE"], ["NUMBER OF PERSONS INJURED", "NUMBER OF PERSONS KILLED"]
+        ).rename(columns={"counts": "COLLISIONS"})
+        vehicles = vehicles[vehicles["VEHICLE"] != "Unknown"].reset_index(drop=True)
 
         total_collisions = vehicles["COLLISIONS"].sum()
 
@@ -232,7 +274,7 @@ class VehiclesChart:
 class HourChart:
     def __init__(
         self,
-        collisions: pd.DataFrame,
+        collisions: Collisions,
         moments: List[str],
         colors: Dict[str, str],
         main_opactiy: int,
@@ -246,17 +288,12 @@ class HourChart:
         self.time_df, self.time_all_df = self._process_data(collisions)
 
     def _process_data(
-        self, collisions: pd.DataFrame
+        self, collisions: Collisions
     ) -> Tuple[pd.DataFrame, pd.DataFrame]:
-        time_df = collisions
-        time_df["HOUR"] = pd.to_datetime(time_df["CRASH DATETIME"]).dt.hour
-        time_df = (
-            time_df.groupby(["HOUR", "AFTER COVID"]).size().reset_index(name="counts")
-        )
-
+        time_df = collisions.counts(["HOUR", "AFTER COVID"])
         time_df["MOMENT"] = np.where(time_df["AFTER COVID"], self.after, self.before)
 
-        time_all_df = time_df.groupby(["HOUR"]).sum().reset_index()
+        time_all_df = collisions.counts(["HOUR"])
 
         return time_df, time_all_df
 
@@ -296,8 +333,9 @@ class HourChart:
 class MapChart:
     def __init__(
         self,
-        collisions: pd.DataFrame,
+        collisions: Collisions,
         map_data: pd.DataFrame,
+        map_topology: Dict,
         moments: List[str],
         colors: Dict[str, str],
         main_opactiy: int,
@@ -309,13 +347,19 @@ class MapChart:
         self.secondary_opactiy = secondary_opacity
 
         self.labels = {"boro_cd": ["105", "205"], "LABELS": ["Midtown", "Fordham"]}
+        # Emoji drawn where each kind of collision happened
+        self.overlays = {
+            "🐎": ("ORIGINAL VEHICLE", "Horse"),
+            "🏎️": ("ORIGINAL VEHICLE", "Go kart"),
+        }
 
         self.map_data = map_data
-        self.top, self.horse, self.gokart = self._process_data(collisions, map_data)
+        self.map_topology = map_topology
+        self.top, self.points = self._process_data(collisions, map_data)
 
     def _process_data(
-        self, collisions: pd.DataFrame, map_data: pd.DataFrame
-    ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        self, collisions: Collisions, map_data: pd.DataFrame
+    ) -> Tuple[pd.DataFrame, Dict[str, pd.DataFrame]]:
         top = map_data.sort_values(by="COLLISIONS / KM2", ascending=False).head(4)
         top[["LATITUDE", "LONGITUDE"]] = top["geometry"].centroid.apply(
             lambda x: pd.Series([x.y, x.x])
@@ -327,20 +371,22 @@ class MapChart:
             40.849746,
             -73.89958,
         ]
-        return (
-            top,
-            collisions[collisions["ORIGINAL VEHICLE"] == "Horse"],
-            collisions[collisions["ORIGINAL VEHICLE"] == "Go kart"],
-        )
+        # Only the coordinates of the few collisions drawn are sent to the map,
+        # gathered through the index of the column rather than a scan
+        points = {
+            emoji: collisions.rows(["LATITUDE", "LONGITUDE"], where)
+            for emoji, where in self.overlays.items()
+        }
+        return top, points
 
     def make_plot(self) -> alt.Chart:
         base = (
-            alt.Chart(self.map_data)
+            alt.Chart(geometry.to_data(self.map_topology))
             .mark_geoshape()
             .project(type="albersUsa")
             .encode(
                 color=alt.Color(
-                    "COLLISIONS / KM2:Q",
+                    "properties.COLLISIONS / KM2:Q",
                     scale=alt.Scale(scheme="purples"),
                     legend=alt.Legend(title="Collisions per km2"),
                 ),
@@ -358,31 +404,23 @@ class MapChart:
             )
         )
 
-        horse = (
-            alt.Chart(self.horse)
-            .mark_text(text="🐎", size=18)
+        overlays = [
+            alt.Chart(points)
+            .mark_text(text=emoji, size=18)
             .encode(
                 longitude="LONGITUDE:Q",
                 latitude="LATITUDE:Q",
             )
-        )
-
-        gokart = (
-            alt.Chart(self.gokart)
-            .mark_text(text="🏎️", size=18)
-            .encode(
-                longitude="LONGITUDE:Q",
-                latitude="LATITUDE:Q",
-            )
-        )
+            for emoji, points in self.points.items()
+        ]
 
-        return base + horse + gokart + text_labels
+        return alt.layer(base, *overlays, text_labels)
 
 
 class WeatherChart:
     def __init__(
         self,
-        collisions: pd.DataFrame,
+        collisions: Collisions,
         weather: pd.DataFrame,
         moments: List[str],
         colors: Dict[str, str],
@@ -405,42 +443,13 @@ class WeatherChart:
         self.weather = self._process_data(collisions, weather)
 
     def _process_data(
-        self, collisions: pd.DataFrame, weather: pd.DataFrame
-    ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-        collisions_weather = collisions[["CRASH DATETIME", *list(self.base.keys())]]
-        dfs = []
-        for name, base_value in self.base.items():
-            base_bin = collisions_weather.loc[collisions_weather[name] == base_value]
-            rest = collisions_weather.loc[collisions_weather[name] != base_value]
-            bins = pd.cut(rest.dropna(subset=[name])[name], bins=self.nbins)
-            midpoints = bins.apply(lambda x: x.mid.round(2))
-            grouped = rest.groupby(midpoints)
-            grouped = grouped.size().reset_index(name="counts")
-            if base_value > 0:
-                grouped = grouped.sort_index(ascending=False)
-
-            df = pd.DataFrame({name: [base_value], "counts": [len(base_bin)]})
-            df = pd.concat([df, grouped]).reset_index(drop=True)
-
-            base_bin_w = weather.loc[weather[name] == base_value]
-            rest_w = weather.loc[weather[name] != base_value]
-            bins_w = pd.cut(rest_w.dropna(subset=[name])[name], bins=self.nbins)
-            midpoints_w = bins_w.apply(lambda x: x.mid.round(2))
-            grouped_w = rest_w.groupby(midpoints_w)
-            grouped_w = grouped_w.size().reset_index(name="counts")
-            if base_value > 0:
-                grouped_w = grouped_w.sort_index(ascending=False)
-            df_w = pd.DataFrame({name: [base_value], "counts": [len(base_bin_w)]})
-            df_w = pd.concat([df_w, grouped_w]).reset_index(drop=True)
-
-            df = pd.merge(df, df_w, on=name)
-            df["COLLISIONS / HOUR"] = df["counts_x"] / df["counts_y"]
-            df.loc[:, "WEATHER"] = name
-            df = df[["COLLISIONS / HOUR", "WEATHER"]]
-            df["CONDITION"] = self.conditionorder
-            dfs.append(df)
-
-        return pd.concat(dfs)
+        self, collisions: Collisions, weather: pd.DataFrame
+    ) -> pd.DataFrame:
+        rates = exposure.rates(
+            collisions.rows(list(self.base)), weather, self.base, self.nbins
+        )
+        rates["CONDITION"] = np.array(self.conditionorder)[rates["LEVEL"]]
+        return rates[["COLLISIONS / HOUR", "WEATHER", "CONDITION"]]
 
     def make_plot(self) -> alt.Chart:
         axis_y_labels = "datum.label == 'p01i' ? 'Rain' : datum.label == 'sknt' ? 'Wind' : 'Visbility'"
@@ -478,7 +487,7 @@ class WeatherChart:
 class FactorChart:
     def __init__(
         self,
-        collisions: pd.DataFrame,
+        collisions: Collisions,
         main_opactiy: int,
         secondary_opacity: int,
     ) -> None:
@@ -488,15 +497,12 @@ class FactorChart:
         self.factors1, self.factors2 = self._process_data(collisions)
 
     def _process_data(
-        self, collisions: pd.DataFrame
-    ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-        factors = collisions[["VEHICLE", "FACTOR", "ORIGINAL FACTOR"]]
-        factors1_vehicle = (
-            factors.groupby(["VEHICLE"]).size().reset_index(name="counts_vehicle")
-        )
-        factors1 = (
-            factors.groupby(["VEHICLE", "FACTOR"]).size().reset_index(name="counts")
+        self, collisions: Collisions
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        factors1_vehicle = collisions.counts(["VEHICLE"]).rename(
+            columns={"counts": "counts_vehicle"}
         )
+        factors1 = collisions.counts(["VEHICLE", "FACTOR"])
         factors1 = factors1[
             (factors1["VEHICLE"] != "Unknown") & (factors1["FACTOR"] != "Unspecified")
         ]
@@ -504,15 +510,11 @@ class FactorChart:
         factors1 = factors1.merge(factors1_vehicle, on="VEHICLE")
         factors1["PERCENTAGE"] = factors1["counts"] / factors1["counts_vehicle"] * 100
 
-        factors2 = factors[factors["FACTOR"] == "Driving Infraction"]
-        factors2_vehicle = (
-            factors2.groupby(["VEHICLE"]).size().reset_index(name="counts_vehicle")
-        )
-        factors2 = (
-            factors2.groupby(["VEHICLE", "ORIGINAL FACTOR"])
-            .size()
-            .reset_index(name="counts")
+        infractions = ("FACTOR", "Driving Infraction")
+        factors2_vehicle = collisions.counts(["VEHICLE"], where=infractions).rename(
+            columns={"counts": "counts_vehicle"}
         )
+        factors2 = collisions.counts(["VEHICLE", "ORIGINAL FACTOR"], where=infractions)
         factors2 = factors2[(factors2["VEHICLE"] != "Unknown")]
 
         factors2 = factors2.merge(factors2_vehicle, on="VEHICLE")
@@ -579,11 +581,46 @@ class Sidebar:
         self.st.markdown("---")
 
 
+def period(months: List[storage.Partition]) -> str:
+    """
+    Name of a period from its sorted months: "Summer <years>" when they are all
+    from June to September, else its first and last month.
+    """
+    if not months:
+        return "No data"
+    first_year, last_year = months[0][0], months[-1][0]
+    if all(6 <= month <= 9 for _, month in months):
+        years = f"{first_year}-{last_year}" if last_year > first_year else first_year
+        return f"Summer {years}"
+    first, last = months[0][1], months[-1][1]
+    return (
+        f"{calendar.month_abbr[first]} {first_year} - "
+        f"{calendar.month_abbr[last]} {last_year}"
+    )
+
+
+@st.cache_resource(show_spinner="Building charts...")
+def get_charts(key: str, _build: Callable[[], Dict]) -> Dict:
+    # Shared by every session, and kept on disk across restarts
+    return charts.load_or_build(key, _build)
+
+
+@st.cache_resource(show_spinner="Building chart...")
+def get_section(key: str, name: str, _build: Callable[[], Dict]) -> Dict:
+    return charts.load_or_build(key, _build, name=f"section-{name}")
+
+
 class Center:
-    def __init__(self) -> None:
+    def __init__(self, workers: int = WORKERS, progressive: bool = True) -> None:
         self.st = st
-        self.before = "Summer 2018 (Before Covid)"
-        self.after = "Summer 2020 (After Covid)"
+        self.workers = workers
+        self.progressive = progressive
+        # Periods named after the months stored for each
+        partitions = storage.partitions(DATA_DIR)
+        before = [month for month in partitions if month[0] < storage.COVID_YEAR]
+        after = [month for month in partitions if month[0] >= storage.COVID_YEAR]
+        self.before = f"{period(before)} (Before Covid)"
+        self.after = f"{period(after)} (After Covid)"
         self.all_time = "All"
         self.moments = [self.before, self.after, self.all_time]
         self.colors = {
@@ -594,120 +631,225 @@ class Center:
         self.main_opactiy = 1
         self.secondary_opactiy = 0.5
 
-        self.collisions, self.map_data, self.weather = self._load_data()
+        # Loaded by the first chart built, if any
+        self.collisions = None
+        self.key = charts.key(DATA_DIR, CHARTS_CODE)
+        if not self.progressive:
+            entry = self.dashboard()
+            self.spec, self.html = entry["dashboard"], entry["html"]
+
+    def dashboard(self) -> Dict:
+        """Spec and HTML page of the whole dashboard, which holds the map."""
+        return get_charts(self.key, self._build)
+
+    def section(self, name: str) -> Dict:
+        """Spec, HTML page and SVG image, if any, of one section of SECTIONS."""
+        return get_section(self.key, name, lambda: self._build_section(name))
+
+    def _build(self) -> Dict:
+        return self._page(self._compose(), image=False)
+
+    def _build_section(self, name: str) -> Dict:
+        """Page of one section alone, from the data loaded for the first one."""
+        if self.collisions is None:
+            self._prepare()
+        names, _, _ = SECTIONS[name]
+        builders = self._builders()
+        built = self._build_charts({chart: builders[chart] for chart in names})
+        section = (
+            alt.vconcat(*(built[chart] for chart in names))
+            .resolve_legend(size="independent")
+            .resolve_scale(color="independent")
+            .configure_legend(symbolOpacity=1)
+        )
+        return self._page(section, image=name not in INTERACTIVE_SECTIONS)
+
+    def _page(self, chart: alt.TopLevelMixin, image: bool) -> Dict:
+        spec = chart.to_dict()
+        # Same page as chart.save, rendered once and straight from the spec:
+        # turning the spec back into a chart revalidates every dataset
+        html = spec_to_html(
+            spec,
+            mode="vega-lite",
+            vega_version=alt.VEGA_VERSION,
+            vegalite_version=alt.VEGALITE_VERSION,
+            vegaembed_version=alt.VEGAEMBED_VERSION,
+        )
+        # Rendered on the server as well, shown unless charts are interactive
+        svg = None
+        if image and export.AVAILABLE:
+            svg = export.render(spec, "svg").decode("utf-8")
+        return {"dashboard": spec, "html": html, "svg": svg}
+
+    def _compose(self) -> alt.VConcatChart:
+        self._prepare()
+        built = self._build_charts(self._builders())
+        self.week = built["week"]
+        self.vehicles = built["vehicles"]
+        self.hours = built["hours"]
+        self.map = built["map"]
+        self.weatherchart = built["weather"]
+        self.factors = built["factors"]
+
+        # final_chart = (
+        #     (
+        #         (
+        #             (self.map | (self.week & self.hours))
+        #             & (self.vehicles | self.weatherchart)
+        #             .resolve_scale(color="independent")
+        #             .resolve_legend(size="independent")
+        #         )
+        #         & self.factors
+        #     )
+        #     .resolve_scale(color="independent")
+        #     .resolve_legend(size="independent")
+        # ).configure_legend(symbolOpacity=1)
+
+        final_chart = (
+            (
+                (
+                    (self.map & self.vehicles)
+                    .resolve_scale(color="independent")
+                    .resolve_legend(size="independent")
+                    | (self.weatherchart & (self.week & self.hours))
+                )
+                & self.factors
+            )
+            .resolve_legend(size="independent")
+            .resolve_scale(color="independent")
+            .configure_legend(symbolOpacity=1)
+        )
+        return final_chart
 
-        if "charts" not in st.session_state:
-            self.week = WeekChart(
+    def _prepare(self) -> None:
+        self.collisions, self.map_data, self.weather = self._load_data()
+        # Simplified geometry, at the level matching the size the map is drawn at
+        self.map_topology = geometry.read_topology(
+            geometry.pick_level(600, 600, self.map_data.total_bounds),
+            self.map_data,
+            DATA_DIR,
+        )
+
+    def _builders(self) -> Dict[str, Callable[[], Any]]:
+        # Independent reads of the same data, the views they share are computed
+        # by whichever chart asks first
+        return {
+            "week": lambda: WeekChart(
                 self.collisions,
                 self.moments,
                 self.colors,
                 self.main_opactiy,
                 self.secondary_opactiy,
-            ).make_plot()
-            self.vehicles = VehiclesChart(
+            ).make_plot(),
+            "vehicles": lambda: VehiclesChart(
                 self.collisions,
                 self.moments,
                 self.colors,
                 self.main_opactiy,
                 self.secondary_opactiy,
-            ).make_plot()
-            self.hours = HourChart(
+            ).make_plot(),
+            "hours": lambda: HourChart(
                 self.collisions,
                 self.moments,
                 self.colors,
                 self.main_opactiy,
                 self.secondary_opactiy,
-            ).make_plot()
-            self.map = MapChart(
+            ).make_plot(),
+            "map": lambda: MapChart(
                 self.collisions,
                 self.map_data,
+                self.map_topology,
                 self.moments,
                 self.colors,
                 self.main_opactiy,
                 self.secondary_opactiy,
-            ).make_plot()
-            self.weatherchart = WeatherChart(
+            ).make_plot(),
+            "weather": lambda: WeatherChart(
                 self.collisions,
                 self.weather,
                 self.moments,
                 self.colors,
                 self.main_opactiy,
                 self.secondary_opactiy,
-            ).make_plot()
-            self.factors = FactorChart(
+            ).make_plot(),
+            "factors": lambda: FactorChart(
                 self.collisions,
                 self.main_opactiy,
                 self.secondary_opactiy,
-            ).make_plot()
-            st.session_state["charts"] = [
-                self.week,
-                self.vehicles,
-                self.hours,
-                self.map,
-                self.weatherchart,
-                self.factors,
-            ]
-        else:
-            (
-                self.week,
-                self.vehicles,
-                self.hours,
-                self.map,
-                self.weatherchart,
-                self.factors,
-            ) = st.session_state["charts"]
-
-    def _load_data(self) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+            ).make_plot(),
+        }
+
+    def _build_charts(self, builders: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+        """
+        Call every builder on `self.workers` threads. Seconds taken by each one
+        are kept in `self.timings`, in the order they finished: the slowest is
+        the critical path of the build. The data is loaded before (`_prepare`),
+        and builders share the views of `self.collisions`, each built once
+        under its own lock.
+        """
+        self.timings: Dict[str, float] = {}
+
+        def timed(name: str) -> Any:
+            start = time.perf_counter()
+            chart = builders[name]()
+            self.timings[name] = time.perf_counter() - start
+            return chart
+
+        if self.workers <= 1:
+            return {name: timed(name) for name in builders}
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures = {name: pool.submit(timed, name) for name in builders}
+            return {name: future.result() for name, future in futures.items()}
+
+    def _load_data(self) -> Tuple[Collisions, pd.DataFrame, pd.DataFrame]:
         return (
-            pd.read_csv("./new-york-collisions/processed-data/collisions.csv"),
-            gpd.read_file("./new-york-collisions/processed-data/map.geojson"),
-            pd.read_csv("./new-york-collisions/processed-data/weather.csv"),
+            Collisions(storage.read_collisions(COLLISIONS_COLUMNS, DATA_DIR)),
+            gpd.read_file(f"{DATA_DIR}/map.geojson"),
+            storage.read_weather(data_dir=DATA_DIR),
         )
 
     def show(self) -> None:
         self.st.header("📊 New York City Collisions")
-
-        # final_chart = (
-        #     (
-        #         (
-        #             (self.map | (self.week & self.hours))
-        #             & (self.vehicles | self.weatherchart)
-        #             .resolve_scale(color="independent")
-        #             .resolve_legend(size="independent")
-        #         )
-        #         & self.factors
-        #     )
-        #     .resolve_scale(color="independent")
-        #     .resolve_legend(size="independent")
-        # ).configure_legend(symbolOpacity=1)
-
-        final_chart = (
-            (
-                (
-                    (self.map & self.vehicles)
-                    .resolve_scale(color="independent")
-                    .resolve_legend(size="independent")
-                    | (self.weatherchart & (self.week & self.hours))
-                )
-                & self.factors
-            )
-            .resolve_legend(size="independent")
-            .resolve_scale(color="independent")
-            .configure_legend(symbolOpacity=1)
-        )
-
-        with tempfile.NamedTemporaryFile(
-            mode="w", delete=False, suffix=".html"
-        ) as arquivo:
-            final_chart.save(arquivo.name)
-            arquivo.flush()
-            HtmlFile = open(arquivo.name, "r", encoding="utf-8")
-
-            # Load HTML file in HTML component for display on Streamlit page
-            components.html(HtmlFile.read(), height=2000)
+        interactive = self.st.toggle(
+            "Interactive charts",
+            value=not export.AVAILABLE,
+            disabled=not export.AVAILABLE or not self.progressive,
+            help="Drawn in the browser by Vega, with tooltips, instead of images",
+        )
+
+        if not self.progressive:
+            self._show_page("dashboard", self.dashboard(), 2000, interactive)
+            return
+
+        # A placeholder per section holds the layout, then the first section is
+        # built, or read from the cache, and on screen before any other is
+        # built, each one filling its placeholder once ready
+        left, right = self.st.columns(2)
+        places = {"left": left, "right": right, "bottom": self.st.container()}
+        slots = {}
+        for name, (charts_shown, place, _) in SECTIONS.items():
+            with places[place]:
+                slots[name] = self.st.empty()
+            slots[name].caption(f"Building the {' and '.join(charts_shown)} charts…")
+        for name, (_, _, height) in SECTIONS.items():
+            with slots[name].container():
+                self._show_page(name, self.section(name), height, interactive)
 
         # If choropleth maps worked in streamlit:
-        # self.st.altair_chart(final_chart, use_container_width=False, theme=None)
+        # self.st.altair_chart(self.spec, use_container_width=False, theme=None)
+
+    def _show_page(
+        self, name: str, entry: Dict, height: int, interactive: bool
+    ) -> None:
+        if interactive or entry["svg"] is None:
+            # Rendered once with the charts, nothing is written to disk per rerun
+            components.html(entry["html"], height=height)
+        else:
+            # A file named after its content, kept by browsers, with no Vega
+            # runtime nor data to send. Its URL is relative, as the maps', so
+            # it holds under server.baseUrlPath, which st.image's doesn't
+            url = export.publish(name, entry["svg"])
+            self.st.html(f'<img src="{url}" alt="{name}" style="width: 100%">')
 
 
 class Screen:
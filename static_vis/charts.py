@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import altair as alt
+
+CACHE_DIR = "./.chart-cache"
+
+# Bump whenever the layout of cached entries changes
+VERSION = 3
+
+# (path, size, mtime) -> content hash, so unchanged files are only read once
+_hashes: Dict[Tuple[str, int, int], str] = {}
+_lock = threading.Lock()
+
+
+def key(data_dir: str, code: List[str]) -> str:
+    """
+    Hash of every file under `data_dir` and of the `code` files building the
+    charts, along with VERSION and the Altair version, so cached specs are
+    dropped as soon as the data, the charts or their schema change.
+    """
+    digest = hashlib.sha256(f"{VERSION}:{alt.__version__}".encode())
+    for path in code:
+        digest.update(f"{os.path.basename(path)}:{_file_hash(path)}".encode())
+    # Partitions included
+    paths = [
+        os.path.join(root, name)
+        for root, _, names in os.walk(data_dir)
+        for name in names
+    ]
+    for path in sorted(paths):
+        name = os.path.relpath(path, data_dir)
+        digest.update(f"{name}:{_file_hash(path)}".encode())
+    return digest.hexdigest()[:16]
+
+
+def _file_hash(path: str) -> str:
+    stat = os.stat(path)
+    signature = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if signature not in _hashes:
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        _hashes[signature] = digest.hexdigest()
+    return _hashes[signature]
+
+
+def path(key: str, cache_dir: str = CACHE_DIR, name: str = "charts") -> str:
+    return os.path.join(cache_dir, f"{name}-{key}.json")
+
+
+def load(key: str, cache_dir: str = CACHE_DIR, name: str = "charts") -> Optional[Dict]:
+    try:
+        with open(path(key, cache_dir, name), encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def store(
+    key: str, entry: Dict, cache_dir: str = CACHE_DIR, name: str = "charts"
+) -> Dict:
+    """
+    Persist `entry` under `key`, dropping the older entries of the same
+    `name` (the whole dashboard, or one of its sections).
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    current = os.path.basename(path(key, cache_dir, name))
+    for file_name in os.listdir(cache_dir):
+        # Name of the entry, without its key
+        entry_name = file_name[: -len(".json")].rsplit("-", 1)[0]
+        stale = file_name.endswith(".json") and entry_name == name
+        if stale and file_name != current:
+            os.remove(os.path.join(cache_dir, file_name))
+    # Write then rename, so other processes never read half an entry
+    temporary = f"{path(key, cache_dir, name)}.{os.getpid()}.tmp"
+    try:
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(entry, file, separators=(",", ":"))
+        os.replace(temporary, path(key, cache_dir, name))
+    finally:
+        # Nothing is left behind if the entry could not be written
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return entry
+
+
+def load_or_build(
+    key: str,
+    build: Callable[[], Dict],
+    cache_dir: str = CACHE_DIR,
+    name: str = "charts",
+) -> Dict:
+    """Cached entry for `key`, built and persisted on the first miss only."""
+    entry = load(key, cache_dir, name)
+    if entry is not None:
+        return entry
+    with _lock:
+        # Another thread may have built it while this one waited
+        entry = load(key, cache_dir, name)
+        if entry is None:
+            entry = store(key, build(), cache_dir, name)
+    return entry
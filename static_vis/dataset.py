@@ -0,0 +1,111 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import storage
+
+# Column and value the rows of a view are restricted to
+Where = Optional[Tuple[str, Any]]
+
+
+class Collisions:
+    """
+    Processed collisions shared by every chart. Columns are typed once
+    (datetimes, categorical vehicles, factors and weekdays), HOUR is derived
+    from CRASH DATETIME, and AFTER COVID is the period key. Charts read views,
+    computed on first use and cached, instead of the whole frame, and the
+    views they get back are shallow copies, so charts never change each other's
+    data (pandas copy-on-write). Every view and index is built once, even when
+    charts are built on several threads at the same time.
+    """
+
+    def __init__(self, collisions: pd.DataFrame) -> None:
+        frame = storage.with_dtypes(collisions.copy(deep=False))
+        frame["HOUR"] = frame["CRASH DATETIME"].dt.hour
+        self._frame = frame
+        self._views: Dict[Tuple, pd.DataFrame] = {}
+        # Categories and row positions sorted by category, with the bounds of
+        # each category in them, for every column looked up by value
+        self._indexes: Dict[str, Tuple[pd.Index, np.ndarray, np.ndarray]] = {}
+        # One lock per view or index being built, so threads wait for the one
+        # they need only
+        self._locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._frame)
+
+    def clear(self) -> None:
+        """Forget the cached views and indexes, they are built again on next use."""
+        with self._lock:
+            self._views.clear()
+            self._indexes.clear()
+            self._locks.clear()
+
+    def rows(self, columns: Sequence[str], where: Where = None) -> pd.DataFrame:
+        """`columns` of the collisions where the `where` column has its value."""
+        key = ("rows", tuple(columns), where)
+        view = self._cached(self._views, key, lambda: self._select(columns, where))
+        return view.copy(deep=False)
+
+    def positions(self, column: str, value: Any) -> np.ndarray:
+        """
+        Sorted positions of the rows where `column` is `value`, gathered from
+        an inverted index of the column built on first use, so finding the k
+        rows of a value costs O(k) rather than a scan of the whole column.
+        """
+        categories, order, bounds = self._cached(
+            self._indexes, column, lambda: self._index(column)
+        )
+        if value not in categories:
+            return order[:0]
+        code = categories.get_loc(value)
+        return order[bounds[code] : bounds[code + 1]]
+
+    def counts(
+        self, keys: Sequence[str], sums: Sequence[str] = (), where: Where = None
+    ) -> pd.DataFrame:
+        """
+        Number of collisions (counts) and sum of every column of `sums` for
+        each combination of `keys` seen, among the collisions matching `where`.
+        """
+        key = ("counts", tuple(keys), tuple(sums), where)
+        view = self._cached(self._views, key, lambda: self._count(keys, sums, where))
+        return view.copy(deep=False)
+
+    def _cached(self, cache: Dict, key: Hashable, build: Callable[[], Any]) -> Any:
+        value = cache.get(key)
+        if value is None:
+            with self._lock:
+                lock = self._locks.setdefault(key, threading.Lock())
+            with lock:
+                # Another thread may have built it while this one waited
+                value = cache.get(key)
+                if value is None:
+                    value = cache[key] = build()
+        return value
+
+    def _index(self, column: str) -> Tuple[pd.Index, np.ndarray, np.ndarray]:
+        categories = self._frame[column].astype("category").cat
+        codes = categories.codes.to_numpy()
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(
+            codes[order], np.arange(len(categories.categories) + 1)
+        )
+        return categories.categories, order, bounds
+
+    def _count(
+        self, keys: Sequence[str], sums: Sequence[str], where: Where
+    ) -> pd.DataFrame:
+        grouped = self._select([*keys, *sums], where).groupby(list(keys), observed=True)
+        counts = grouped.size().rename("counts")
+        if sums:
+            counts = pd.concat([counts, grouped[list(sums)].sum()], axis=1)
+        return counts.reset_index()
+
+    def _select(self, columns: Sequence[str], where: Where) -> pd.DataFrame:
+        if where is None:
+            return self._frame[list(columns)]
+        return self._frame[list(columns)].take(self.positions(*where))
@@ -1,10 +1,21 @@
+import os
+
 import altair as alt
+import geopandas as gpd
 import streamlit as st
 
-data = alt.Data(
-    url="https://raw.githubusercontent.com/marcfranquesa/data/main/map.geojson",
-    format=alt.DataFormat(property="features"),
-)
+import geometry
+
+# The district shapes shipped with the app, so the example runs from a fresh
+# checkout, without the processed collisions
+RAW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "original-data")
+
+map_data = gpd.read_file(os.path.join(RAW_DIR, "map.geojson"))
+# Areas of the source are in square feet
+map_data["AREA KM2"] = map_data["shape_area"].astype(float) * 0.3048**2 / 1e6
+# Inline rather than published, so the app's published maps are left alone
+level = geometry.pick_level(600, 600, map_data.total_bounds)
+data = geometry.to_data(geometry.topology(map_data, geometry.LEVELS[level]))
 
 
 base = (
@@ -13,9 +24,9 @@ base = (
     .project(type="albersUsa")
     .encode(
         color=alt.Color(
-            "COLLISIONS / KM2:Q",
+            "properties.AREA KM2:Q",
             scale=alt.Scale(scheme="purples"),
-            legend=alt.Legend(title="Collisions per km2"),
+            legend=alt.Legend(title="Area (km2)"),
         ),
     )
     .properties(width=600, height=600, title="NYC Community Districts")
@@ -0,0 +1,100 @@
+import argparse
+import glob
+import hashlib
+import os
+from typing import Dict, List
+
+import geometry
+
+try:
+    import vl_convert as vlc
+except ImportError:
+    # Optional: without it the app only shows the interactive charts
+    vlc = None
+
+AVAILABLE = vlc is not None
+FORMATS = ["svg", "png"]
+# PNG pixels per chart pixel
+SCALE = 2
+
+README_IMAGE = os.path.join(geometry.STATIC_DIR, "visualization.png")
+
+
+def render(spec: Dict, image_format: str, scale: float = SCALE) -> bytes:
+    """
+    `spec` rendered to SVG or PNG by the Vega renderer of vl-convert, on the
+    server and without a browser.
+    """
+    if vlc is None:
+        raise RuntimeError("rendering charts needs vl-convert-python")
+    if image_format == "svg":
+        return vlc.vegalite_to_svg(spec).encode("utf-8")
+    if image_format == "png":
+        return vlc.vegalite_to_png(spec, scale=scale)
+    raise ValueError(f"unknown format {image_format!r}, expected one of {FORMATS}")
+
+
+def publish(name: str, svg: str, static_dir: str = geometry.STATIC_DIR) -> str:
+    """
+    Write an SVG image to the app's static folder under a content-hashed name,
+    and return its URL relative to the page, as geometry.publish does for maps.
+    """
+    content = svg.encode("utf-8")
+    file_name = f"chart-{name}.{hashlib.sha256(content).hexdigest()[:12]}.svg"
+    target = os.path.join(static_dir, file_name)
+    if not os.path.exists(target):
+        for stale in glob.glob(os.path.join(static_dir, f"chart-{name}.*.svg")):
+            os.remove(stale)
+        os.makedirs(static_dir, exist_ok=True)
+        # Write then rename, so concurrent sessions never serve half a file
+        with open(f"{target}.tmp", "wb") as file:
+            file.write(content)
+        os.replace(f"{target}.tmp", target)
+    return f"{geometry.STATIC_URL}/{file_name}"
+
+
+def export(
+    specs: Dict[str, Dict],
+    out_dir: str,
+    formats: List[str] = FORMATS,
+    scale: float = SCALE,
+) -> List[str]:
+    """Every spec written to `out_dir` as <name>.<format>."""
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for name, spec in specs.items():
+        for image_format in formats:
+            path = os.path.join(out_dir, f"{name}.{image_format}")
+            with open(path, "wb") as file:
+                file.write(render(spec, image_format, scale))
+            written.append(path)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Render the sections and the whole static dashboard to images."
+    )
+    parser.add_argument("--out-dir", default="export")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=FORMATS)
+    parser.add_argument("--scale", type=float, default=SCALE)
+    parser.add_argument(
+        "--readme",
+        action="store_true",
+        help=f"also write the dashboard to {os.path.relpath(README_IMAGE)}",
+    )
+    args = parser.parse_args()
+    if vlc is None:
+        parser.error("rendering charts needs vl-convert-python")
+    import app
+
+    # From the chart cache when the charts are already built
+    center = app.Center()
+    specs = {name: center.section(name)["dashboard"] for name in app.SECTIONS}
+    specs["dashboard"] = center.dashboard()["dashboard"]
+    for path in export(specs, args.out_dir, args.formats, args.scale):
+        print(path)
+    if args.readme:
+        with open(README_IMAGE, "wb") as file:
+            file.write(render(specs["dashboard"], "png", scale=1))
+        print(README_IMAGE)
@@ -0,0 +1,116 @@
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import storage
+
+
+def levels(
+    values: np.ndarray, base: Optional[float], low: float, high: float, bins: int
+) -> np.ndarray:
+    """
+    Level of every value: 0 at `base`, 1 to `bins` for equal width bins of
+    [low, high] closed on the right (as pd.cut), numbered away from the base,
+    and -1 when missing. Values out of the range go to the closest bin.
+    """
+    edges = np.linspace(low, high, bins + 1)
+    level = np.digitize(values, edges[1:-1], right=True) + 1
+    if base is not None:
+        if base >= high:
+            level = bins + 1 - level
+        level[values == base] = 0
+    level[np.isnan(values)] = -1
+    return level
+
+
+def rates(
+    collisions: pd.DataFrame,
+    weather: pd.DataFrame,
+    base: Dict[str, Optional[float]],
+    bins: int,
+) -> pd.DataFrame:
+    """
+    Collisions per hour of exposure to every level (see `levels`) of each
+    column of `base`, with None for columns without a base value. Bin edges
+    span the weather hours and are shared by both tables, and each table is
+    counted with a single bincount over all the columns.
+    """
+    columns = list(base)
+    ranges = [_range(weather[column], base[column]) for column in columns]
+    counts = {
+        name: _count(df[columns], base, ranges, bins)
+        for name, df in (("HOURS", weather), ("COLLISIONS", collisions))
+    }
+
+    size = bins + 1
+    edges = [np.linspace(low, high, size) for low, high in ranges]
+    df = pd.DataFrame(
+        {
+            "WEATHER": np.repeat(columns, size),
+            "LEVEL": np.tile(np.arange(size), len(columns)),
+            "COLLISIONS": counts["COLLISIONS"],
+            "HOURS": counts["HOURS"],
+        }
+    )
+    # Bounds of each level, from the base value outwards
+    bounds = []
+    for column, column_edges in zip(columns, edges):
+        pairs = list(zip(column_edges[:-1], column_edges[1:]))
+        if base[column] is not None and base[column] >= column_edges[-1]:
+            pairs = [(high, low) for low, high in reversed(pairs)]
+        bounds += [(base[column], base[column])] + pairs
+    df["FROM"], df["TO"] = zip(*bounds)
+    df["COLLISIONS / HOUR"] = df["COLLISIONS"] / df["HOURS"].where(df["HOURS"] > 0)
+    # Columns without a base value have no level 0
+    no_base = df["WEATHER"].map(lambda column: base[column] is None)
+    return df[~(no_base & (df["LEVEL"] == 0))].reset_index(drop=True)
+
+
+def _range(values: pd.Series, base: Optional[float]) -> Tuple[float, float]:
+    rest = values[values.notna() & (values != base)]
+    return (rest.min(), rest.max()) if len(rest) else (0.0, 0.0)
+
+
+def _count(
+    df: pd.DataFrame,
+    base: Dict[str, Optional[float]],
+    ranges: List[Tuple[float, float]],
+    bins: int,
+) -> np.ndarray:
+    # Rows at every level of every column, flattened column after column
+    size = bins + 1
+    codes = np.empty(df.shape, dtype=np.int64)
+    for position, column in enumerate(df.columns):
+        values = df[column].to_numpy(dtype=float)
+        level = levels(values, base[column], *ranges[position], bins)
+        codes[:, position] = np.where(level >= 0, position * size + level, -1)
+    return np.bincount(codes[codes >= 0], minlength=df.shape[1] * size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Collisions per hour of exposure to binned weather conditions."
+    )
+    parser.add_argument(
+        "columns",
+        nargs="+",
+        help="weather columns, as name or name=base (tmpf, relh, sknt, p01i, vsby)",
+    )
+    parser.add_argument("--bins", type=int, default=3)
+    parser.add_argument("--data-dir", default=storage.DATA_DIR)
+    args = parser.parse_args()
+
+    base = {}
+    for column in args.columns:
+        name, _, value = column.partition("=")
+        base[name] = float(value) if value else None
+    print(
+        rates(
+            storage.read_collisions(list(base), args.data_dir),
+            storage.read_weather(list(base), args.data_dir),
+            base,
+            args.bins,
+        ).to_string()
+    )
@@ -0,0 +1,788 @@
+import argparse
+import hashlib
+import inspect
+import os
+import pickle
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+import geometry
+import locate
+import storage
+
+RAW_DIR = "./original-data"
+DATA_DIR = storage.DATA_DIR
+CACHE_DIR = "./.pipeline-cache"
+
+
+class Stage(NamedTuple):
+    function: Callable
+    # Stages whose outputs are passed to the function, in this order
+    inputs: Tuple[str, ...]
+    # Raw files, passed as paths before the inputs
+    files: Tuple[str, ...]
+    # Constants, helpers and modules the function depends on besides its own code
+    uses: Tuple[Any, ...]
+    # Whether the function writes to the data directory, passed before inputs
+    writes: bool
+
+
+STAGES: Dict[str, Stage] = {}
+
+
+def stage(
+    *inputs: str,
+    files: Sequence[str] = (),
+    uses: Sequence[Any] = (),
+    writes: bool = False,
+) -> Callable:
+    def register(function: Callable) -> Callable:
+        STAGES[function.__name__] = Stage(
+            function, tuple(inputs), tuple(files), tuple(uses), writes
+        )
+        return function
+
+    return register
+
+
+VEHICLES = {
+    "Station Wagon/Sport Utility Vehicle": "Car",
+    "Sedan": "Car",
+    "Bus": "Bus",
+    "Tractor Truck Diesel": "Truck",
+    "Taxi": "Car",
+    "E-Scooter": "E-scooter",
+    "Flat Bed": "Truck",
+    "Motorbike": "Motorcycle",
+    "Motorcycle": "Motorcycle",
+    "Box Truck": "Truck",
+    "Pick-up Truck": "Truck",
+    "Bike": "Bicycle",
+    "Dump": "Truck",
+    "Concrete Mixer": "Truck",
+    "Van": "Truck",
+    "PK": "Other",
+    "Golf Cart": "Other",
+    "LIMO": "Car",
+    "Tanker": "Truck",
+    "AMBULANCE": "Ambulance",
+    "Convertible": "Car",
+    "E-Bike": "E-bike",
+    "Moped": "Motorcycle",
+    "Fire Truck": "Truck",
+    "nan": "Other",
+    "Tractor Truck Gasoline": "Truck",
+    "Ambulance": "Ambulance",
+    "forlift": "Other",
+    "MOTOR SKAT": "Other",
+    "FDNY LADDE": "Other",
+    "Tow Truck / Wrecker": "Truck",
+    "FIRE TRUCK": "Truck",
+    "PICK UP": "Other",
+    "Garbage or Refuse": "Truck",
+    "GARBAGE TR": "Truck",
+    "Chassis Cab": "Truck",
+    "Bulk Agriculture": "Other",
+    "Can": "Other",
+    "van": "Truck",
+    "Carry All": "Other",
+    "FLATBED FR": "Truck",
+    "Open Body": "Other",
+    "4 dr sedan": "Car",
+    "Motorscooter": "Motorcycle",
+    "Minibike": "Motorcycle",
+    "Flat Rack": "Other",
+    "Armored Truck": "Truck",
+    "School Bus": "Bus",
+    "FDNY TRUCK": "Truck",
+    "truck": "Truck",
+    "UNK": "Unknown",
+    "TRAILER": "Other",
+    "FIRTRUCK": "Truck",
+    "MOPED": "Motorcycle",
+    "Lift Boom": "Other",
+    "fdny ems": "Other",
+    "AMBULACE": "Ambulance",
+    "bus": "Bus",
+    "BOX TRUCK": "Truck",
+    "Street Swe": "Other",
+    "Scooter": "Motorcycle",
+    "FDNY fire": "Other",
+    "DELIVERY": "Other",
+    "Cement Tru": "Truck",
+    "USPS/GOVT": "Other",
+    "Pedicab": "Other",
+    "TRUCK VAN": "Truck",
+    "UTILITY": "Other",
+    "Pick up tr": "Other",
+    "UNKNOWN": "Unknown",
+    "Multi-Wheeled Vehicle": "Other",
+    "SUV": "Car",
+    "utility": "Other",
+    "POWER SHOV": "Other",
+    "DELIVERY T": "Other",
+    "SWT": "Other",
+    "Trac": "Other",
+    "FDNY AMBUL": "Ambulance",
+    "AMBU": "Other",
+    "USPS": "Other",
+    "FLAT": "Other",
+    "Beverage Truck": "Truck",
+    "E-BIKE": "E-bike",
+    "3-Door": "Car",
+    "Fork Lift": "Other",
+    "Refrigerated Van": "Truck",
+    "PSD": "Other",
+    "Fire Engin": "Other",
+    "FORKLIFT": "Other",
+    "TRAC": "Other",
+    "Tow Truck": "Truck",
+    "COURIER": "Other",
+    "Courier": "Other",
+    "Leased amb": "Other",
+    "SMART CAR": "Car",
+    "message si": "Other",
+    "scooter": "Motorcycle",
+    "E-UNICYCLE": "E-scooter",
+    "Street Cle": "Other",
+    "box": "Other",
+    "F550": "Truck",
+    "DELV": "Other",
+    "SKATEBOARD": "Other",
+    "Lawnmower": "Other",
+    "almbulance": "Other",
+    "dark color": "Other",
+    "Work Van": "Other",
+    "ford van": "Truck",
+    "ambulance": "Ambulance",
+    "Fire truck": "Truck",
+    "Minicycle": "Motorcycle",
+    "PC": "Other",
+    "box truck": "Truck",
+    "FDNY ENGIN": "Other",
+    "commercial": "Other",
+    "Unknown": "Unknown",
+    "Tractor tr": "Truck",
+    "2 dr sedan": "Car",
+    "FD LADDER": "Other",
+    "abulance": "Other",
+    "FDNY Engin": "Other",
+    "OTH": "Other",
+    "Go kart": "Other",
+    "Trailer": "Other",
+    "TRUCK": "Truck",
+    "Stake or Rack": "Other",
+    "COMMERCIAL": "Other",
+    "CHEVY EXPR": "Other",
+    "SLINGSHOT": "Other",
+    "dilevery t": "Other",
+    "FDNY #226": "Other",
+    "FREIGHT FL": "Other",
+    "Fork lift": "Other",
+    "UTIL": "Other",
+    "UNKN": "Other",
+    "FDNY FIRE": "Other",
+    "ELECTRIC S": "Other",
+    "FIRETRUCK": "Truck",
+    "MOVING VAN": "Truck",
+    "usps": "Other",
+    "moped": "Motorcycle",
+    "forklift": "Other",
+    "UPS TRUCK": "Truck",
+    "backhoe": "Other",
+    "Delv": "Other",
+    "dump truck": "Truck",
+    "Freight": "Other",
+    "Horse": "Other",
+    "Cargo Van": "Truck",
+    "USPS VAN": "Other",
+    "TRUCK FLAT": "Truck",
+    "BOBCAT FOR": "Other",
+    "Tractor Tr": "Truck",
+    "Pumper": "Other",
+    "DELIVERY V": "Other",
+    "DOT EQUIPM": "Other",
+    "fire truck": "Truck",
+    "Livestock Rack": "Other",
+    "GEN  AMBUL": "Ambulance",
+    "J1": "Other",
+    "DUMP": "Other",
+    "18 WHEELER": "Truck",
+    "MAIL TRUCK": "Other",
+    "UTILITY VE": "Other",
+    "MOTORSCOOT": "Motorcycle",
+    "government": "Other",
+    "trailer": "Other",
+    "FIRE ENGIN": "Other",
+    "Front-Load": "Other",
+    "DRILL RIG": "Other",
+    "SCOOTER": "Motorcycle",
+    "Wh Ford co": "Other",
+    "suburban": "Car",
+    "E REVEL SC": "Other",
+    "ROAD SWEEP": "Other",
+    "LIGHT TRAI": "Other",
+    "Tractor": "Truck",
+    "UT": "Other",
+    "USPS TRUCK": "Other",
+    "cross": "Other",
+    "Van Camper": "Other",
+    "AMBULENCE": "Ambulance",
+    "FOOD TRUCK": "Other",
+    "Bucket Tru": "Other",
+    "gator": "Other",
+    "FDNY Ambul": "Ambulance",
+    "JOHN DEERE": "Other",
+    "f-250": "Other",
+    "MECHANICAL": "Other",
+    "WORK VAN": "Other",
+    "NYC FD": "Other",
+    "MTA BUS": "Bus",
+    "NYC AMBULA": "Ambulance",
+    "GOLF CART": "Other",
+    "FLATBED": "Truck",
+    "Trc": "Other",
+    "FORK LIFT": "Other",
+    "Pick up Tr": "Other",
+    "postal bus": "Bus",
+    "F150XL PIC": "Other",
+    "ambu": "Other",
+    "Pick up": "Other",
+    "CAT": "Other",
+    "ELEC. UNIC": "E-scooter",
+    "1C": "Other",
+    "SCOOT": "Motorcycle",
+    "FREIG": "Other",
+    "AMBUL": "Ambulance",
+    "VAN T": "Other",
+    "MINI": "Other",
+    "Garba": "Other",
+    "motor": "Other",
+    "Lunch Wagon": "Other",
+    "E-Bik": "E-bike",
+    "Ambul": "Ambulance",
+    "FDNY": "Other",
+    "SCHOO": "Other",
+    "Comm": "Other",
+    "Fire": "Other",
+    "Sanit": "Other",
+    "mail": "Other",
+    "RV": "Other",
+    "GARBA": "Other",
+    "ambul": "Ambulance",
+    "FIRET": "Other",
+    "FIRE": "Other",
+    "SELF": "Other",
+    "STAK": "Other",
+    "WORKH": "Other",
+    "FORKL": "Other",
+    "Tract": "Other",
+    "freig": "Other",
+    "DELIV": "Other",
+    "trail": "Other",
+    "PICKU": "Other",
+    "Dumps": "Other",
+    "forkl": "Other",
+    "fire": "Other",
+    "TRK": "Other",
+    "ELECT": "Other",
+    "2- to": "Other",
+    "BROOM": "Other",
+    "TRAIL": "Other",
+    "EBIKE": "E-bike",
+    "Trail": "Other",
+    "Glass Rack": "Other",
+    "Motorized Home": "Other",
+    "US POSTAL": "Other",
+    "TRT": "Other",
+    "BLOCK": "Other",
+    "pas": "Other",
+    "COM": "Other",
+    "CONCR": "Other",
+    "Pallet": "Other",
+    "unknown": "Unknown",
+    "CHERR": "Other",
+    "UTV": "Other",
+    "MOTOR": "Other",
+    "MTA B": "Bus",
+    "TRACT": "Other",
+    "NYC": "Other",
+    "UHAUL": "Other",
+    "scoot": "Motorcycle",
+    "FED E": "Other",
+    "COMME": "Other",
+    "TRLR": "Other",
+    "LOADE": "Other",
+    "rv": "Other",
+    "TOWER": "Other",
+    "Pick": "Other",
+    "AMB": "Other",
+    "NS AM": "Other",
+    "UNKNO": "Unknown",
+    "NEW Y": "Other",
+    "TOW T": "Other",
+    "GRAY": "Other",
+    "tract": "Other",
+    "STREE": "Other",
+    "MAIL": "Other",
+    "e-bik": "E-bike",
+    "unk": "Unknown",
+    "box t": "Other",
+    "CRANE": "Other",
+    "garba": "Other",
+    "Pickup with mounted Camper": "Other",
+    "FRONT": "Other",
+    "Sprin": "Other",
+    "delv": "Other",
+    "POWER": "Other",
+    "Box t": "Other",
+    "CAMP": "Other",
+    "Enclosed Body - Removable Enclosure": "Other",
+    "RGS": "Other",
+    "GOVER": "Other",
+    "FORK": "Other",
+    "UTILI": "Other",
+    "POSTO": "Other",
+    "firet": "Other",
+    "WORK": "Other",
+    "R/V C": "Other",
+    "sgws": "Other",
+    "Cat 9": "Other",
+    "BACKH": "Other",
+    "E-MOT": "E-scooter",
+    "MACK": "Other",
+    "SPC": "Other",
+    "fork": "Other",
+    "OMR": "Other",
+    "semi": "Other",
+    "FORK-": "Other",
+    "Wheel": "Other",
+    "Utili": "Other",
+    "E-BIK": "E-bike",
+    "fd tr": "Other",
+    "SWEEP": "Other",
+    "BOX T": "Other",
+    "CASE": "Other",
+    "FD TR": "Other",
+    "Work": "Other",
+    "LIBER": "Other",
+    "fdny": "Other",
+    "COMB": "Other",
+    "HEAVY": "Other",
+    "DUMPS": "Other",
+    "MTA b": "Bus",
+    "Hopper": "Other",
+    "R/V": "Other",
+    "FOOD": "Other",
+    "FD tr": "Other",
+    "Spc": "Other",
+    "BED T": "Other",
+    "comme": "Other",
+    "UPS T": "Other",
+    "PAS": "Other",
+    "BICYC": "Bicycle",
+    "Subn": "Other",
+    "WHEEL": "Other",
+    "Util": "Other",
+    "ACCES": "Other",
+    "e sco": "E-scooter",
+    "BOBCA": "Other",
+    "TANK": "Other",
+    "TRACK": "Other",
+    "utili": "Other",
+    "DEMA-": "Other",
+    "tow": "Other",
+    "dump": "Other",
+    "Elect": "Other",
+    "deliv": "Other",
+    "Backh": "Other",
+    "CEMEN": "Other",
+    "99999": "Other",
+    "BULLD": "Other",
+    "seagr": "Other",
+    "schoo": "Other",
+    "CONST": "Other",
+    "self": "Other",
+    "BK": "Other",
+    "Semi": "Other",
+    "Scoot": "Motorcycle",
+    "NYPD": "Other",
+    "Taxis": "Car",
+}
+
+FACTORS = {
+    "Driver Inattention/Distraction": "Driver Inattention",
+    "Unspecified": "Unspecified",
+    "Following Too Closely": "Driving Infraction",
+    "Failure to Yield Right-of-Way": "Driving Infraction",
+    "Backing Unsafely": "Driving Infraction",
+    "Passing or Lane Usage Improper": "Driving Infraction",
+    "Passing Too Closely": "Driving Infraction",
+    "Other Vehicular": "Unspecified",
+    "Unsafe Lane Changing": "Driving Infraction",
+    "Turning Improperly": "Driving Infraction",
+    "Traffic Control Disregarded": "Driving Infraction",
+    "Unsafe Speed": "Driving Infraction",
+    "Driver Inexperience": "Driving Inexperience",
+    "Reaction to Uninvolved Vehicle": "Unspecified",
+    "Alcohol Involvement": "Substance Abuse",
+    "View Obstructed/Limited": "Environmental Factors",
+    "Pedestrian/Bicyclist/Other Pedestrian Error/Confusion": "Pedestrian Error",
+    "Oversized Vehicle": "Oversized Vehicle",
+    "Aggressive Driving/Road Rage": "Driving Behavior",
+    "Pavement Slippery": "Environmental Factors",
+    "Brakes Defective": "Vehicle Defect",
+    "Passenger Distraction": "Driver Inattention",
+    "Fell Asleep": "Medical Condition",
+    "Obstruction/Debris": "Environmental Factors",
+    "Outside Car Distraction": "Environmental Factors",
+    "Steering Failure": "Vehicle Defect",
+    "Tire Failure/Inadequate": "Vehicle Defect",
+    "Pavement Defective": "Environmental Factors",
+    "Glare": "Environmental Factors",
+    "Failure to Keep Right": "Driving Infraction",
+    "Illnes": "Medical Condition",
+    "Fatigued/Drowsy": "Medical Condition",
+    "Lost Consciousness": "Medical Condition",
+    "Driverless/Runaway Vehicle": "Driverless Vehicle",
+    "Drugs (illegal)": "Substance Abuse",
+    "Animals Action": "Environmental Factors",
+    "Accelerator Defective": "Vehicle Defect",
+    "Cell Phone (hand-Held)": "Driver Inattention",
+    "Lane Marking Improper/Inadequate": "Environmental Factors",
+    "Traffic Control Device Improper/Non-Working": "Environmental Factors",
+    "Physical Disability": "Medical Condition",
+    "Other Electronic Device": "Driver Inattention",
+    "Other Lighting Defects": "Vehicle Defect",
+    "Vehicle Vandalism": "Unspecified",
+    "Prescription Medication": "Medical Condition",
+    "Tinted Windows": "Vehicle Defect",
+    "Eating or Drinking": "Driver Inattention",
+    "Shoulders Defective/Improper": "Vehicle Defect",
+    "Headlights Defective": "Vehicle Defect",
+    "Using On Board Navigation Device": "Driver Inattention",
+    "Cell Phone (hands-free)": "Driver Inattention",
+    "Tow Hitch Defective": "Vehicle Defect",
+    "Windshield Inadequate": "Vehicle Defect",
+    "Texting": "Driver Inattention",
+    "Listening/Using Headphones": "Driver Inattention",
+}
+
+# Station [NYC] NEW YORK CITY of the ASOS network, per year
+WEATHER_FILES = ["NYC_weather_2018.csv", "NYC_weather_2020.csv"]
+WEATHER_COLUMNS = ["valid", "tmpf", "relh", "sknt", "p01i", "vsby"]
+
+# Months in which the wind speed sensor stopped for a while, its longest gap in
+# each is left missing instead of interpolated
+SENSOR_GAPS = [("2018-09-01", "2018-09-30"), ("2020-06-01", "2020-06-30")]
+
+# NYC land area in km2 (wikipedia), split between districts by map area
+NYC_KM2 = 783.84
+
+COLLISIONS_COLUMNS = [
+    "CRASH DATETIME",
+    "CRASH WEEKDAY",
+    "AFTER COVID",
+    "BOROUGH",
+    "LATITUDE",
+    "LONGITUDE",
+    "NUMBER OF PERSONS INJURED",
+    "NUMBER OF PERSONS KILLED",
+    "ORIGINAL VEHICLE",
+    "VEHICLE",
+    "ORIGINAL FACTOR",
+    "FACTOR",
+    "LOCATION",
+    "tmpf",
+    "relh",
+    "sknt",
+    "p01i",
+    "vsby",
+    "DISTRICT",
+]
+
+
+def _sensor_gap(weather: pd.DataFrame, start: str, end: str) -> Tuple[str, str]:
+    # First and last observation around the longest run of missing wind speeds
+    period = weather[(weather["valid"] >= start) & (weather["valid"] < end)]
+    missing = period["sknt"].isna()
+    group = (~missing).cumsum()
+    longest = missing.groupby(group).sum().idxmax()
+    return (
+        period.loc[group.eq(longest).idxmax(), "valid"],
+        period.loc[group.eq(longest + 1).idxmax(), "valid"],
+    )
+
+
+def parse(collisions: pd.DataFrame) -> pd.DataFrame:
+    """Crash hour, weekday and period of raw collisions, as whole columns."""
+    # Truncated to the hour, most crashes already are
+    collisions["CRASH DATETIME"] = pd.to_datetime(
+        collisions["CRASH DATE"] + " " + collisions["CRASH TIME"]
+    ).dt.floor("h")
+    collisions["CRASH WEEKDAY"] = collisions["CRASH DATETIME"].dt.day_name()
+    collisions["AFTER COVID"] = (
+        collisions["CRASH DATETIME"].dt.year >= storage.COVID_YEAR
+    )
+    return collisions
+
+
+@stage(files=["collisions.csv"], uses=[storage.COVID_YEAR, parse])
+def load(collisions_csv: str) -> pd.DataFrame:
+    return parse(pd.read_csv(collisions_csv, low_memory=False))
+
+
+@stage("load")
+def clean(collisions: pd.DataFrame) -> pd.DataFrame:
+    collisions = collisions[
+        [
+            "CRASH DATETIME",
+            "CRASH WEEKDAY",
+            "AFTER COVID",
+            "BOROUGH",
+            "LATITUDE",
+            "LONGITUDE",
+            "NUMBER OF PERSONS INJURED",
+            "NUMBER OF PERSONS KILLED",
+            "VEHICLE TYPE CODE 1",
+            "CONTRIBUTING FACTOR VEHICLE 1",
+        ]
+    ].fillna({"NUMBER OF PERSONS INJURED": 0, "NUMBER OF PERSONS KILLED": 0})
+
+    # Coordinates that don't make sense for NYC are missing
+    latitude = collisions["LATITUDE"].where(collisions["LATITUDE"].between(38, 42))
+    longitude = collisions["LONGITUDE"].where(collisions["LONGITUDE"].between(-76, -72))
+    located = latitude.notna() & longitude.notna()
+    collisions = collisions.assign(
+        LATITUDE=latitude,
+        LONGITUDE=longitude,
+        LOCATION=("[" + latitude.astype(str) + ", " + longitude.astype(str) + "]")
+        .where(located)
+        .astype(object),
+    )
+    # Rows with neither a location nor a borough are useless
+    return collisions[located | collisions["BOROUGH"].notna()]
+
+
+@stage("clean", uses=[VEHICLES, FACTORS])
+def classify(collisions: pd.DataFrame) -> pd.DataFrame:
+    vehicles = collisions["VEHICLE TYPE CODE 1"].fillna("unknown")
+    factors = collisions["CONTRIBUTING FACTOR VEHICLE 1"].fillna("Unspecified")
+    # Values without a class are kept as they are
+    return collisions.drop(
+        columns=["VEHICLE TYPE CODE 1", "CONTRIBUTING FACTOR VEHICLE 1"]
+    ).assign(
+        **{
+            "ORIGINAL VEHICLE": vehicles,
+            "VEHICLE": vehicles.map(VEHICLES).fillna(vehicles),
+            "ORIGINAL FACTOR": factors,
+            "FACTOR": factors.map(FACTORS).fillna(factors),
+        }
+    )
+
+
+@stage(files=WEATHER_FILES, uses=[WEATHER_COLUMNS, SENSOR_GAPS, _sensor_gap])
+def weather(*weather_csvs: str) -> pd.DataFrame:
+    weather = pd.concat([pd.read_csv(path) for path in weather_csvs], ignore_index=True)
+    # M and T stand for missing values (see the network docs)
+    weather = weather[WEATHER_COLUMNS].replace({"M": None, "T": None})
+    weather[WEATHER_COLUMNS[1:]] = weather[WEATHER_COLUMNS[1:]].apply(pd.to_numeric)
+
+    stopped = pd.Series(False, index=weather.index)
+    for start, end in SENSOR_GAPS:
+        first, last = _sensor_gap(weather, start, end)
+        stopped |= (weather["valid"] >= first) & (weather["valid"] <= last)
+    weather.loc[~stopped, "sknt"] = weather.loc[~stopped, "sknt"].interpolate()
+    weather["p01i"] = weather["p01i"].interpolate()
+    # Visibility is missing along with temperature, only fill the other gaps
+    measured = weather["tmpf"].notna()
+    weather.loc[measured, "vsby"] = weather.loc[measured, "vsby"].interpolate()
+
+    # To the International System of Units
+    weather["tmpf"] = (weather["tmpf"] - 32) * 5 / 9
+    weather["sknt"] = weather["sknt"] * 1.852
+    weather["p01i"] = weather["p01i"] * 2.54
+    weather["vsby"] = weather["vsby"] * 1.609344
+
+    weather["valid"] = pd.to_datetime(weather["valid"]).dt.floor("h")
+    return weather.groupby("valid").mean().reset_index()
+
+
+@stage("classify", "weather")
+def join(collisions: pd.DataFrame, weather: pd.DataFrame) -> pd.DataFrame:
+    return collisions.merge(
+        weather, how="outer", right_on="valid", left_on="CRASH DATETIME"
+    ).drop(columns="valid")
+
+
+@stage("join", files=["map.geojson"], uses=[locate])
+def districts(map_geojson: str, collisions: pd.DataFrame) -> pd.DataFrame:
+    positions = locate.locate(
+        collisions["LONGITUDE"], collisions["LATITUDE"], gpd.read_file(map_geojson)
+    )
+    return collisions.assign(DISTRICT=positions).replace({"DISTRICT": {-1: np.nan}})
+
+
+def count(map_geojson: str, counts: pd.Series) -> gpd.GeoDataFrame:
+    """Districts of the map with their area and `counts` collisions."""
+    map_data = gpd.read_file(map_geojson)
+    map_data["COLLISIONS"] = counts
+    # Areas in degrees, only their proportions are used
+    map_data["AREA"] = map_data["geometry"].area
+    map_data["AREA PROPORTION"] = map_data["AREA"] / map_data["AREA"].sum()
+    map_data["AREA KM2"] = NYC_KM2 * map_data["AREA PROPORTION"]
+    map_data["COLLISIONS / KM2"] = map_data["COLLISIONS"] / map_data["AREA KM2"]
+    return map_data
+
+
+@stage("districts", files=["map.geojson"], uses=[NYC_KM2, count])
+def aggregate(map_geojson: str, collisions: pd.DataFrame) -> gpd.GeoDataFrame:
+    return count(map_geojson, collisions.groupby("DISTRICT").size())
+
+
+@stage("districts", "weather", "aggregate", writes=True, uses=[storage, geometry])
+def export(
+    data_dir: str,
+    collisions: pd.DataFrame,
+    weather: pd.DataFrame,
+    map_data: gpd.GeoDataFrame,
+) -> List[str]:
+    os.makedirs(data_dir, exist_ok=True)
+    written = []
+    for name, df in (
+        (storage.COLLISIONS, collisions[COLLISIONS_COLUMNS]),
+        (storage.WEATHER, weather),
+    ):
+        path = os.path.join(data_dir, f"{name}.csv")
+        df.to_csv(path, index=False)
+        written.append(path)
+    map_path = os.path.join(data_dir, f"{geometry.NAME}.geojson")
+    map_data.to_file(map_path, driver="GeoJSON")
+    written.append(map_path)
+    written += storage.convert(data_dir)
+    geometry.build(map_path, data_dir)
+    return written + [geometry.path(level, data_dir) for level in geometry.LEVELS]
+
+
+class Pipeline:
+    """
+    Runs STAGES on demand. Every stage output is cached on disk under a key
+    hashing its code, the constants it uses, the content of its raw files and
+    the keys of its inputs, so a stage only runs again when one of those
+    changed, and upstream outputs are only loaded when a stage has to run.
+    """
+
+    def __init__(
+        self,
+        raw_dir: str = RAW_DIR,
+        data_dir: str = DATA_DIR,
+        cache_dir: str = CACHE_DIR,
+        force: bool = False,
+    ) -> None:
+        self.raw_dir = raw_dir
+        self.data_dir = data_dir
+        self.cache_dir = cache_dir
+        self.force = force
+        self.keys: Dict[str, str] = {}
+        self.outputs: Dict[str, Any] = {}
+        # Stage -> ("cached" or "ran", seconds), in the order they finished
+        self.log: Dict[str, Tuple[str, float]] = {}
+
+    def key(self, name: str) -> str:
+        if name not in self.keys:
+            stage = STAGES[name]
+            digest = hashlib.sha256(name.encode())
+            for code in (stage.function, *stage.uses):
+                digest.update(_source(code).encode())
+            for file in stage.files:
+                digest.update(_file_hash(os.path.join(self.raw_dir, file)).encode())
+            if stage.writes:
+                digest.update(os.path.abspath(self.data_dir).encode())
+            for upstream in stage.inputs:
+                digest.update(self.key(upstream).encode())
+            self.keys[name] = digest.hexdigest()[:16]
+        return self.keys[name]
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, f"{name}-{self.key(name)}.pkl")
+
+    def output(self, name: str) -> Any:
+        if name in self.outputs:
+            return self.outputs[name]
+        start = time.perf_counter()
+        if not self.force and self._is_cached(name):
+            with open(self.path(name), "rb") as file:
+                self.outputs[name] = pickle.load(file)
+            status = "cached"
+        else:
+            stage = STAGES[name]
+            args = [os.path.join(self.raw_dir, file) for file in stage.files]
+            if stage.writes:
+                args.append(self.data_dir)
+            args += [self.output(upstream) for upstream in stage.inputs]
+            start = time.perf_counter()
+            self.outputs[name] = stage.function(*args)
+            self._store(name)
+            status = "ran"
+        self.log[name] = (status, time.perf_counter() - start)
+        return self.outputs[name]
+
+    def _is_cached(self, name: str) -> bool:
+        if not os.path.exists(self.path(name)):
+            return False
+        if not STAGES[name].writes:
+            return True
+        # Written files may have been deleted since
+        with open(self.path(name), "rb") as file:
+            return all(os.path.exists(path) for path in pickle.load(file))
+
+    def _store(self, name: str) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for file in os.listdir(self.cache_dir):
+            if file.startswith(f"{name}-") and file.endswith(".pkl"):
+                os.remove(os.path.join(self.cache_dir, file))
+        # Write then rename, so an interrupted run never leaves a broken cache
+        with open(f"{self.path(name)}.tmp", "wb") as file:
+            pickle.dump(self.outputs[name], file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{self.path(name)}.tmp", self.path(name))
+
+
+def _source(code: Any) -> str:
+    if inspect.ismodule(code) or callable(code):
+        return inspect.getsource(code)
+    return repr(code)
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Regenerate the processed data, only running outdated stages."
+    )
+    parser.add_argument(
+        "stages", nargs="*", help=f"any of {', '.join(STAGES)} (default: export)"
+    )
+    parser.add_argument("--raw-dir", default=RAW_DIR)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--force", action="store_true", help="ignore cached outputs")
+    args = parser.parse_args()
+    for name in args.stages:
+        if name not in STAGES:
+            parser.error(f"unknown stage {name!r}")
+
+    pipeline = Pipeline(args.raw_dir, args.data_dir, args.cache_dir, args.force)
+    for name in args.stages or ["export"]:
+        pipeline.output(name)
+    for name, (status, seconds) in pipeline.log.items():
+        print(f"{name:10} {status:7} {seconds:8.2f}s")
@@ -0,0 +1,224 @@
+import argparse
+import collections
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import geometry
+import pipeline
+import storage
+
+# Raw collisions read and processed at a time by each worker
+CHUNK_ROWS = 200_000
+# Processes sharing the chunks and then the months, 1 runs them one by one
+WORKERS = os.cpu_count() or 1
+
+
+def process_chunk(
+    number: int, chunk: pd.DataFrame, map_geojson: str, shard_dir: str
+) -> Tuple[pd.Series, pd.DataFrame, np.ndarray]:
+    """
+    Parse, clean, classify and place in their district a chunk of raw
+    collisions, as the full pipeline does, and write every month of it to its
+    own piece in `shard_dir`. Returns the collisions of every district, the
+    columns and their types, and the hours with collisions.
+    """
+    collisions = pipeline.classify(pipeline.clean(pipeline.parse(chunk)))
+    # Placed before the weather join, which only adds rows without location
+    collisions = pipeline.districts(map_geojson, collisions)
+    for partition, df in storage.split(collisions):
+        path = os.path.join(_month_dir(shard_dir, partition), f"{number:06}.pkl")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_pickle(path)
+    return (
+        collisions.groupby("DISTRICT").size(),
+        collisions.head(0),
+        collisions["CRASH DATETIME"].unique(),
+    )
+
+
+def process_month(
+    partition: storage.Partition,
+    shard_dir: str,
+    weather: pd.DataFrame,
+    template: pd.DataFrame,
+    dtypes: pd.Series,
+    data_dir: str,
+) -> Tuple[pd.DataFrame, List[str]]:
+    """
+    Join the pieces of a month with its weather hours, as the full pipeline
+    joins everything, with the types of the whole output, and write its rows
+    of the CSV and its partition. Returns its weather hours without
+    collisions, which have no month, and the partitions written.
+    """
+    directory = _month_dir(shard_dir, partition)
+    names = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+    # Chunk after chunk, as they were in the raw export
+    pieces = [pd.read_pickle(os.path.join(directory, name)) for name in names]
+    collisions = pd.concat([template] + pieces, ignore_index=True)
+    collisions = pipeline.join(collisions, weather).astype(dtypes)
+    collisions = collisions[pipeline.COLLISIONS_COLUMNS]
+    collisions.to_csv(f"{directory}.csv", header=False, index=False)
+
+    dated = collisions["CRASH DATETIME"].notna()
+    written = storage.write_partitions(
+        storage.with_dtypes(collisions[dated].copy()), data_dir
+    )
+    return collisions[~dated], written
+
+
+def run(
+    raw_dir: str = pipeline.RAW_DIR,
+    data_dir: str = pipeline.DATA_DIR,
+    cache_dir: str = pipeline.CACHE_DIR,
+    chunk_rows: int = CHUNK_ROWS,
+    workers: int = WORKERS,
+) -> Dict[str, Tuple[int, float]]:
+    """
+    Write the same processed data as a full pipeline run, from chunks of
+    `chunk_rows` raw collisions processed by `workers` processes. Memory is
+    bounded by the chunks in flight, then by the months in flight, each month
+    loaded whole, so it grows with the largest month rather than the export.
+    The chunks are cleaned, classified and placed in their district, then
+    every month is joined with its weather hours and written, and the map
+    gets the collisions counted by the chunks. Returns the number of tasks
+    and the seconds of each phase.
+    """
+    log = {}
+    start = time.perf_counter()
+    # From the pipeline cache when it is up to date
+    weather = pipeline.Pipeline(raw_dir, data_dir, cache_dir).output("weather")
+    map_geojson = os.path.join(raw_dir, f"{geometry.NAME}.geojson")
+    os.makedirs(cache_dir, exist_ok=True)
+    os.makedirs(data_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=cache_dir) as shard_dir:
+        with _pool(workers) as pool:
+            path = os.path.join(raw_dir, "collisions.csv")
+            chunks = pd.read_csv(path, chunksize=chunk_rows)
+            tasks = (
+                (number, chunk, map_geojson, shard_dir)
+                for number, chunk in enumerate(chunks)
+            )
+            results = list(_imap(pool, process_chunk, tasks, 2 * workers))
+            if not results:
+                # No rows to chunk, the header alone still gives the columns
+                empty = pd.read_csv(path, nrows=0)
+                results.append(process_chunk(0, empty, map_geojson, shard_dir))
+            counts, templates, hours = zip(*results)
+            log["chunks"] = (len(counts), time.perf_counter() - start)
+
+            start = time.perf_counter()
+            template = pd.concat(templates)
+            # Weather hours without collisions make some columns wider
+            alone = weather[~weather["valid"].isin(np.concatenate(hours))]
+            dtypes = pipeline.join(template, alone).dtypes
+            months = _months(weather, shard_dir)
+            tasks = (
+                (partition, shard_dir, hours, template, dtypes, data_dir)
+                for partition, hours in months.items()
+            )
+            results = list(_imap(pool, process_month, tasks, 2 * workers))
+            log["months"] = (len(results), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        written = [path for _, paths in results for path in paths]
+        undated = pd.concat([rows for rows, _ in results], ignore_index=True)
+        written += storage.write_partitions(storage.with_dtypes(undated), data_dir)
+        for partition in [None] + storage.partitions(data_dir):
+            path = storage.partition_path(partition, data_dir)
+            if os.path.exists(path) and path not in written:
+                os.remove(path)
+        _concat_csv(
+            [f"{_month_dir(shard_dir, partition)}.csv" for partition in months],
+            pipeline.COLLISIONS_COLUMNS,
+            os.path.join(data_dir, f"{storage.COLLISIONS}.csv"),
+        )
+
+    weather.to_csv(os.path.join(data_dir, f"{storage.WEATHER}.csv"), index=False)
+    storage.convert(data_dir, names=[storage.WEATHER])
+    map_data = pipeline.count(map_geojson, pd.concat(counts).groupby(level=0).sum())
+    map_path = os.path.join(data_dir, f"{geometry.NAME}.geojson")
+    map_data.to_file(map_path, driver="GeoJSON")
+    geometry.build(map_path, data_dir)
+    log["export"] = (1, time.perf_counter() - start)
+    return log
+
+
+def _month_dir(shard_dir: str, partition: storage.Partition) -> str:
+    year, month = partition
+    return os.path.join(shard_dir, f"{year}-{month:02}")
+
+
+def _months(
+    weather: pd.DataFrame, shard_dir: str
+) -> Dict[storage.Partition, pd.DataFrame]:
+    # Every month with collisions or weather, in order, with its weather hours
+    datetimes = weather["valid"].dt
+    hours = {
+        (int(year), int(month)): df
+        for (year, month), df in weather.groupby([datetimes.year, datetimes.month])
+    }
+    for name in os.listdir(shard_dir):
+        year, month = name.split("-")
+        hours.setdefault((int(year), int(month)), weather.head(0))
+    return dict(sorted(hours.items()))
+
+
+def _pool(workers: int) -> Any:
+    # No processes to start nor data to send for a single worker
+    return ProcessPoolExecutor(workers) if workers > 1 else contextlib.nullcontext()
+
+
+def _imap(
+    pool: Optional[ProcessPoolExecutor],
+    function: Callable,
+    tasks: Iterable[Tuple],
+    window: int,
+) -> Iterator[Any]:
+    # Results in order, with at most `window` tasks (and their data) in flight
+    if pool is None:
+        for task in tasks:
+            yield function(*task)
+        return
+    pending: collections.deque = collections.deque()
+    for task in tasks:
+        pending.append(pool.submit(function, *task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _concat_csv(paths: List[str], columns: List[str], target: str) -> None:
+    # Write then rename, so the apps never read half a file
+    with open(f"{target}.tmp", "w", encoding="utf-8", newline="") as file:
+        pd.DataFrame(columns=columns).to_csv(file, index=False)
+        for path in paths:
+            with open(path, encoding="utf-8", newline="") as part:
+                shutil.copyfileobj(part, file)
+    os.replace(f"{target}.tmp", target)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Regenerate the processed data from chunks of the raw "
+        "collisions, processed by a pool of workers."
+    )
+    parser.add_argument("--raw-dir", default=pipeline.RAW_DIR)
+    parser.add_argument("--data-dir", default=pipeline.DATA_DIR)
+    parser.add_argument("--cache-dir", default=pipeline.CACHE_DIR)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+    log = run(
+        args.raw_dir, args.data_dir, args.cache_dir, args.chunk_rows, args.workers
+    )
+    for name, (tasks, seconds) in log.items():
+        print(f"{name:10} {tasks:7} {seconds:8.2f}s")
@@ -0,0 +1,170 @@
+import argparse
+import os
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+DATA_DIR = "./processed-data"
+COLLISIONS = "collisions"
+WEATHER = "weather"
+
+# Collisions are stored by month, in <COLLISIONS>/<year>/<month>.parquet, so
+# loaders only read the months they need
+Partition = Tuple[int, int]
+# Rows without a crash time (weather hours without collisions, left by the
+# outer join with the weather) have no month, they are stored apart and only
+# read along with every month
+UNDATED = "undated"
+# Collisions from this year on are AFTER COVID
+COVID_YEAR = 2020
+
+# Repeated strings are stored dictionary-encoded
+CATEGORIES = [
+    "CRASH WEEKDAY",
+    "BOROUGH",
+    "ORIGINAL VEHICLE",
+    "VEHICLE",
+    "ORIGINAL FACTOR",
+    "FACTOR",
+]
+DATETIMES = ["CRASH DATETIME", "valid"]
+
+
+def with_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    for column in df.columns:
+        if column in CATEGORIES:
+            df[column] = df[column].astype("category")
+        elif column in DATETIMES:
+            df[column] = pd.to_datetime(df[column])
+    return df
+
+
+def _read(
+    name: str, columns: Optional[List[str]] = None, data_dir: str = DATA_DIR
+) -> pd.DataFrame:
+    path = os.path.join(data_dir, f"{name}.parquet")
+    if os.path.exists(path):
+        return pd.read_parquet(path, columns=columns)
+    # Not converted yet, parse the CSV but keep the same dtypes
+    path = os.path.join(data_dir, f"{name}.csv")
+    return with_dtypes(pd.read_csv(path, usecols=columns))
+
+
+def partition_path(partition: Optional[Partition], data_dir: str = DATA_DIR) -> str:
+    if partition is None:
+        return os.path.join(data_dir, COLLISIONS, f"{UNDATED}.parquet")
+    year, month = partition
+    return os.path.join(data_dir, COLLISIONS, str(year), f"{month:02}.parquet")
+
+
+def partitions(data_dir: str = DATA_DIR) -> List[Partition]:
+    """
+    Year and month of every partition of the collisions, in order, from the
+    file names only.
+    """
+    root = os.path.join(data_dir, COLLISIONS)
+    if not os.path.isdir(root):
+        # Not converted yet, the months of the CSV
+        path = os.path.join(data_dir, f"{COLLISIONS}.csv")
+        datetimes = pd.to_datetime(pd.read_csv(path, usecols=DATETIMES[:1]).iloc[:, 0])
+        datetimes = datetimes.dropna().dt
+        return sorted(set(zip(datetimes.year, datetimes.month)))
+    found = []
+    for year in filter(str.isdigit, os.listdir(root)):
+        for name in os.listdir(os.path.join(root, year)):
+            month, extension = os.path.splitext(name)
+            if extension == ".parquet" and month.isdigit():
+                found.append((int(year), int(month)))
+    return sorted(found)
+
+
+def split(
+    collisions: pd.DataFrame,
+) -> Iterator[Tuple[Optional[Partition], pd.DataFrame]]:
+    """
+    The collisions of every month of `collisions`, with its partition, and
+    those without a crash time with None.
+    """
+    datetimes = pd.to_datetime(collisions[DATETIMES[0]]).dt
+    grouped = collisions.groupby([datetimes.year, datetimes.month], dropna=False)
+    for (year, month), df in grouped:
+        yield (None if pd.isna(year) else (int(year), int(month))), df
+
+
+def write_partitions(collisions: pd.DataFrame, data_dir: str = DATA_DIR) -> List[str]:
+    """Replace the partition of every month of `collisions` with its rows."""
+    written = []
+    for partition, df in split(collisions):
+        path = partition_path(partition, data_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so the app never reads half a file
+        df.to_parquet(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
+        written.append(path)
+    return written
+
+
+def read_collisions(
+    columns: Optional[List[str]] = None,
+    data_dir: str = DATA_DIR,
+    months: Optional[Sequence[Partition]] = None,
+) -> pd.DataFrame:
+    """
+    Collisions of the `months` partitions, all of them (and the undated rows)
+    by default. Only the files of those months are read.
+    """
+    if os.path.isdir(os.path.join(data_dir, COLLISIONS)):
+        if months is None:
+            paths = [partition_path(month, data_dir) for month in partitions(data_dir)]
+            paths.append(partition_path(None, data_dir))
+        else:
+            paths = [partition_path(month, data_dir) for month in months]
+        return pd.read_parquet(
+            [path for path in paths if os.path.exists(path)], columns=columns
+        )
+    # Not split by month yet
+    usecols = None if columns is None else list(dict.fromkeys(columns + DATETIMES[:1]))
+    collisions = _read(COLLISIONS, usecols, data_dir)
+    if months is not None:
+        datetimes = collisions[DATETIMES[0]].dt
+        keep = (datetimes.year * 100 + datetimes.month).isin(
+            [year * 100 + month for year, month in months]
+        )
+        collisions = collisions[keep].reset_index(drop=True)
+    return collisions if columns is None else collisions[columns]
+
+
+def read_weather(
+    columns: Optional[List[str]] = None, data_dir: str = DATA_DIR
+) -> pd.DataFrame:
+    return _read(WEATHER, columns, data_dir)
+
+
+def convert(
+    data_dir: str = DATA_DIR, names: Sequence[str] = (COLLISIONS, WEATHER)
+) -> List[str]:
+    converted = []
+    csv_path = os.path.join(data_dir, f"{COLLISIONS}.csv")
+    if COLLISIONS in names and os.path.exists(csv_path):
+        converted += write_partitions(with_dtypes(pd.read_csv(csv_path)), data_dir)
+        # Months no longer in the CSV
+        for partition in [None] + partitions(data_dir):
+            path = partition_path(partition, data_dir)
+            if os.path.exists(path) and path not in converted:
+                os.remove(path)
+    csv_path = os.path.join(data_dir, f"{WEATHER}.csv")
+    if WEATHER in names and os.path.exists(csv_path):
+        path = os.path.join(data_dir, f"{WEATHER}.parquet")
+        with_dtypes(pd.read_csv(csv_path)).to_parquet(path, index=False)
+        converted.append(path)
+    return converted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert the processed collisions and weather CSVs to Parquet, "
+        "the collisions by month."
+    )
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    for path in convert(parser.parse_args().data_dir):
+        print(path)
@@ -0,0 +1,141 @@
+import argparse
+import os
+import shutil
+from typing import List, NamedTuple
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import geometry
+import locate
+import storage
+
+SEED = 0
+# Rows generated and written at a time, which bounds the memory used
+CHUNK_ROWS = 100_000
+
+# Standard deviation of the noise added to coordinates, in degrees (~30 m)
+JITTER = 0.0003
+
+
+class Model(NamedTuple):
+    collisions: pd.DataFrame
+    # Weather hours without collisions, left by the outer join with the weather
+    hours: pd.DataFrame
+    areas: gpd.GeoDataFrame
+
+
+def fit(collisions: pd.DataFrame, areas: gpd.GeoDataFrame) -> Model:
+    happened = collisions["CRASH DATETIME"].notna().to_numpy()
+    return Model(
+        collisions[happened].reset_index(drop=True),
+        collisions[~happened].reset_index(drop=True),
+        areas,
+    )
+
+
+def sample(model: Model, rows: int, rng: np.random.Generator) -> pd.DataFrame:
+    """
+    Collisions drawn from the processed ones, which keeps the joint
+    distribution of all their columns, including the weather at their hour.
+    Coordinates get a little noise, so points do not pile up on the same
+    spots, and their district is looked up again.
+    """
+    picked = rng.integers(len(model.collisions), size=rows)
+    collisions = model.collisions.iloc[picked].reset_index(drop=True)
+    for column in ("LATITUDE", "LONGITUDE"):
+        collisions[column] += rng.normal(0, JITTER, rows)
+
+    positions = locate.locate(
+        collisions["LONGITUDE"], collisions["LATITUDE"], model.areas
+    )
+    collisions["DISTRICT"] = np.where(positions >= 0, positions, np.nan)
+    located = collisions["LATITUDE"].notna() & collisions["LONGITUDE"].notna()
+    collisions.loc[located, "LOCATION"] = (
+        "["
+        + collisions.loc[located, "LATITUDE"].astype(str)
+        + ", "
+        + collisions.loc[located, "LONGITUDE"].astype(str)
+        + "]"
+    )
+    return collisions
+
+
+def generate(
+    rows: int,
+    data_dir: str,
+    source_dir: str = storage.DATA_DIR,
+    seed: int = SEED,
+    csv: bool = True,
+) -> List[str]:
+    """
+    Write `rows` synthetic collisions drawn from the processed data in
+    `source_dir` to `data_dir`, with the same files and schema, a chunk at a
+    time. The same seed always gives the same data. Weather and maps are
+    copied as they are, the per district counts in the map are the source's
+    (the app counts collisions itself).
+    """
+    map_path = os.path.join(source_dir, f"{geometry.NAME}.geojson")
+    model = fit(storage.read_collisions(data_dir=source_dir), gpd.read_file(map_path))
+    rng = np.random.default_rng(seed)
+    os.makedirs(data_dir, exist_ok=True)
+    csv_path = os.path.join(data_dir, f"{storage.COLLISIONS}.csv")
+    # Partitions of earlier runs, for months this one may not have
+    shutil.rmtree(os.path.join(data_dir, storage.COLLISIONS), ignore_errors=True)
+
+    writers = {}
+    try:
+        for start in range(0, rows, CHUNK_ROWS):
+            collisions = sample(model, min(CHUNK_ROWS, rows - start), rng)
+            if not start:
+                collisions = pd.concat([collisions, model.hours], ignore_index=True)
+            for partition, df in storage.split(collisions):
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if partition not in writers:
+                    path = storage.partition_path(partition, data_dir)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    writers[partition] = pq.ParquetWriter(path, table.schema)
+                writers[partition].write_table(table)
+            if csv:
+                collisions.to_csv(
+                    csv_path, mode="a" if start else "w", header=not start, index=False
+                )
+    finally:
+        for writer in writers.values():
+            writer.close()
+    written = [storage.partition_path(partition, data_dir) for partition in writers]
+    written += [csv_path] if csv else []
+
+    names = [f"{storage.WEATHER}.csv", f"{storage.WEATHER}.parquet"]
+    names += [f"{geometry.NAME}.geojson"]
+    names += [os.path.basename(geometry.path(level)) for level in geometry.LEVELS]
+    for name in names:
+        if os.path.exists(os.path.join(source_dir, name)):
+            shutil.copy(os.path.join(source_dir, name), data_dir)
+            written.append(os.path.join(data_dir, name))
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic processed collisions for load testing."
+    )
+    parser.add_argument("rows", type=int)
+    parser.add_argument(
+        "data_dir", help="run the app where it is ./new-york-collisions/processed-data"
+    )
+    parser.add_argument("--source-dir", default=storage.DATA_DIR)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument(
+        "--no-csv", action="store_true", help="only write Parquet, which the app reads"
+    )
+    args = parser.parse_args()
+    if args.rows < 1:
+        parser.error("rows must be positive")
+    for path in generate(
+        args.rows, args.data_dir, args.source_dir, args.seed, not args.no_csv
+    ):
+        print(path)